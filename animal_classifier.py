@@ -0,0 +1,271 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.models import load_model, Model
+from tensorflow.keras.layers import Input, Rescaling, Resizing, Activation
+from PIL import Image
+
+from image_decode import decode_image, load_image, default_backend
+
+# 配置参数
+model_path = './output/model/best_model.keras'  # 模型路径
+class_names_path = 'class.txt'  # 类别名称文件路径
+img_size = None  # 输入尺寸（None时使用模型自身的输入尺寸，见backbones.py）
+top_k = 3  # 返回的候选类别数量
+
+
+# 定义Lambda层使用的函数
+def cast_to_float32(x):
+    return tf.cast(x, tf.float32)
+
+
+def build_uint8_model(model, img_size=None):
+    """在训练好的模型前加上图内预处理：输入任意尺寸的uint8图片，在图中完成缩放与归一化
+
+    Rescaling会先把uint8转换为float32，再由Resizing用与训练一致的最近邻插值缩放到img_size
+    （None时使用模型自身的输入尺寸）。一个批次内的图片必须尺寸相同，尺寸不一的批量输入需先在主机端缩放。
+    """
+    img_size = tuple(img_size or model.input_shape[1:3])
+    inputs = Input(shape=(None, None, 3), dtype='uint8', name='image_uint8')
+    x = Rescaling(1. / 255, name='rescale')(inputs)
+    x = Resizing(img_size[0], img_size[1], interpolation='nearest', name='resize')(x)
+    outputs = model(x)
+    return Model(inputs=inputs, outputs=outputs, name='animal_classifier_uint8')
+
+
+def unwrap_model(model):
+    """取出uint8推理模型内部的原始模型（未包装的模型原样返回）"""
+    if model.inputs[0].dtype == 'uint8':
+        for layer in model.layers:
+            if isinstance(layer, Model):
+                return layer
+    return model
+
+
+def build_embedding_model(model):
+    """构建同时输出嵌入向量与类别概率的模型
+
+    嵌入取最终softmax分类层的输入，即create_model中512维Dense（经BatchNormalization）之后的特征；
+    最后一层是单独的softmax激活层时（如distill.py的学生模型），取logits层的输入。
+    """
+    head = model.layers[-1]
+    if isinstance(head, Activation):
+        head = model.layers[-2]
+    return Model(inputs=model.inputs, outputs=[head.input, model.output], name=f'{model.name}_embedding')
+
+
+def load_class_names(path):
+    """加载类别名称，文件不存在时返回空列表"""
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return [line.strip() for line in f.readlines()]
+    return []
+
+
+class AnimalClassifier:
+    """动物识别模型的统一推理接口
+
+    predict.py、demo.py和serve.py共用同一套模型加载、预处理和top-k提取逻辑。
+    预处理与训练时的flow_from_directory保持一致：转为RGB后用最近邻插值缩放到img_size，再除以255。
+
+    默认使用uint8输入模式：归一化在计算图中完成，主机端只传uint8数组（比float32小4倍）。
+    限制：只有单张图片按解码后的原始尺寸送入模型、由计算图缩放；批量推理（predict多张、iter_predictions、
+    serve.py的微批）中各图片尺寸不同，无法拼成一个张量，仍在主机端用最近邻缩放到img_size后再拼批，
+    计算图中的Resizing此时是恒等操作。
+    """
+
+    def __init__(self, model_path=model_path, class_names_path=class_names_path, img_size=img_size,
+                 top_k=top_k, decode_workers=4, decode_backend=default_backend, uint8_input=True,
+                 model=None, state_mapping=None):
+        """model给出时直接使用已构建的模型（忽略model_path）；state_mapping为[(变量, 张量), ...]时
+        推理在StatelessScope中进行，变量的值取自这些张量（例如共享内存中的权重，见predict_pool.py）"""
+        self.decode_backend = decode_backend
+        self.top_k = top_k
+        self.class_names = load_class_names(class_names_path)
+        self.state_mapping = state_mapping
+
+        if model is None:
+            custom_objects = {'cast_to_float32': cast_to_float32}
+            model = load_model(model_path, compile=False, custom_objects=custom_objects)
+        # 已导出的uint8模型直接使用，否则在内存中包装一层图内预处理
+        self.exported_uint8 = model.inputs[0].dtype == 'uint8'  # 模型文件本身是否为export_model.py导出的模型
+        self.float_model = unwrap_model(model)  # 接收归一化float32输入的原始模型（分类头扩展等使用）
+        # img_size为None时使用模型自身的输入尺寸（不同主干/分辨率的模型，见backbones.py）
+        self.img_size = tuple(img_size or self.float_model.input_shape[1:3])
+        self.uint8_input = uint8_input or self.exported_uint8
+        if self.uint8_input and model.inputs[0].dtype != 'uint8':
+            model = build_uint8_model(model, self.img_size)
+        self.model = model
+        self._embed_fn = None
+
+        # 固定输入签名：任意批大小（uint8模式下还包括任意图片尺寸）只追踪一次计算图
+        if self.uint8_input:
+            self.input_dtype = np.uint8
+            signature = [tf.TensorSpec(shape=(None, None, None, 3), dtype=tf.uint8)]
+        else:
+            self.input_dtype = np.float32
+            signature = [tf.TensorSpec(shape=(None, self.img_size[0], self.img_size[1], 3), dtype=tf.float32)]
+        self._signature = signature
+        self._predict_fn = tf.function(lambda x: self._run(self.model, x), input_signature=signature)
+        self.decode_workers = decode_workers
+        self.inference_seconds = 0.0  # 累计前向推理耗时与图片数，用于估算单张图片的模型开销
+        self.inference_images = 0
+
+    def _run(self, model, x):
+        if self.state_mapping is None:
+            return model(x, training=False)
+        with tf.keras.StatelessScope(state_mapping=self.state_mapping, initialize_variables=False):
+            return model(x, training=False)
+
+    # ---- 预处理 ----
+
+    def preprocess(self, source, resize=True):
+        """返回模型输入数组 (H, W, 3)
+
+        uint8模式下返回uint8数组（resize=False时保留解码尺寸，由计算图负责缩放），
+        否则返回归一化到[0, 1]的float32数组。
+        路径/字节通过解码层直接解码到接近目标的尺寸（JPEG不再解码全分辨率），
+        已解码的PIL图片或数组则直接缩放。
+        """
+        if isinstance(source, Image.Image):
+            source = np.asarray(source if source.mode == 'RGB' else source.convert('RGB'))
+        if isinstance(source, np.ndarray):
+            array = source.astype(np.uint8, copy=False)
+            if resize and array.shape[:2] != self.img_size:
+                array = np.asarray(Image.fromarray(array).resize(
+                    (self.img_size[1], self.img_size[0]), Image.NEAREST))
+        elif resize or not self.uint8_input:
+            array = load_image(source, self.img_size, self.decode_backend)
+        else:
+            array = decode_image(source, self.img_size, self.decode_backend)
+
+        if self.uint8_input:
+            return array
+        return array.astype(np.float32) / 255.0
+
+    # ---- 推理 ----
+
+    def predict_batch(self, batch):
+        """对已预处理的批次做前向推理，返回概率矩阵 (N, num_classes)"""
+        started = time.perf_counter()
+        probabilities = self._predict_fn(np.asarray(batch, dtype=self.input_dtype)).numpy()
+        self.inference_seconds += time.perf_counter() - started
+        self.inference_images += len(probabilities)
+        return probabilities
+
+    def embed_batch(self, batch):
+        """对已预处理的批次做前向推理，返回(嵌入矩阵 (N, D), 概率矩阵 (N, num_classes))
+
+        嵌入与概率来自同一次前向计算；首次调用时才构建嵌入模型。
+        """
+        if self._embed_fn is None:
+            embedding_model = build_embedding_model(self.float_model)
+            if self.uint8_input:
+                embedding_model = build_uint8_model(embedding_model, self.img_size)
+            self._embed_fn = tf.function(lambda x: self._run(embedding_model, x), input_signature=self._signature)
+        started = time.perf_counter()
+        embeddings, probabilities = self._embed_fn(np.asarray(batch, dtype=self.input_dtype))
+        self.inference_seconds += time.perf_counter() - started
+        self.inference_images += len(probabilities)
+        return embeddings.numpy(), probabilities.numpy()
+
+    def embed(self, images):
+        """对一组图片做预测并提取嵌入，返回(嵌入矩阵, 结果字典列表)"""
+        if len(images) == 1 and self.uint8_input:
+            batch = self.preprocess(images[0], resize=False)[np.newaxis]
+        else:
+            batch = np.stack([self.preprocess(img) for img in images])
+        embeddings, probabilities = self.embed_batch(batch)
+        return embeddings, [self.format_result(p) for p in probabilities]
+
+    def class_name(self, idx):
+        return self.class_names[idx] if idx < len(self.class_names) else str(idx)
+
+    def format_result(self, probabilities, top_k=None):
+        """把单张图片的概率向量整理为结果字典；top_k为None时使用self.top_k"""
+        top_indices = np.argsort(probabilities)[::-1][:top_k or self.top_k]
+        return {
+            'predicted_class': self.class_name(top_indices[0]),
+            'confidence': float(probabilities[top_indices[0]]),
+            'top_k': [(self.class_name(i), float(probabilities[i])) for i in top_indices],
+            'probabilities': probabilities,
+        }
+
+    def predict(self, images):
+        """对一组图片（路径/字节/PIL图片/数组）做预测，返回结果字典列表"""
+        if not images:
+            return []
+        if len(images) == 1 and self.uint8_input:
+            # 单张图片不需要拼批，直接送入原始解码尺寸，由计算图完成缩放
+            batch = self.preprocess(images[0], resize=False)[np.newaxis]
+        else:
+            batch = np.stack([self.preprocess(img) for img in images])
+        return [self.format_result(p) for p in self.predict_batch(batch)]
+
+    def predict_paths(self, paths, batch_size=16):
+        """对图片路径列表做预测，返回与输入顺序一致的(路径, 结果)列表"""
+        return list(self.iter_predictions(paths, batch_size))
+
+    def iter_predictions(self, paths, batch_size=16, prefilter=None):
+        """流式预测：逐个产出(路径, 结果)
+
+        paths中的元素可以是文件路径，也可以是(名称, 字节)二元组（例如压缩包成员，见image_sources.py），
+        后者产出时使用该名称。输入按需读取，可以是生成器。
+        图片解码在线程池中进行，并与上一批的推理重叠；单张图片解码失败时结果为{'error': 信息}，
+        不影响其他图片。
+        传入prefilter（见prefilter.py）时先在解码线程中检查缩略图，被筛掉的图片不解码、不进模型，
+        结果为{'skipped': 原因}。
+        """
+
+        def safe_preprocess(item):
+            source = item[1] if isinstance(item, tuple) else item
+            metrics = None
+            try:
+                if prefilter is not None:
+                    metrics = prefilter.analyze(source)
+                    if metrics['reason'] is not None:
+                        return None, None, metrics
+                return self.preprocess(source), None, metrics
+            except Exception as e:
+                return None, str(e), metrics
+
+        def chunks():
+            chunk = []
+            for path in paths:
+                chunk.append(path)
+                if len(chunk) == batch_size:
+                    yield chunk
+                    chunk = []
+            if chunk:
+                yield chunk
+
+        with ThreadPoolExecutor(max_workers=self.decode_workers) as executor:
+            pending = None
+            for chunk in chunks():
+                # 先提交下一批的解码，再处理上一批，使解码与推理并行
+                submitted = (chunk, [executor.submit(safe_preprocess, p) for p in chunk])
+                if pending is not None:
+                    yield from self._finish_chunk(*pending, prefilter)
+                pending = submitted
+            if pending is not None:
+                yield from self._finish_chunk(*pending, prefilter)
+
+    def _finish_chunk(self, chunk, futures, prefilter=None):
+        names = [item[0] if isinstance(item, tuple) else item for item in chunk]
+        outcomes = []
+        for path, future in zip(names, futures):
+            array, error, metrics = future.result()
+            if prefilter is not None and error is None:
+                # 帧差等依赖前后顺序的判断在这里按输入顺序进行
+                reason = prefilter.decide(path, metrics)
+                if reason is not None:
+                    outcomes.append((None, {'skipped': reason}))
+                    continue
+            outcomes.append((array, {'error': error} if error is not None else None))
+
+        arrays = [array for array, result in outcomes if result is None]
+        probabilities = iter(self.predict_batch(np.stack(arrays))) if arrays else iter(())
+        for path, (array, result) in zip(names, outcomes):
+            yield path, result if result is not None else self.format_result(next(probabilities))
@@ -0,0 +1,190 @@
+import time
+import random
+import tkinter as tk
+
+
+class AnimationEngine:
+    """统一的动画调度器
+
+    所有背景粒子都是同一块共享画布上的图形项，由一个帧定时器统一驱动；
+    浮动和淡出效果也在同一帧中处理，整个应用只保留一个after回调。
+    通过活动对象上限和帧预算自动降级：当界面繁忙（例如模型推理）时
+    降低帧率、减少粒子数量，必要时暂停生成新粒子。
+    """
+
+    def __init__(self, root, parent, bg, particle_color, frame_interval=33, spawn_interval=500,
+                 spawn_probability=0.7, max_particles=40, frame_budget=8.0, max_level=3):
+        self.root = root
+        self.particle_color = particle_color
+        self.base_interval = frame_interval  # 基础帧间隔(ms)
+        self.spawn_interval = spawn_interval / 1000.0  # 粒子生成间隔(s)
+        self.spawn_probability = spawn_probability
+        self.max_particles = max_particles  # 活动粒子上限
+        self.frame_budget = frame_budget  # 每帧允许的处理时间(ms)
+        self.max_level = max_level  # 最高降级等级（该等级下不再生成粒子）
+
+        # 共享画布放在父容器最底层，作为背景层
+        self.canvas = tk.Canvas(parent, bg=bg, highlightthickness=0)
+        self.canvas.place(x=0, y=0, relwidth=1, relheight=1)
+        # Canvas.lower被重载为tag_lower，这里调用Tk的控件层级命令
+        self.canvas.tk.call('lower', self.canvas._w)
+
+        self.particles = []  # [图形项id, y坐标, 速度(px/s)]
+        self.floaters = []  # [控件, x, y, 上升速度(px/s), 水平漂移(px/s)]
+        self.fading = []  # 正在淡出的顶层窗口
+
+        self.level = 0  # 当前降级等级
+        self.busy = 0  # 繁忙计数（推理等耗时任务进行中）
+        self.overloaded_frames = 0
+        self.good_frames = 0
+        self.last_tick = None
+        self.last_spawn = 0.0
+        self.after_id = None
+
+    # ---- 外部接口 ----
+
+    def start(self):
+        """启动帧定时器（重复调用无副作用）"""
+        if self.after_id is None:
+            self.last_tick = time.perf_counter()
+            self.after_id = self.root.after(self.interval, self._tick)
+
+    def stop(self):
+        """停止帧定时器"""
+        if self.after_id is not None:
+            self.root.after_cancel(self.after_id)
+            self.after_id = None
+
+    def set_busy(self, busy):
+        """标记应用是否正忙，繁忙期间动画直接降级"""
+        self.busy = self.busy + 1 if busy else max(0, self.busy - 1)
+
+    def add_floater(self, widget, x, y, speed, drift):
+        """添加一个向上浮动的控件，飘出顶部后淡出（速度单位与原30ms一帧的实现一致）"""
+        self.floaters.append([widget, x, y, speed * 1000 / 30, drift * 1000 / 30])
+        self.start()
+
+    def fade_out(self, widget):
+        """淡出并销毁控件；只有顶层窗口支持透明度，其他控件直接销毁"""
+        try:
+            widget.attributes("-alpha")
+        except (AttributeError, tk.TclError):
+            widget.destroy()
+            return
+        self.fading.append(widget)
+        self.start()
+
+    @property
+    def interval(self):
+        """当前帧间隔：降级等级越高帧率越低"""
+        return self.base_interval * (1 + self.effective_level)
+
+    @property
+    def effective_level(self):
+        return min(self.max_level, self.level + (2 if self.busy else 0))
+
+    @property
+    def particle_cap(self):
+        """当前允许的活动粒子数量"""
+        if self.effective_level >= self.max_level:
+            return 0
+        return self.max_particles >> self.effective_level
+
+    # ---- 帧处理 ----
+
+    def _tick(self):
+        self.after_id = None
+        if not self.canvas.winfo_exists():
+            return
+
+        start = time.perf_counter()
+        dt = start - self.last_tick
+        lateness = dt * 1000 - self.interval  # 事件循环被占用导致的延迟
+        self.last_tick = start
+
+        self._update_particles(dt)
+        self._spawn_particles(start)
+        self._update_floaters(dt)
+        self._update_fading()
+
+        work_ms = (time.perf_counter() - start) * 1000
+        self._adapt(work_ms, lateness)
+        self.after_id = self.root.after(self.interval, self._tick)
+
+    def _update_particles(self, dt):
+        cap = self.particle_cap
+        alive = []
+        for particle in self.particles:
+            item, y, speed = particle
+            dy = speed * dt
+            y -= dy
+            # 超出顶部或超过当前上限的粒子直接移除
+            if y <= -10 or len(alive) >= cap:
+                self.canvas.delete(item)
+                continue
+            self.canvas.move(item, 0, -dy)
+            particle[1] = y
+            alive.append(particle)
+        self.particles = alive
+
+    def _spawn_particles(self, now):
+        if now - self.last_spawn < self.spawn_interval:
+            return
+        self.last_spawn = now
+        if len(self.particles) >= self.particle_cap or random.random() >= self.spawn_probability:
+            return
+        width = max(self.canvas.winfo_width(), 1)
+        height = max(self.canvas.winfo_height(), 1)
+        size = random.randint(2, 4)
+        x = random.randint(0, width)
+        y = random.randint(0, height)
+        item = self.canvas.create_oval(x, y, x + size, y + size, fill=self.particle_color, outline="")
+        # 原实现每50ms上移0.5~2像素
+        speed = random.uniform(0.5, 2) * 20
+        self.particles.append([item, y, speed])
+
+    def _update_floaters(self, dt):
+        alive = []
+        for floater in self.floaters:
+            widget, x, y, speed, drift = floater
+            if not widget.winfo_exists():
+                continue
+            if y <= -50:
+                self.fade_out(widget)
+                continue
+            floater[1] = x + drift * dt
+            floater[2] = y - speed * dt
+            widget.place(x=floater[1], y=floater[2])
+            alive.append(floater)
+        self.floaters = alive
+
+    def _update_fading(self):
+        alive = []
+        for widget in self.fading:
+            if not widget.winfo_exists():
+                continue
+            try:
+                alpha = widget.attributes("-alpha")
+                if alpha > 0:
+                    widget.attributes("-alpha", max(0.0, alpha - 0.1))
+                    alive.append(widget)
+                else:
+                    widget.destroy()
+            except tk.TclError:
+                widget.destroy()
+        self.fading = alive
+
+    def _adapt(self, work_ms, lateness):
+        """根据帧处理时间和事件循环延迟调整降级等级（带迟滞，避免来回抖动）"""
+        if work_ms > self.frame_budget or lateness > self.interval:
+            self.overloaded_frames += 1
+            self.good_frames = 0
+            if self.overloaded_frames >= 3 and self.level < self.max_level:
+                self.level += 1
+                self.overloaded_frames = 0
+        else:
+            self.overloaded_frames = 0
+            self.good_frames += 1
+            if self.good_frames >= 60 and self.level > 0:
+                self.level -= 1
+                self.good_frames = 0
@@ -0,0 +1,126 @@
+import os
+import csv
+import argparse
+from datetime import datetime
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.optimizers import Adam
+from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint
+
+from animal_classifier import AnimalClassifier, load_class_names
+from backbones import build_classifier, get_backbone
+from distill import make_dataset
+from model_report import list_dataset, sample_per_class, evaluate, measure_latency, model_size
+from progress_store import atomic_write_json
+
+# 配置参数
+data_dir = '/kaggle/input/animals/Animal/Animal'  # 数据集路径（与train.py相同）
+class_names_path = 'class.txt'
+output_dir = './output/sweep'  # 各主干模型与对比表的保存目录
+sweep_backbones = ('mobilenetv3small', 'mobilenetv3large', 'efficientnetb0', 'efficientnetb2', 'resnet50')
+freeze_fraction = 0.3  # 与train.py相同的相对冻结深度
+epochs = 5  # 每个主干的训练轮数（快速对比，不追求最终精度）
+batch_size = 16
+learning_rate = 1e-4
+eval_per_class = 20  # 评估时每类最多使用的验证图片数（None为全部）
+
+
+def parse_entry(entry):
+    """'name' 或 'name:尺寸' -> (主干名, 输入尺寸)"""
+    name, _, size = entry.partition(':')
+    spec = get_backbone(name)
+    size = int(size) if size else spec['img_size']
+    return name.lower(), (size, size)
+
+
+def train_backbone(name, img_size, model_path, class_names, data_dir=data_dir, epochs=epochs):
+    """用统一的短训练设置训练一个主干，最佳权重保存到model_path"""
+    train_paths, train_labels = list_dataset(data_dir, class_names, 'training')
+    val_paths, val_labels = list_dataset(data_dir, class_names, 'validation')
+    eye = np.eye(len(class_names), dtype=np.float32)
+    train_set = make_dataset(train_paths, eye[train_labels], img_size, batch_size)
+    val_set = make_dataset(val_paths, eye[val_labels], img_size, batch_size, training=False)
+
+    model = build_classifier(len(class_names), name, img_size, freeze_fraction)
+    model.compile(optimizer=Adam(learning_rate=learning_rate), loss='categorical_crossentropy', metrics=['accuracy'])
+    model.fit(train_set, validation_data=val_set, epochs=epochs, verbose=1,
+              callbacks=[EarlyStopping(monitor='val_loss', patience=2, restore_best_weights=True),
+                         ModelCheckpoint(model_path, monitor='val_loss', save_best_only=True)])
+
+
+def pareto_front(rows):
+    """标出帕累托最优的行：不存在另一行在准确率、吞吐量上都不差、参数量不多且至少一项更好"""
+
+    def dominates(a, b):
+        no_worse = (a['accuracy'] >= b['accuracy'] and a['throughput_ips'] >= b['throughput_ips']
+                    and a['params'] <= b['params'])
+        better = (a['accuracy'] > b['accuracy'] or a['throughput_ips'] > b['throughput_ips']
+                  or a['params'] < b['params'])
+        return no_worse and better
+
+    for row in rows:
+        row['pareto'] = not any(dominates(other, row) for other in rows if other is not row)
+    return rows
+
+
+def print_table(rows):
+    print(f"{'模型':<24}{'输入':>6}{'准确率':>10}{'吞吐量(张/秒)':>16}{'单张延迟(ms)':>14}{'参数量(M)':>12}{'帕累托':>8}")
+    for row in sorted(rows, key=lambda r: -r['throughput_ips']):
+        print(f"{row['name']:<24}{row['img_size']:>6}{row['accuracy']:>10.4f}{row['throughput_ips']:>16.2f}"
+              f"{row['latency_ms']:>14.2f}{row['params'] / 1e6:>12.2f}{'*' if row['pareto'] else '':>8}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="训练/评估多个主干，输出准确率-CPU吞吐量-参数量的帕累托对比表")
+    parser.add_argument('--backbones', nargs='*', default=list(sweep_backbones),
+                        help="要训练并对比的主干，可写作 name 或 name:输入尺寸")
+    parser.add_argument('--models', nargs='*', default=[],
+                        help="直接评估已有模型，写作 名称=模型路径（如 b6=./output/model/best_model.keras）")
+    parser.add_argument('--data-dir', default=data_dir, help="数据集路径")
+    parser.add_argument('--output-dir', default=output_dir, help="模型与对比表保存目录")
+    parser.add_argument('--epochs', type=int, default=epochs, help="每个主干的训练轮数")
+    parser.add_argument('--retrain', action='store_true', help="已有同名模型时也重新训练")
+    parser.add_argument('--eval-per-class', type=int, default=eval_per_class, help="每类最多评估的验证图片数")
+    args = parser.parse_args()
+
+    class_names = load_class_names(class_names_path)
+    os.makedirs(args.output_dir, exist_ok=True)
+    candidates = []  # (名称, 模型路径)
+    for entry in args.backbones:
+        name, img_size = parse_entry(entry)
+        model_path = os.path.join(args.output_dir, f'{name}_{img_size[0]}.keras')
+        if args.retrain or not os.path.exists(model_path):
+            print(f"\n===== 训练 {name} @ {img_size[0]} =====")
+            train_backbone(name, img_size, model_path, class_names, args.data_dir, args.epochs)
+        candidates.append((f'{name}_{img_size[0]}', model_path))
+    for entry in args.models:
+        name, _, path = entry.partition('=')
+        candidates.append((name, path))
+
+    val_paths, val_labels = list_dataset(args.data_dir, class_names, 'validation')
+    val_paths, val_labels = sample_per_class(val_paths, val_labels, args.eval_per_class)
+    rows = []
+    for name, path in candidates:
+        print(f"\n正在评估 {name}（CPU）...")
+        with tf.device('/CPU:0'):
+            classifier = AnimalClassifier(path, class_names_path, img_size=None)
+            metrics = evaluate(classifier, val_paths, val_labels)
+            metrics.update(measure_latency(classifier))
+            metrics.update(model_size(path, classifier.float_model))
+        rows.append({'name': name, 'model': path, 'img_size': classifier.img_size[0],
+                     'accuracy': metrics['accuracy'], 'throughput_ips': metrics['throughput_ips'],
+                     'latency_ms': metrics['latency_ms'], 'params': metrics['params'], 'file_mb': metrics['file_mb']})
+        del classifier
+
+    pareto_front(rows)
+    print(f"\n主干对比（验证集 {len(val_paths)} 张，CPU，*为帕累托最优）:")
+    print_table(rows)
+
+    table_path = os.path.join(args.output_dir, 'sweep_results.csv')
+    with open(table_path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+    atomic_write_json(os.path.join(args.output_dir, 'sweep_results.json'),
+                      {'created': datetime.now().isoformat(), 'val_samples': len(val_paths), 'results': rows})
+    print(f"对比表已保存至: {table_path}")
@@ -0,0 +1,128 @@
+import re
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras import Input, Model
+from tensorflow.keras.layers import (Dense, GlobalAveragePooling2D, Dropout, BatchNormalization, Lambda, Rescaling,
+                                     Conv2D)
+from tensorflow.keras.regularizers import l2
+
+from animal_classifier import cast_to_float32
+
+# 可选主干：keras.applications中的构造函数名、推荐输入尺寸、输入预处理方式、划分block的层名规则、
+# 适合做幅值剪枝的末段层名前缀（参数最多、对精度影响较小，见optimize_model.py）
+# 预处理方式：raw255 - 主干自带归一化，输入0-255；caffe - BGR通道顺序并减去ImageNet均值
+BACKBONES = {
+    f'efficientnetb{i}': {'builder': f'EfficientNetB{i}', 'img_size': size, 'preprocessing': 'raw255',
+                          'block': r'^(block\d+[a-z])_', 'prune': ('block6', 'block7', 'top_conv')}
+    for i, size in enumerate((224, 240, 260, 300, 380, 456, 528, 600))
+}
+BACKBONES.update({
+    'mobilenetv3small': {'builder': 'MobileNetV3Small', 'img_size': 224, 'preprocessing': 'raw255',
+                         'block': r'^(expanded_conv(?:_\d+)?)_',
+                         'prune': ('expanded_conv_9_', 'expanded_conv_10_', 'conv_1')},
+    'mobilenetv3large': {'builder': 'MobileNetV3Large', 'img_size': 224, 'preprocessing': 'raw255',
+                         'block': r'^(expanded_conv(?:_\d+)?)_',
+                         'prune': ('expanded_conv_13_', 'expanded_conv_14_', 'conv_1')},
+    'resnet50': {'builder': 'ResNet50', 'img_size': 224, 'preprocessing': 'caffe', 'block': r'^(conv\d+_block\d+)_',
+                 'prune': ('conv5_block',)},
+})
+imagenet_bgr_mean = (103.939, 116.779, 123.68)
+
+
+def get_backbone(name):
+    """返回主干配置，名称不区分大小写"""
+    key = name.lower()
+    if key not in BACKBONES:
+        raise ValueError(f"不支持的主干: {name}（可选: {', '.join(BACKBONES)}）")
+    return BACKBONES[key]
+
+
+def input_adapter(x, preprocessing):
+    """把[0, 1]的输入图片（与flow_from_directory的rescale=1./255一致）转换为主干期望的输入"""
+    if preprocessing == 'raw255':
+        return Rescaling(255.0, name='to_255')(x)
+    if preprocessing == 'caffe':
+        # 固定权重的1x1卷积：RGB->BGR、乘255并减去均值，只用标准层，保存/加载不需要自定义对象
+        adapter = Conv2D(3, 1, trainable=False, name='caffe_preprocess')
+        x = adapter(x)
+        kernel = np.zeros((1, 1, 3, 3), dtype=np.float32)
+        for channel in range(3):
+            kernel[0, 0, channel, 2 - channel] = 255.0
+        adapter.set_weights([kernel, -np.asarray(imagenet_bgr_mean, dtype=np.float32)])
+        return x
+    raise ValueError(f"未知的预处理方式: {preprocessing}")
+
+
+def build_backbone(name, img_size=None, weights='imagenet'):
+    """构建主干，返回(输入, 主干特征图, 主干模型)
+
+    通过input_tensor把输入预处理层与主干连成一张扁平的计算图，主干的层直接出现在完整模型的layers中
+    （按层冻结、optimize_model.py按层名剪枝都不需要展开嵌套模型）。
+    """
+    spec = get_backbone(name)
+    img_size = tuple(img_size or (spec['img_size'], spec['img_size']))
+    inputs = Input(shape=(img_size[0], img_size[1], 3), name='image')
+    x = input_adapter(inputs, spec['preprocessing'])
+    builder = getattr(tf.keras.applications, spec['builder'])
+    if spec['preprocessing'] != 'caffe':
+        base_model = builder(include_top=False, weights=weights, input_tensor=x,
+                             input_shape=(img_size[0], img_size[1], 3))
+        return inputs, base_model.output, base_model
+
+    # caffe_preprocess带权重，会使按层顺序加载预训练权重时层数对不上：
+    # 先单独构建一个带预训练权重的主干，再按层名把权重复制到扁平图中
+    base_model = builder(include_top=False, weights=None, input_tensor=x, input_shape=(img_size[0], img_size[1], 3))
+    if weights is not None:
+        reference = builder(include_top=False, weights=weights, input_shape=(img_size[0], img_size[1], 3))
+        for layer in reference.layers:
+            if layer.weights:
+                base_model.get_layer(layer.name).set_weights(layer.get_weights())
+        del reference
+    return inputs, base_model.output, base_model
+
+
+def freeze_backbone(base_model, name, fraction):
+    """按相对深度冻结主干：冻结前fraction比例的层，并向后对齐到完整的block边界
+
+    fraction=0表示全部可训练，1表示整个主干冻结；同一比例在不同结构上对应相近的相对深度
+    （EfficientNetB6时0.3约等于原来固定冻结的前200层）。返回被冻结的层数。
+    """
+    pattern = re.compile(get_backbone(name)['block'])
+    layers = base_model.layers
+    base_model.trainable = True
+    cut = min(len(layers), int(round(len(layers) * max(0.0, fraction))))
+    if 0 < cut < len(layers):
+        # 不把一个block切成两半：继续冻结到当前block结束
+        match = pattern.match(layers[cut - 1].name)
+        block = match.group(1) if match else None
+        while cut < len(layers) and block is not None:
+            match = pattern.match(layers[cut].name)
+            if not match or match.group(1) != block:
+                break
+            cut += 1
+    for layer in layers[:cut]:
+        layer.trainable = False
+    for layer in layers:
+        if layer.name == 'caffe_preprocess':
+            layer.trainable = False  # base_model.trainable = True会把固定的预处理层也打开
+    return cut
+
+
+def build_classifier(num_classes, backbone='efficientnetb6', img_size=None, freeze_fraction=0.3, l2_reg=1e-4,
+                     dropout_rate=0.3, weights='imagenet'):
+    """主干 + train.py的分类头（GAP -> Dense1024 -> Dense512 -> softmax），返回未编译的模型"""
+    inputs, features, base_model = build_backbone(backbone, img_size, weights)
+    frozen = freeze_backbone(base_model, backbone, freeze_fraction)
+
+    x = GlobalAveragePooling2D()(features)
+    x = Dense(1024, activation='relu', kernel_regularizer=l2(l2_reg))(x)
+    x = BatchNormalization()(x)
+    x = Dropout(dropout_rate)(x)
+    x = Dense(512, activation='relu', kernel_regularizer=l2(l2_reg))(x)
+    x = BatchNormalization()(x)
+    x = Dropout(dropout_rate / 2)(x)
+    x = Lambda(cast_to_float32, name='cast_to_float32')(x)
+    predictions = Dense(num_classes, activation='softmax', dtype=tf.float32)(x)
+    model = Model(inputs=inputs, outputs=predictions, name=f'{backbone}_classifier')
+    print(f"主干 {backbone}，输入 {model.input_shape[1:3]}，冻结 {frozen}/{len(base_model.layers)} 层")
+    return model
@@ -1,24 +1,23 @@
 import os
-import numpy as np
-import tensorflow as tf
-from tensorflow.keras.preprocessing import image
-from tensorflow.keras.models import load_model
-import pandas as pd
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
-from PIL import Image, ImageTk, ImageOps, ImageFilter, ImageDraw, ImageFont
+from tkinter import ttk, filedialog, messagebox, simpledialog
+from PIL import Image, ImageTk, ImageDraw, ImageFont
 import random
-import json
 import threading
 import time
-import math
 from datetime import datetime
+from zoo_icon_cache import ZooIconCache, add_rounded_corners
+from quiz_image_bank import QuizImageBank
+from animation import AnimationEngine
+from progress_db import SQLiteProgressStore, migrate_json
+from animal_classifier import AnimalClassifier
+from embeddings import SimilarityIndex
 
 # 禁用GPU（确保使用CPU）
 os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
 
 class AnimalRecognitionApp:
-    def __init__(self, root):
+    def __init__(self, root, profile='default', db_path='progress.db'):
         self.root = root
         self.root.title("动物世界探索家")
         self.root.geometry("1100x750")
@@ -34,10 +33,21 @@ class AnimalRecognitionApp:
         self.model_path = './output/model/best_model.keras'
         self.image_dir = 'test'
         self.class_names_path = 'class.txt'
-        self.img_size = (456, 456)
+        self.img_size = None  # None时使用模型自身的输入尺寸
         self.zoo_icons_dir = 'zoo_icons'  # 动物图标目录
         self.animal_images_dir = 'Animal'  # 动物图片目录
         self.bg_patterns_dir = 'bg_patterns'  # 背景图案目录
+        self.cache_dir = 'cache'  # 预处理资源缓存目录
+        self.embeddings_dir = './output/embeddings'  # 相似图片索引目录（由embeddings.py构建）
+        self.num_similar = 6  # 识别结果旁展示的相似图片数
+        
+        # 图鉴图标缓存（预处理好的解锁/未解锁图标 + PhotoImage对象）
+        self.zoo_icon_cache = ZooIconCache(self.zoo_icons_dir, os.path.join(self.cache_dir, 'zoo_icons'))
+        self.placeholder_photos = {}  # (动物, 是否解锁) -> PhotoImage
+        
+        # 小游戏图片库（图片索引 + 预缩放图片 + 下一题预取）
+        self.quiz_image_bank = QuizImageBank(self.animal_images_dir, os.path.join(self.cache_dir, 'quiz'))
+        self.next_question_image = None  # 下一题图片的预取Future
         
         # 动物分类
         self.land_animals = [
@@ -70,15 +80,6 @@ class AnimalRecognitionApp:
         self.current_image_path = None
         self.processed_img = None  # 处理后的图片
         
-        # 用户统计
-        self.user_stats = {
-            "total_recognitions": 0,
-            "correct_guesses": 0,
-            "animals_unlocked": 0,
-            "last_played": None
-        }
-        self.load_user_stats()
-        
         # 创建样式
         self.setup_styles()
         
@@ -86,15 +87,24 @@ class AnimalRecognitionApp:
         self.main_frame = ttk.Frame(self.root, style="Main.TFrame")
         self.main_frame.pack(fill=tk.BOTH, expand=True, padx=10, pady=10)
         
+        # 统一的动画调度器（所有粒子绘制在主框架底层的共享画布上）
+        self.animation = AnimationEngine(self.root, self.main_frame, self.colors['background'],
+                                         self.colors['primary_light'])
+        
         # 底部状态栏 - 先创建状态栏
         self.status_bar = ttk.Label(self.root, text="就绪", relief=tk.SUNKEN, anchor=tk.W, style="Status.TLabel")
         self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
         
-        # 已解锁的动物集合 - 现在再加载已解锁动物
-        self.unlocked_animals = set()
-        self.load_unlocked_animals()  # 加载已解锁动物
+        # 用户进度（SQLite多用户存储）- 每个操作一个小事务，由后台线程写入
+        self.progress = SQLiteProgressStore(db_path, profile)
+        if migrate_json(self.progress):
+            self.update_status("已将旧版JSON进度导入数据库")
+        self.unlocked_animals = self.progress.unlocked
+        self.user_stats = self.progress.stats
+        self.update_status(f"用户 {self.progress.profile}: 已加载 {len(self.unlocked_animals)} 个已解锁动物")
         
         # 加载模型
+        self.classifier = None
         self.model = None
         self.model_loaded = False  # 模型是否已加载的标志
         self.load_model()
@@ -109,6 +119,14 @@ class AnimalRecognitionApp:
         # 更新状态栏
         self.update_status("应用已启动，欢迎使用动物世界探索家！")
         
+        # 后台预处理图鉴图标，首次进入图鉴时无需等待
+        threading.Thread(target=self.zoo_icon_cache.build_all, args=(self.class_names or None,), daemon=True).start()
+        # 后台增量刷新小游戏图片索引
+        threading.Thread(target=self.quiz_image_bank.refresh, args=(self.class_names or None,), daemon=True).start()
+        # 后台加载相似图片索引（内存映射，未构建时跳过）
+        self.similarity_index = None
+        threading.Thread(target=self.load_similarity_index, daemon=True).start()
+        
         # 启动背景动画
         self.animate_particles()
     
@@ -266,13 +284,32 @@ class AnimalRecognitionApp:
         stats_shadow = ttk.Frame(self.main_frame, style="Shadow.TFrame")
         stats_shadow.pack(pady=(0, 20), padx=102, fill=tk.X, ipady=2)
         
-        stats_text = f"已解锁动物: {len(self.unlocked_animals)}/{len(self.class_names)} | " \
+        stats_text = f"当前用户: {self.progress.profile} | " \
+                    f"已解锁动物: {len(self.unlocked_animals)}/{len(self.class_names)} | " \
                     f"识别次数: {self.user_stats['total_recognitions']} | " \
                     f"游戏得分: {self.user_stats['correct_guesses']}"
         
         stats_label = ttk.Label(stats_frame, text=stats_text, font=("Segoe UI", 11), background=self.colors['card'])
         stats_label.pack()
         
+        switch_btn = ttk.Button(stats_frame, text="👤 切换用户", command=self.switch_profile, style="Normal.TButton")
+        switch_btn.pack(pady=(10, 0))
+        
+        # 游戏得分排行榜（前5名）：在进度写线程中查询，界面线程不等待SQLite写入
+        leaderboard_label = ttk.Label(stats_frame, font=("Segoe UI", 10),
+                                      foreground=self.colors['text_light'], background=self.colors['card'])
+        
+        def show_leaderboard(leaders):
+            if leaders and leaderboard_label.winfo_exists():
+                leaderboard_label.config(text="🏆 排行榜: " + " | ".join(
+                    f"{rank}. {name} {score}分" for rank, (name, score) in enumerate(leaders, 1)))
+                leaderboard_label.pack(pady=(5, 0), before=switch_btn)
+        
+        self.progress.leaderboard_async(lambda leaders: self.root.after(0, lambda: show_leaderboard(leaders)),
+                                        'correct_guesses', limit=5)
+        switch_btn.bind("<Enter>", lambda e, b=switch_btn: b.config(style="Normal.Hover.TButton"))
+        switch_btn.bind("<Leave>", lambda e, b=switch_btn: b.config(style="Normal.TButton"))
+        
         # 创建功能选择按钮区域，使用更现代的卡片布局
         buttons_card = ttk.Frame(self.main_frame, style="Card.TFrame", padding=30)
         buttons_card.pack(pady=30, padx=100, fill=tk.X)
@@ -352,62 +389,19 @@ class AnimalRecognitionApp:
     
     def float_animation(self, label, x, y, speed, drift):
         """浮动动画效果 - 更自然的轨迹"""
-        if y > -50 and label.winfo_exists():
-            y -= speed  # 上移速度
-            x += drift  # 水平漂移
-            label.place(x=x, y=y)
-            self.root.after(30, lambda: self.float_animation(label, x, y, speed, drift))
-        else:
-            if label.winfo_exists():
-                # 淡出效果
-                self.fade_out(label)
+        self.animation.add_floater(label, x, y, speed, drift)
     
     def fade_out(self, widget):
         """控件淡出效果"""
-        if widget.winfo_exists():
-            try:
-                # 获取当前透明度
-                alpha = widget.attributes("-alpha")
-                if alpha > 0:
-                    widget.attributes("-alpha", alpha - 0.1)
-                    self.root.after(30, lambda: self.fade_out(widget))
-                else:
-                    widget.destroy()
-            except:
-                # 某些平台可能不支持透明度
-                widget.destroy()
+        self.animation.fade_out(widget)
     
     def animate_particles(self):
         """添加背景粒子动画，增强深度感"""
-        if hasattr(self, 'main_frame') and self.main_frame.winfo_children():
-            # 创建小粒子
-            if random.random() < 0.7:  # 70%的概率添加粒子
-                size = random.randint(2, 4)
-                x = random.randint(0, 1000)
-                y = random.randint(0, 700)
-                
-                # 创建一个小圆点作为粒子
-                canvas = tk.Canvas(self.main_frame, width=size, height=size, 
-                                  bg=self.colors['background'], highlightthickness=0)
-                canvas.create_oval(0, 0, size, size, fill=self.colors['primary_light'], outline="")
-                canvas.place(x=x, y=y)
-                
-                # 粒子动画
-                speed = random.uniform(0.5, 2)
-                self.particle_animation(canvas, x, y, speed)
-        
-        # 继续动画循环
-        self.root.after(500, self.animate_particles)
+        self.animation.start()
     
-    def particle_animation(self, canvas, x, y, speed):
-        """粒子动画效果"""
-        if y > -10 and canvas.winfo_exists():
-            y -= speed
-            canvas.place(x=x, y=y)
-            self.root.after(50, lambda: self.particle_animation(canvas, x, y, speed))
-        else:
-            if canvas.winfo_exists():
-                canvas.destroy()
+    def content_widgets(self):
+        """返回主框架中的页面控件（不包括动画背景画布）"""
+        return [w for w in self.main_frame.winfo_children() if w is not self.animation.canvas]
     
     def update_status(self, message):
         """更新状态栏消息"""
@@ -435,19 +429,37 @@ class AnimalRecognitionApp:
         """加载预训练模型"""
         self.update_status("正在加载模型...")
         try:
-            # 定义Lambda层使用的函数
-            def cast_to_float32(x):
-                return tf.cast(x, tf.float32)
-                
-            custom_objects = {'cast_to_float32': cast_to_float32}
-            self.model = load_model(self.model_path, compile=False, custom_objects=custom_objects)
-            self.model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
+            self.classifier = AnimalClassifier(self.model_path, self.class_names_path, self.img_size, top_k=3)
+            self.model = self.classifier.model
             self.model_loaded = True
             self.update_status("模型加载成功！")
         except Exception as e:
             self.update_status(f"模型加载失败: {str(e)}")
             messagebox.showerror("错误", f"模型加载失败: {str(e)}")
     
+    def load_similarity_index(self):
+        """加载相似图片索引，索引不存在时只做普通识别"""
+        if not os.path.exists(os.path.join(self.embeddings_dir, 'meta.json')):
+            return
+        try:
+            self.similarity_index = SimilarityIndex(self.embeddings_dir)
+        except Exception as e:
+            print(f"相似图片索引加载失败: {e}")
+
+    def load_similar_thumbnails(self, similar, size=(96, 96)):
+        """在后台线程中读取相似图片的缩略图，返回[(PIL图片, 类别, 相似度), ...]"""
+        thumbnails = []
+        for path, score, label in similar:
+            try:
+                with Image.open(path) as img:
+                    img.draft('RGB', size)
+                    img = self.process_image_channels(img)
+                    img.thumbnail(size)
+                    thumbnails.append((img.copy(), label, score))
+            except Exception:
+                continue
+        return thumbnails
+
     def load_class_names(self):
         """加载类别名称"""
         if os.path.exists(self.class_names_path):
@@ -457,49 +469,32 @@ class AnimalRecognitionApp:
         else:
             messagebox.showerror("错误", "未找到类别名称文件")
     
-    def load_unlocked_animals(self):
-        """加载已解锁的动物"""
-        try:
-            if os.path.exists('unlocked_animals.json'):
-                with open('unlocked_animals.json', 'r') as f:
-                    self.unlocked_animals = set(json.load(f))
-                self.update_status(f"已加载 {len(self.unlocked_animals)} 个已解锁动物")
-        except Exception as e:
-            self.update_status(f"加载已解锁动物失败: {str(e)}")
-            self.unlocked_animals = set()
+    def unlock_animal(self, animal):
+        """解锁动物，返回是否为新解锁（线程安全，不阻塞磁盘写入）"""
+        return self.progress.unlock(animal)
     
-    def save_unlocked_animals(self):
-        """保存已解锁的动物"""
-        try:
-            with open('unlocked_animals.json', 'w') as f:
-                json.dump(list(self.unlocked_animals), f)
-            self.update_status(f"已保存 {len(self.unlocked_animals)} 个已解锁动物")
-        except Exception as e:
-            self.update_status(f"保存已解锁动物失败: {str(e)}")
+    def switch_profile(self):
+        """切换当前用户（不存在则自动创建）"""
+        name = simpledialog.askstring("切换用户", "请输入用户名:", initialvalue=self.progress.profile,
+                                      parent=self.root)
+        if not name or not name.strip():
+            return
+        self.update_status(f"正在切换到用户 {name.strip()}...")
+        self.progress.switch_profile_async(name.strip(), lambda: self.root.after(0, self.on_profile_switched))
     
-    def load_user_stats(self):
-        """加载用户统计信息"""
-        try:
-            if os.path.exists('user_stats.json'):
-                with open('user_stats.json', 'r') as f:
-                    self.user_stats = json.load(f)
-        except Exception as e:
-            self.update_status(f"加载用户统计失败: {str(e)}")
+    def on_profile_switched(self):
+        self.update_status(f"已切换到用户 {self.progress.profile}")
+        self.clear_frame()
+        self.create_main_ui()
     
-    def save_user_stats(self):
-        """保存用户统计信息"""
-        try:
-            self.user_stats["animals_unlocked"] = len(self.unlocked_animals)
-            self.user_stats["last_played"] = datetime.now().isoformat()
-            
-            with open('user_stats.json', 'w') as f:
-                json.dump(self.user_stats, f)
-        except Exception as e:
-            self.update_status(f"保存用户统计失败: {str(e)}")
+    def on_close(self):
+        """关闭窗口前写入未保存的用户进度"""
+        self.progress.close()
+        self.root.destroy()
     
     def clear_frame(self):
         """清除当前页面 - 添加淡出动画效果"""
-        for widget in self.main_frame.winfo_children():
+        for widget in self.content_widgets():
             try:
                 # 尝试添加淡出效果
                 self.fade_out(widget)
@@ -621,6 +616,10 @@ class AnimalRecognitionApp:
         self.result_text.tag_configure("highlight", font=("Segoe UI", 12, "bold"), foreground=self.colors['danger'])
         self.result_text.tag_configure("unlock", font=("Segoe UI", 11, "italic"), foreground="#2ecc71")
         
+        # 相似图片区域（识别完成且有相似图片索引时才显示）
+        self.similar_frame = ttk.Frame(result_frame, style="White.TFrame")
+        self.similar_photos = []
+        
         # 进度条框架
         self.progress_frame = ttk.Frame(right_frame)
         self.progress_frame.pack(fill=tk.X, pady=(10, 0))
@@ -652,7 +651,7 @@ class AnimalRecognitionApp:
             # 显示图片 - 添加淡入效果
             display_img = img.copy()
             # 添加圆角边框效果
-            display_img = self.add_rounded_corners(display_img, 20)
+            display_img = add_rounded_corners(display_img, 20)
             display_img.thumbnail((450, 350))  # 调整显示尺寸
             photo = ImageTk.PhotoImage(display_img)
             
@@ -674,27 +673,6 @@ class AnimalRecognitionApp:
             self.processed_img = None
             self.start_recognition_btn.config(state=tk.DISABLED)
     
-    def add_rounded_corners(self, img, radius):
-        """为图片添加圆角效果 - 更平滑的边缘处理"""
-        # 创建一个透明掩码
-        mask = Image.new('L', img.size, 0)
-        draw = ImageDraw.Draw(mask)
-        
-        # 绘制圆角矩形
-        draw.rounded_rectangle([(0, 0), img.size], radius, fill=255)
-        
-        # 应用掩码
-        result = img.copy()
-        result.putalpha(mask)
-        
-        # 添加轻微的阴影效果
-        if img.mode in ('RGBA', 'LA'):
-            background = Image.new(img.mode[:-1], img.size, (240, 240, 240))
-            background.putalpha(mask)
-            result = Image.alpha_composite(background, result)
-        
-        return result
-    
     def start_recognition(self):
         """开始识别（在新线程中执行以避免界面卡顿）"""
         if not self.current_image_path or self.processed_img is None:
@@ -717,8 +695,10 @@ class AnimalRecognitionApp:
         self.update_status("正在识别图片中的动物...")
         
         # 更新用户统计
-        self.user_stats["total_recognitions"] += 1
-        self.save_user_stats()
+        self.progress.increment("total_recognitions")
+        
+        # 推理期间动画自动降级，把CPU让给模型
+        self.animation.set_busy(True)
         
         # 在新线程中执行识别
         threading.Thread(target=self.perform_recognition, daemon=True).start()
@@ -737,48 +717,42 @@ class AnimalRecognitionApp:
             # 模拟处理时间，让进度条可见
             time.sleep(1)
             
-            # 准备模型输入
-            model_input_img = self.processed_img.resize(self.img_size)
-            img_array = image.img_to_array(model_input_img) / 255.0
-            img_array = np.expand_dims(img_array, axis=0)
-            
-            # 检查形状是否正确
-            if img_array.shape != (1, self.img_size[0], self.img_size[1], 3):
-                self.root.after(0, lambda: self.show_recognition_error(
-                    f"图片处理后形状为 {img_array.shape}，不符合预期的 (1, {self.img_size[0]}, {self.img_size[1]}, 3)"))
-                return
-            
-            # 进行预测
-            predictions = self.model.predict(img_array, verbose=0)[0]
-            top3_indices = np.argsort(predictions)[::-1][:3]
+            # 进行预测（预处理与predict.py共用同一套代码）
+            similar_images = []
+            if self.similarity_index is not None:
+                # 同一次前向计算同时得到嵌入，再从数据集索引中检索相似图片
+                embeddings, predictions = self.classifier.embed([self.processed_img])
+                prediction = predictions[0]
+                similar = self.similarity_index.search(embeddings[0], self.num_similar + 1)
+                similar = [item for item in similar
+                           if os.path.abspath(item[0]) != os.path.abspath(self.current_image_path)]
+                similar_images = self.load_similar_thumbnails(similar[:self.num_similar])
+            else:
+                prediction = self.classifier.predict([self.processed_img])[0]
             
             # 准备结果字符串
             result_str = "识别结果:\n\n"
-            for i, idx in enumerate(top3_indices):
-                class_name = self.class_names[idx] if idx < len(self.class_names) else str(idx)
-                confidence = predictions[idx]
+            for i, (class_name, confidence) in enumerate(prediction['top_k']):
                 result_str += f"{i+1}. {class_name}: {confidence*100:.2f}%\n"
             
             # 解锁识别到的动物
             unlock_message = ""
-            if len(top3_indices) > 0:
-                top_class_idx = top3_indices[0]
-                if top_class_idx < len(self.class_names):
-                    top_class = self.class_names[top_class_idx]
-                    if top_class not in self.unlocked_animals:
-                        self.unlocked_animals.add(top_class)
-                        self.save_unlocked_animals()
-                        self.save_user_stats()
-                        unlock_message = f"\n🎉 恭喜！你已解锁新动物: {top_class}"
+            top_class = prediction['predicted_class']
+            if top_class in self.class_names:
+                self.progress.record_recognition(top_class, prediction['confidence'], self.current_image_path)
+                if self.unlock_animal(top_class):
+                    unlock_message = f"\n🎉 恭喜！你已解锁新动物: {top_class}"
             
             # 在主线程中更新UI
-            self.root.after(0, lambda: self.show_recognition_result(result_str, unlock_message))
+            self.root.after(0, lambda: self.show_recognition_result(result_str, unlock_message, similar_images))
             
         except Exception as e:
             self.root.after(0, lambda: self.show_recognition_error(f"识别过程出错: {str(e)}"))
     
-    def show_recognition_result(self, result_str, unlock_message):
+    def show_recognition_result(self, result_str, unlock_message, similar_images=None):
         """显示识别结果 - 添加淡入动画"""
+        self.animation.set_busy(False)
+        
         # 停止进度条并隐藏
         self.progress_bar.stop()
         self.progress_frame.pack_forget()
@@ -793,16 +767,44 @@ class AnimalRecognitionApp:
         if unlock_message:
             self.result_text.insert(tk.END, unlock_message, "unlock")
         
+        self.show_similar_images(similar_images or [])
+        
         # 重新启用按钮
         self.start_recognition_btn.config(state=tk.NORMAL)
         self.update_status("识别完成")
     
+    def show_similar_images(self, similar_images):
+        """在识别结果下方展示数据集中的相似图片"""
+        for widget in self.similar_frame.winfo_children():
+            widget.destroy()
+        self.similar_photos = []
+        if not similar_images:
+            self.similar_frame.pack_forget()
+            return
+        
+        self.similar_frame.pack(fill=tk.X, pady=(10, 0))
+        ttk.Label(self.similar_frame, text="相似图片", font=("Segoe UI", 12, "bold"),
+                  style="White.TLabel").pack(anchor=tk.W, pady=(0, 5))
+        row = ttk.Frame(self.similar_frame, style="White.TFrame")
+        row.pack(fill=tk.X)
+        for img, label, score in similar_images:
+            photo = ImageTk.PhotoImage(img)
+            self.similar_photos.append(photo)  # 保持引用，避免被回收
+            cell = ttk.Frame(row, style="White.TFrame")
+            cell.pack(side=tk.LEFT, padx=4)
+            ttk.Label(cell, image=photo, style="White.TLabel").pack()
+            ttk.Label(cell, text=f"{label}\n{score:.2f}", font=("Segoe UI", 9),
+                      justify=tk.CENTER, style="White.TLabel").pack()
+    
     def show_recognition_error(self, error_msg):
         """显示识别错误"""
+        self.animation.set_busy(False)
+        
         # 停止进度条并隐藏
         self.progress_bar.stop()
         self.progress_frame.pack_forget()
         
+        self.show_similar_images([])
         self.result_text.delete(1.0, tk.END)
         self.result_text.insert(tk.END, "识别失败 😞\n\n", "title")
         self.result_text.insert(tk.END, error_msg, "highlight")
@@ -897,13 +899,16 @@ class AnimalRecognitionApp:
         self.current_animal_index = 0
         self.score = 0
         
+        # 预取第一题的图片
+        self.next_question_image = self.quiz_image_bank.prefetch(selected_animals[0])
+        
         # 创建游戏界面
         self.show_game_question()
     
     def show_game_question(self):
         """显示游戏问题 - 更精美的布局"""
         # 清除之前的游戏界面
-        for widget in self.main_frame.winfo_children():
+        for widget in self.content_widgets():
             if not isinstance(widget, ttk.Button) or widget["text"] != "← 返回主页":
                 widget.destroy()
         
@@ -923,67 +928,46 @@ class AnimalRecognitionApp:
         # 当前动物
         current_animal = self.game_animals[self.current_animal_index]
         
-        # 获取动物图片
-        animal_dir = os.path.join(self.animal_images_dir, current_animal)
-        if os.path.exists(animal_dir):
-            image_files = [f for f in os.listdir(animal_dir) 
-                          if f.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp', '.gif'))]
-            if image_files:
-                random_image = random.choice(image_files)
-                image_path = os.path.join(animal_dir, random_image)
-                
-                # 显示图片卡片，带阴影和圆角
-                image_card = ttk.Frame(self.main_frame, style="Card.TFrame", padding=20)
-                image_card.pack(pady=20, padx=100)
-                
-                # 卡片阴影
-                image_shadow = ttk.Frame(self.main_frame, style="Shadow.TFrame")
-                image_shadow.pack(pady=(0, 20), padx=102, fill=tk.X, ipady=2)
-                
-                # 显示图片
-                try:
-                    img = Image.open(image_path)
-                    # 添加圆角效果和轻微边框
-                    img = self.add_rounded_corners(img, 15)
-                    
-                    # 设置设置图片图片大小限制，防止过大图片过大
-                    max_width = 500
-                    max_height = 350  # 减小高度限制，为选项留出空间
-                    
-                    # 获取原始图片尺寸
-                    width, height = img.size
-                    
-                    # 计算缩放比例
-                    if width > max_width or height > max_height:
-                        # 计算宽度和高度的缩放比例
-                        width_ratio = max_width / width
-                        height_ratio = max_height / height
-                        
-                        # 选择较小的缩放比例以确保图片完全在限制范围内
-                        scale_ratio = min(width_ratio, height_ratio)
-                        
-                        # 计算新尺寸
-                        new_width = int(width * scale_ratio)
-                        new_height = int(height * scale_ratio)
-                        
-                        # 缩放图片
-                        img = img.resize((new_width, new_height), Image.LANCZOS)
-                    
-                    photo = ImageTk.PhotoImage(img)
-                    
-                    image_label = ttk.Label(image_card, image=photo, style="White.TLabel")
-                    image_label.image = photo
-                    image_label.pack()
-                except Exception as e:
-                    ttk.Label(image_card, text=f"无法加载图片: {str(e)}", style="White.TLabel").pack(pady=10)
-            else:
-                error_frame = ttk.Frame(self.main_frame, style="Card.TFrame", padding=20)
-                error_frame.pack(pady=20, padx=100)
-                ttk.Label(error_frame, text=f"未找到{current_animal}的图片", style="White.TLabel").pack(pady=10)
+        # 获取动物图片（优先使用预取结果）
+        future = self.next_question_image
+        if future is None:
+            future = self.quiz_image_bank.prefetch(current_animal)
+        self.next_question_image = None
+        
+        # 答题期间后台预取下一题的图片
+        next_index = self.current_animal_index + 1
+        if next_index < len(self.game_animals):
+            self.next_question_image = self.quiz_image_bank.prefetch(self.game_animals[next_index])
+        
+        try:
+            image_path, img = future.result()
+            load_error = None
+        except Exception as e:
+            image_path, img = None, None
+            load_error = e
+        
+        if img is not None:
+            # 显示图片卡片，带阴影和圆角
+            image_card = ttk.Frame(self.main_frame, style="Card.TFrame", padding=20)
+            image_card.pack(pady=20, padx=100)
+            
+            # 卡片阴影
+            image_shadow = ttk.Frame(self.main_frame, style="Shadow.TFrame")
+            image_shadow.pack(pady=(0, 20), padx=102, fill=tk.X, ipady=2)
+            
+            # 显示图片（已预先缩放并添加圆角）
+            photo = ImageTk.PhotoImage(img)
+            image_label = ttk.Label(image_card, image=photo, style="White.TLabel")
+            image_label.image = photo
+            image_label.pack()
+        elif load_error is not None:
+            error_frame = ttk.Frame(self.main_frame, style="Card.TFrame", padding=20)
+            error_frame.pack(pady=20, padx=100)
+            ttk.Label(error_frame, text=f"无法加载图片: {str(load_error)}", style="White.TLabel").pack(pady=10)
         else:
             error_frame = ttk.Frame(self.main_frame, style="Card.TFrame", padding=20)
             error_frame.pack(pady=20, padx=100)
-            ttk.Label(error_frame, text=f"未找到{current_animal}的图片目录", style="White.TLabel").pack(pady=10)
+            ttk.Label(error_frame, text=f"未找到{current_animal}的图片", style="White.TLabel").pack(pady=10)
         
         # 生成选项（一个正确答案和三个错误答案）
         options = [current_animal]
@@ -1026,13 +1010,9 @@ class AnimalRecognitionApp:
     
     def check_answer(self, selected_option):
         """检查答案 - 添加反馈动画"""
-        if selected_option == self.correct_answer:
+        # 记录答题结果（答对时累加得分并解锁动物）
+        if self.progress.record_quiz(self.correct_answer, selected_option):
             self.score += 1
-            self.user_stats["correct_guesses"] += 1
-            # 解锁动物
-            self.unlocked_animals.add(self.correct_answer)
-            self.save_unlocked_animals()
-            self.save_user_stats()
             messagebox.showinfo("结果", "✅ 回答正确！")
         else:
             messagebox.showerror("结果", f"❌ 回答错误！正确答案是: {self.correct_answer}")
@@ -1048,7 +1028,7 @@ class AnimalRecognitionApp:
     
     def clear_game_question(self):
         """清除当前游戏问题，为下一题做准备"""
-        for widget in self.main_frame.winfo_children():
+        for widget in self.content_widgets():
             if not isinstance(widget, ttk.Button) or widget["text"] != "← 返回主页":
                 try:
                     self.fade_out(widget)
@@ -1058,7 +1038,7 @@ class AnimalRecognitionApp:
     def show_game_result(self):
         """显示游戏结果 - 更精美的设计"""
         # 清除游戏界面
-        for widget in self.main_frame.winfo_children():
+        for widget in self.content_widgets():
             if not isinstance(widget, ttk.Button) or widget["text"] != "← 返回主页":
                 widget.destroy()
         
@@ -1242,32 +1222,15 @@ class AnimalRecognitionApp:
             # 判断是否已解锁
             is_unlocked = animal in self.unlocked_animals
             
-            # 加载图标
-            icon_path = os.path.join(self.zoo_icons_dir, f"{animal}_zoo.png")
-            if os.path.exists(icon_path):
-                try:
-                    img = Image.open(icon_path)
-                    if not is_unlocked:
-                        # 创建灰色轮廓效果
-                        img = img.convert("L")
-                        img = ImageOps.autocontrast(img, cutoff=5)
-                        img = img.filter(ImageFilter.FIND_EDGES)
-                        img = ImageOps.invert(img)
-                        background = Image.new('RGB', img.size, (200, 200, 200))
-                        img = Image.composite(Image.new('RGB', img.size, (100, 100, 100)), background, img)
-                    else:
-                        img = img.convert("RGB")
-                    
-                    # 调整图片尺寸并添加圆角
-                    img.thumbnail((image_size, image_size))
-                    img = self.add_rounded_corners(img, 10)
-                    photo = ImageTk.PhotoImage(img)
-                    icon_label = ttk.Label(animal_frame, image=photo, style="White.TLabel")
-                    icon_label.image = photo
-                    icon_label.pack(pady=5)
-                except Exception as e:
-                    # 显示占位图标
-                    self.create_placeholder_icon(animal_frame, animal, is_unlocked, image_size)
+            # 加载图标（使用预处理缓存）
+            try:
+                photo = self.zoo_icon_cache.get_photo(animal, is_unlocked)
+            except Exception:
+                photo = None
+            if photo is not None:
+                icon_label = ttk.Label(animal_frame, image=photo, style="White.TLabel")
+                icon_label.image = photo
+                icon_label.pack(pady=5)
             else:
                 # 如果没有图标，显示占位符
                 self.create_placeholder_icon(animal_frame, animal, is_unlocked, image_size)
@@ -1302,6 +1265,17 @@ class AnimalRecognitionApp:
     
     def create_placeholder_icon(self, parent, animal, is_unlocked, size):
         """创建更精美的占位图标"""
+        key = (animal, is_unlocked, size)
+        photo = self.placeholder_photos.get(key)
+        if photo is None:
+            photo = ImageTk.PhotoImage(self.render_placeholder_icon(animal, is_unlocked, size))
+            self.placeholder_photos[key] = photo
+        icon_label = ttk.Label(parent, image=photo, style="White.TLabel")
+        icon_label.image = photo
+        icon_label.pack(pady=5)
+    
+    def render_placeholder_icon(self, animal, is_unlocked, size):
+        """绘制占位图标图片"""
         placeholder = Image.new('RGB', (size, size), (240, 240, 240) if is_unlocked else (200, 200, 200))
         draw = ImageDraw.Draw(placeholder)
         
@@ -1333,12 +1307,9 @@ class AnimalRecognitionApp:
             draw.text(position, text, fill=(150, 150, 150), font=font)
         
         # 添加圆角
-        placeholder = self.add_rounded_corners(placeholder, 10)
+        placeholder = add_rounded_corners(placeholder, 10)
         
-        photo = ImageTk.PhotoImage(placeholder)
-        icon_label = ttk.Label(parent, image=photo, style="White.TLabel")
-        icon_label.image = photo
-        icon_label.pack(pady=5)
+        return placeholder
 
 # 确保需要的库已导入
 try:
@@ -1354,6 +1325,16 @@ except ImportError:
 
 # 运行应用
 if __name__ == "__main__":
+    import argparse
+    import getpass
+    
+    parser = argparse.ArgumentParser(description="动物世界探索家")
+    parser.add_argument('--profile', default=os.environ.get('ANIMAL_PROFILE') or getpass.getuser(),
+                        help="用户名（多人共用一台机器时区分进度）")
+    parser.add_argument('--db', default='progress.db', help="用户进度数据库路径")
+    args = parser.parse_args()
+    
     root = tk.Tk()
-    app = AnimalRecognitionApp(root)
+    app = AnimalRecognitionApp(root, profile=args.profile, db_path=args.db)
+    root.protocol("WM_DELETE_WINDOW", app.on_close)
     root.mainloop()
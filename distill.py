@@ -0,0 +1,254 @@
+import os
+import argparse
+from datetime import datetime
+import numpy as np
+
+from animal_classifier import load_class_names
+from model_report import list_dataset, summarize_accuracy, evaluate, measure_latency, model_size, print_comparison
+from progress_store import atomic_write_json
+
+# 配置参数
+data_dir = '/kaggle/input/animals/Animal/Animal'  # 数据集路径（与train.py相同）
+teacher_path = './output/model/best_model.keras'  # 教师模型（train.py训练的EfficientNetB6）
+class_names_path = 'class.txt'  # 类别名称（教师模型输出顺序）
+teacher_img_size = None  # 教师输入尺寸（None时使用模型自身的输入尺寸）
+student_arch = 'efficientnetb0'  # 学生模型主干：efficientnetb0 / mobilenetv3small / mobilenetv3large 等（见backbones.py）
+student_img_size = (224, 224)
+output_dir = './output/model'  # 学生模型与对比报告的保存目录
+teacher_cache = './cache/teacher_logits.npz'  # 教师输出缓存（只计算一次）
+temperature = 4.0  # 蒸馏温度，越高软标签越平滑
+alpha = 0.7  # 软标签（KL散度）损失的权重，其余为真实标签交叉熵
+batch_size = 32
+warmup_epochs = 2  # 先冻结主干只训练分类头的轮数
+epochs = 15  # 总训练轮数
+warmup_lr = 1e-3
+fine_tune_lr = 1e-4
+dropout_rate = 0.2
+
+
+# ---- 教师输出缓存 ----
+
+def teacher_signature(path):
+    stat = os.stat(path)
+    return f'{os.path.abspath(path)}:{stat.st_mtime_ns}:{stat.st_size}'
+
+
+def load_teacher_logits(paths, teacher_path=teacher_path, cache_path=teacher_cache, batch_size=batch_size):
+    """返回paths对应的教师对数概率 (N, num_classes)，已缓存的图片不再推理
+
+    教师最后一层是softmax，log(p)与logits只差每个样本的常数，做温度softmax时结果完全相同，
+    因此缓存对数概率即可（float16，10万张图片、100类约20MB）。缓存与教师模型文件的签名绑定。
+    """
+    signature = teacher_signature(teacher_path)
+    cached = {}
+    if os.path.exists(cache_path):
+        with np.load(cache_path) as data:
+            if str(data['signature']) == signature:
+                cached = dict(zip(data['paths'], data['log_probs']))
+    missing = [p for p in paths if p not in cached]
+    if missing:
+        from animal_classifier import AnimalClassifier
+
+        print(f"正在计算教师输出：{len(missing)} 张图片（已缓存 {len(paths) - len(missing)} 张）")
+        teacher = AnimalClassifier(teacher_path, class_names_path, teacher_img_size)
+        for i, (path, prediction) in enumerate(teacher.iter_predictions(missing, batch_size), 1):
+            if 'error' in prediction:
+                print(f"图片处理失败 {path}: {prediction['error']}")
+                continue
+            cached[path] = np.log(np.maximum(prediction['probabilities'], 1e-12)).astype(np.float16)
+            if i % 1000 == 0:
+                print(f"  已完成 {i}/{len(missing)}")
+        os.makedirs(os.path.dirname(os.path.abspath(cache_path)), exist_ok=True)
+        keep = sorted(cached)
+        tmp_path = cache_path + '.tmp.npz'
+        np.savez(tmp_path, signature=signature, paths=np.array(keep), log_probs=np.stack([cached[p] for p in keep]))
+        os.replace(tmp_path, cache_path)
+    return np.stack([cached[p] for p in paths if p in cached]), [p for p in paths if p in cached]
+
+
+# ---- 学生模型 ----
+
+def create_student(num_classes, arch=student_arch, img_size=student_img_size):
+    """构建学生模型，返回(推理模型, 输出logits的训练模型, 主干)
+
+    输入与教师相同，为[0, 1]的float32图片（AnimalClassifier可直接加载），主干由backbones.py构建。
+    """
+    from tensorflow.keras import Model
+    from tensorflow.keras.layers import Dense, Dropout, GlobalAveragePooling2D, Activation
+    from backbones import build_backbone
+
+    inputs, features, backbone = build_backbone(arch, img_size)
+    x = GlobalAveragePooling2D()(features)
+    x = Dropout(dropout_rate)(x)
+    logits = Dense(num_classes, dtype='float32', name='logits')(x)
+    probabilities = Activation('softmax', dtype='float32', name='probabilities')(logits)
+    return (Model(inputs, probabilities, name=f'student_{arch}'),
+            Model(inputs, logits, name=f'student_{arch}_logits'), backbone)
+
+
+def distillation_loss(num_classes, temperature=temperature, alpha=alpha):
+    """y_true为[one-hot真实标签, 教师对数概率]拼接 (N, 2C)，y_pred为学生logits
+
+    软标签项为KL(教师 || 学生)，都在温度T下做softmax，乘T^2保持梯度量级（Hinton等）。
+    """
+    import tensorflow as tf
+
+    def loss(y_true, y_pred):
+        hard, teacher = y_true[:, :num_classes], y_true[:, num_classes:]
+        soft_teacher = tf.nn.softmax(teacher / temperature)
+        kd = tf.reduce_sum(soft_teacher * (tf.nn.log_softmax(teacher / temperature) -
+                                           tf.nn.log_softmax(y_pred / temperature)), axis=-1)
+        ce = tf.nn.softmax_cross_entropy_with_logits(hard, y_pred)
+        return alpha * kd * temperature ** 2 + (1 - alpha) * ce
+
+    return loss
+
+
+def hard_accuracy(num_classes):
+    import tensorflow as tf
+
+    def accuracy(y_true, y_pred):
+        return tf.cast(tf.equal(tf.argmax(y_true[:, :num_classes], -1), tf.argmax(y_pred, -1)), tf.float32)
+
+    return accuracy
+
+
+def distillation_targets(labels, teacher_log_probs, num_classes):
+    """拼接[one-hot真实标签, 教师对数概率]作为y_true"""
+    return np.concatenate([np.eye(num_classes, dtype=np.float32)[labels],
+                           teacher_log_probs.astype(np.float32)], axis=1)
+
+
+def make_dataset(paths, targets, img_size=student_img_size, batch_size=batch_size, training=True):
+    """tf.data输入管道：解码并用最近邻缩放到img_size（与推理时的预处理一致），训练时加轻量增强
+
+    蒸馏时教师输出是对原图预先计算的，增强只用翻转和小幅亮度变化，避免软标签与增强后的图片差距过大。
+    """
+    import tensorflow as tf
+
+    def load(path, target):
+        image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+        image = tf.image.resize(image, img_size, method='nearest')
+        image = tf.cast(image, tf.float32) / 255.0
+        return image, target
+
+    def augment(image, target):
+        image = tf.image.random_flip_left_right(image)
+        image = tf.clip_by_value(tf.image.random_brightness(image, 0.1), 0.0, 1.0)
+        return image, target
+
+    dataset = tf.data.Dataset.from_tensor_slices((paths, targets))
+    if training:
+        dataset = dataset.shuffle(len(paths), seed=42, reshuffle_each_iteration=True)
+    dataset = dataset.map(load, num_parallel_calls=tf.data.AUTOTUNE)
+    if training:
+        dataset = dataset.map(augment, num_parallel_calls=tf.data.AUTOTUNE)
+    return dataset.batch(batch_size).prefetch(tf.data.AUTOTUNE)
+
+
+def train_student(train_set, val_set, num_classes, arch=student_arch, img_size=student_img_size):
+    """两阶段训练：先冻结主干训练分类头，再整体微调；返回(推理模型, 训练历史)"""
+    import tensorflow as tf
+    from tensorflow.keras.callbacks import EarlyStopping
+    from backbones import freeze_backbone
+
+    model, logits_model, backbone = create_student(num_classes, arch, img_size)
+    loss = distillation_loss(num_classes)
+    metrics = [hard_accuracy(num_classes)]
+    history = {}
+
+    def fit(lr, initial_epoch, final_epoch):
+        logits_model.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=lr), loss=loss, metrics=metrics)
+        result = logits_model.fit(train_set, validation_data=val_set, initial_epoch=initial_epoch,
+                                  epochs=final_epoch, verbose=1,
+                                  callbacks=[EarlyStopping(monitor='val_loss', patience=3,
+                                                           restore_best_weights=True)])
+        for key, values in result.history.items():
+            history.setdefault(key, []).extend(float(v) for v in values)
+
+    freeze_backbone(backbone, arch, 1.0)
+    fit(warmup_lr, 0, warmup_epochs)
+    freeze_backbone(backbone, arch, 0.0)
+    fit(fine_tune_lr, warmup_epochs, epochs)
+    return model, history
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="把EfficientNetB6教师模型蒸馏为CPU上更快的小模型")
+    parser.add_argument('--data-dir', default=data_dir, help="数据集路径")
+    parser.add_argument('--teacher', default=teacher_path, help="教师模型路径")
+    parser.add_argument('--arch', default=student_arch, help="学生模型主干（见backbones.py）")
+    parser.add_argument('--img-size', type=int, default=student_img_size[0], help="学生模型输入边长")
+    parser.add_argument('--output-dir', default=output_dir, help="学生模型与报告保存目录")
+    parser.add_argument('--cache', default=teacher_cache, help="教师输出缓存路径")
+    args = parser.parse_args()
+    img_size = (args.img_size, args.img_size)
+
+    class_names = load_class_names(class_names_path)
+    train_paths, train_labels = list_dataset(args.data_dir, class_names, 'training')
+    val_paths, val_labels = list_dataset(args.data_dir, class_names, 'validation')
+    print(f"训练样本数: {len(train_paths)}, 验证样本数: {len(val_paths)}")
+
+    # 教师输出只算一次：训练集做软标签，验证集用于对比教师准确率
+    all_paths = train_paths + val_paths
+    all_labels = np.concatenate([train_labels, val_labels])
+    log_probs, kept = load_teacher_logits(all_paths, args.teacher, args.cache)
+    label_of = dict(zip(all_paths, all_labels))
+    teacher_of = dict(zip(kept, log_probs))
+    train_paths = [p for p in train_paths if p in teacher_of]
+    val_paths = [p for p in val_paths if p in teacher_of]
+    train_labels = np.array([label_of[p] for p in train_paths])
+    val_labels = np.array([label_of[p] for p in val_paths])
+    num_classes = len(class_names)
+
+    import tensorflow as tf
+    tf.random.set_seed(42)
+    train_set = make_dataset(train_paths, distillation_targets(
+        train_labels, np.stack([teacher_of[p] for p in train_paths]), num_classes), img_size)
+    val_set = make_dataset(val_paths, distillation_targets(
+        val_labels, np.stack([teacher_of[p] for p in val_paths]), num_classes), img_size, training=False)
+    student, history = train_student(train_set, val_set, num_classes, args.arch, img_size)
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    student_path = os.path.join(args.output_dir, f'student_{args.arch}_{args.img_size}.keras')
+    student.save(student_path)
+    print(f"学生模型已保存至: {student_path}")
+
+    # 对比报告：准确率（同一验证集）、CPU延迟、模型大小（TF已初始化，用tf.device固定在CPU上测量）
+    from animal_classifier import AnimalClassifier
+
+    teacher_probs = np.exp(np.stack([teacher_of[p] for p in val_paths]).astype(np.float32))
+    teacher_metrics = summarize_accuracy(teacher_probs, val_labels, class_names)
+    with tf.device('/CPU:0'):
+        teacher = AnimalClassifier(args.teacher, class_names_path, teacher_img_size)
+        teacher_metrics.update(measure_latency(teacher))
+        teacher_metrics.update(model_size(args.teacher, teacher.float_model))
+        del teacher
+        student_classifier = AnimalClassifier(student_path, class_names_path, img_size)
+        student_metrics = evaluate(student_classifier, val_paths, val_labels)
+        student_metrics.update(measure_latency(student_classifier))
+        student_metrics.update(model_size(student_path, student_classifier.float_model))
+    agreement = float((np.argmax(student_metrics['probabilities'], axis=1) ==
+                       np.argmax(teacher_probs, axis=1)).mean())
+
+    print("\n蒸馏结果对比（验证集、CPU）:")
+    print_comparison([('teacher_b6', teacher_metrics), (f'student_{args.arch}', student_metrics)])
+    print(f"学生与教师top-1一致率: {agreement:.2%}")
+
+    report = {
+        'created': datetime.now().isoformat(),
+        'teacher': args.teacher,
+        'student': student_path,
+        'arch': args.arch,
+        'img_size': list(img_size),
+        'temperature': temperature,
+        'alpha': alpha,
+        'val_samples': len(val_paths),
+        'teacher_agreement': agreement,
+        'history': history,
+    }
+    for name, metrics in (('teacher_metrics', teacher_metrics), ('student_metrics', student_metrics)):
+        report[name] = {k: v for k, v in metrics.items() if k != 'probabilities'}
+    report_path = os.path.splitext(student_path)[0] + '.report.json'
+    atomic_write_json(report_path, report)
+    print(f"对比报告已保存至: {report_path}")
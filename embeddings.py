@@ -0,0 +1,348 @@
+import os
+import json
+import time
+import argparse
+from datetime import datetime
+import numpy as np
+
+from tiling import iter_decoded
+from image_sources import is_archive, iter_sources
+from progress_store import atomic_write_json
+
+# 配置参数
+model_path = './output/model/best_model.keras'  # 模型路径
+class_names_path = 'class.txt'  # 类别名称文件路径
+img_size = None  # 输入尺寸（None时使用模型自身的输入尺寸）
+dataset_dir = 'Animal'  # 默认建库的图片目录
+index_dir = './output/embeddings'  # 嵌入与索引的保存目录
+storage = 'float16'  # 向量存储方式：float16（保留原始向量，查询时精排）/ pq（只保留乘积量化编码）
+batch_size = 32  # 每次前向推理的图片数
+decode_workers = 4
+nlist = None  # 倒排列表（粗聚类中心）数，None时按4*sqrt(N)自动选择
+pq_m = 64  # 乘积量化的子空间数（512维时每段8维，每个向量编码为64字节）
+pq_bits = 8  # 每个子空间的码本大小为2^pq_bits
+train_size = 100000  # 训练聚类中心/码本最多使用的向量数
+kmeans_iters = 15
+nprobe = 16  # 查询时搜索的倒排列表数
+rerank = 10  # float16存储时先按PQ距离取top_k*rerank个候选，再用原始向量精排
+top_k = 6  # 返回的相似图片数
+
+
+def normalize(vectors):
+    """L2归一化，之后平方欧氏距离与余弦相似度一一对应（d = 2 - 2cos）"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+def assign(vectors, centroids, chunk=8192):
+    """分块计算每个向量最近的聚类中心编号"""
+    centroid_norms = (centroids ** 2).sum(axis=1)
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), chunk):
+        x = np.asarray(vectors[start:start + chunk], dtype=np.float32)
+        # ||x - c||^2 = ||x||^2 - 2x·c + ||c||^2，||x||^2对argmin无影响
+        labels[start:start + len(x)] = np.argmin(centroid_norms - 2 * x @ centroids.T, axis=1)
+    return labels
+
+
+def kmeans(vectors, k, iters=kmeans_iters, seed=0):
+    """numpy实现的k-means（随机样本初始化，空簇重新随机取点）"""
+    rng = np.random.default_rng(seed)
+    vectors = np.asarray(vectors, dtype=np.float32)
+    k = min(k, len(vectors))
+    centroids = vectors[rng.choice(len(vectors), k, replace=False)].copy()
+    for _ in range(iters):
+        labels = assign(vectors, centroids)
+        counts = np.bincount(labels, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, vectors)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, np.newaxis]
+        if empty.any():
+            centroids[empty] = vectors[rng.choice(len(vectors), int(empty.sum()), replace=False)]
+    return centroids
+
+
+# ---- 嵌入提取 ----
+
+def extract_embeddings(classifier, sources, out_dir=index_dir, batch_size=batch_size, workers=decode_workers):
+    """批量提取嵌入，追加写入out_dir/vectors.f16（N x D的float16裸矩阵，可直接内存映射）
+
+    同时写入paths.txt（每行一个图片路径）和labels.npy（模型预测的类别编号）。
+    向量先L2归一化再转为float16，每个512维向量占1KB。返回成功提取的图片数。
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    count = 0
+    labels = []
+    batch, names = [], []
+    with open(os.path.join(out_dir, 'vectors.f16'), 'wb') as vectors_file, \
+            open(os.path.join(out_dir, 'paths.txt'), 'w', encoding='utf-8') as paths_file:
+
+        def run_batch():
+            embeddings, probabilities = classifier.embed_batch(np.stack(batch))
+            vectors_file.write(normalize(embeddings).astype(np.float16).tobytes())
+            paths_file.writelines(name + '\n' for name in names)
+            labels.extend(np.argmax(probabilities, axis=1))
+            batch.clear()
+            names.clear()
+
+        for name, array, error in iter_decoded(sources, classifier.img_size, classifier.decode_backend, workers):
+            if error is not None:
+                print(f"图片处理失败 {name}: {error}")
+                continue
+            batch.append(classifier.preprocess(array))
+            names.append(name.replace('\n', ' '))
+            count += 1
+            if len(batch) == batch_size:
+                run_batch()
+                if count % (batch_size * 10) == 0:
+                    print(f"已提取 {count} 张图片的嵌入")
+        if batch:
+            run_batch()
+
+    dim = os.path.getsize(os.path.join(out_dir, 'vectors.f16')) // (2 * count) if count else 0
+    np.save(os.path.join(out_dir, 'labels.npy'), np.asarray(labels, dtype=np.int16))
+    atomic_write_json(os.path.join(out_dir, 'meta.json'), {
+        'count': count,
+        'dim': int(dim),
+        'class_names': classifier.class_names,
+        'created': datetime.now().isoformat(),
+    })
+    return count
+
+
+def load_vectors(out_dir):
+    """以内存映射方式打开float16嵌入矩阵"""
+    with open(os.path.join(out_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    return np.memmap(os.path.join(out_dir, 'vectors.f16'), dtype=np.float16, mode='r',
+                     shape=(meta['count'], meta['dim']))
+
+
+# ---- IVF-PQ索引 ----
+
+def build_index(out_dir=index_dir, nlist=nlist, m=pq_m, storage=storage, train_size=train_size, seed=0):
+    """在已提取的嵌入上构建IVF-PQ索引
+
+    - 粗量化：k-means得到nlist个中心，每个向量归入最近的倒排列表；
+    - 乘积量化：对"向量 - 所属中心"的残差，把维度切成m段，每段用256个码字的码本编码为1字节；
+    - 编码按倒排列表顺序连续存放（pq_codes.u8），查询时每个列表是一段连续内存。
+    storage='pq'时删除float16原始向量，只保留编码（512维时每个向量64字节）。
+    """
+    vectors = load_vectors(out_dir)
+    count, dim = vectors.shape
+    if count == 0:
+        raise ValueError("没有可以建索引的嵌入")
+    if dim % m:
+        raise ValueError(f"嵌入维度{dim}不能被子空间数{m}整除")
+    nlist = nlist or max(1, min(count // 39, int(4 * np.sqrt(count))))
+    ksub = 1 << pq_bits
+    rng = np.random.default_rng(seed)
+    sample_ids = np.sort(rng.choice(count, min(count, train_size), replace=False))
+    sample = np.asarray(vectors[sample_ids], dtype=np.float32)
+
+    started = time.perf_counter()
+    centroids = kmeans(sample, nlist, seed=seed)
+    nlist = len(centroids)
+    residuals = (sample - centroids[assign(sample, centroids)]).reshape(len(sample), m, dim // m)
+    codebooks = np.stack([kmeans(residuals[:, j], ksub, seed=seed + j) for j in range(m)])
+    if codebooks.shape[1] < ksub:
+        # 样本太少时码本不满，补上远离数据的码字以保持形状固定
+        pad = np.full((m, ksub - codebooks.shape[1], dim // m), 1e3, dtype=np.float32)
+        codebooks = np.concatenate([codebooks, pad], axis=1)
+    print(f"聚类中心与码本训练完成（nlist={nlist}, m={m}），用时 {time.perf_counter() - started:.1f}s")
+
+    # 分块编码全部向量
+    list_ids = np.empty(count, dtype=np.int32)
+    codes = np.empty((count, m), dtype=np.uint8)
+    chunk = 65536
+    for start in range(0, count, chunk):
+        x = np.asarray(vectors[start:start + chunk], dtype=np.float32)
+        ids = assign(x, centroids)
+        list_ids[start:start + len(x)] = ids
+        r = (x - centroids[ids]).reshape(len(x), m, dim // m)
+        for j in range(m):
+            codes[start:start + len(x), j] = assign(r[:, j], codebooks[j])
+
+    order = np.argsort(list_ids, kind='stable').astype(np.int32)
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(list_ids, minlength=nlist))]).astype(np.int64)
+    codes[order].tofile(os.path.join(out_dir, 'pq_codes.u8'))
+    np.save(os.path.join(out_dir, 'ivf_ids.npy'), order)
+    np.save(os.path.join(out_dir, 'ivf_offsets.npy'), offsets)
+    np.save(os.path.join(out_dir, 'centroids.npy'), centroids)
+    np.save(os.path.join(out_dir, 'codebooks.npy'), codebooks)
+
+    meta_path = os.path.join(out_dir, 'meta.json')
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    del vectors
+    if storage == 'pq':
+        os.remove(os.path.join(out_dir, 'vectors.f16'))
+    meta.update({'nlist': nlist, 'pq_m': m, 'storage': storage})
+    atomic_write_json(meta_path, meta)
+    print(f"索引构建完成：{count} 个向量，用时 {time.perf_counter() - started:.1f}s")
+    return meta
+
+
+class SimilarityIndex:
+    """内存映射的IVF-PQ相似图片索引
+
+    查询只访问nprobe个倒排列表：对每个列表用查询残差预先算好m x 256的距离表，
+    候选距离即按编码查表求和；保留float16原始向量时再对前top_k*rerank个候选精确重排。
+    """
+
+    def __init__(self, out_dir=index_dir, nprobe=nprobe):
+        with open(os.path.join(out_dir, 'meta.json'), 'r', encoding='utf-8') as f:
+            self.meta = json.load(f)
+        if 'nlist' not in self.meta:
+            raise ValueError(f"{out_dir} 中还没有构建索引")
+        self.nprobe = nprobe
+        self.dim = self.meta['dim']
+        self.m = self.meta['pq_m']
+        self.class_names = self.meta.get('class_names', [])
+        self.centroids = np.load(os.path.join(out_dir, 'centroids.npy'))
+        self.codebooks = np.load(os.path.join(out_dir, 'codebooks.npy'))
+        self.codebook_norms = (self.codebooks ** 2).sum(axis=2)  # (m, 256)
+        self.ids = np.load(os.path.join(out_dir, 'ivf_ids.npy'), mmap_mode='r')
+        self.offsets = np.load(os.path.join(out_dir, 'ivf_offsets.npy'))
+        self.codes = np.memmap(os.path.join(out_dir, 'pq_codes.u8'), dtype=np.uint8, mode='r',
+                               shape=(self.meta['count'], self.m))
+        self.labels = np.load(os.path.join(out_dir, 'labels.npy'), mmap_mode='r')
+        vectors_path = os.path.join(out_dir, 'vectors.f16')
+        self.vectors = load_vectors(out_dir) if os.path.exists(vectors_path) else None
+        with open(os.path.join(out_dir, 'paths.txt'), 'r', encoding='utf-8') as f:
+            self.paths = f.read().splitlines()
+
+    def __len__(self):
+        return self.meta['count']
+
+    def search_ids(self, vector, k=top_k, nprobe=None):
+        """返回与查询向量最相近的(向量编号数组, 余弦相似度数组)"""
+        query = normalize(vector).reshape(-1)
+        nprobe = min(nprobe or self.nprobe, len(self.centroids))
+        coarse = ((self.centroids - query) ** 2).sum(axis=1)
+        probe = np.argpartition(coarse, nprobe - 1)[:nprobe]
+
+        # 所有被搜索列表的距离表一次算出：||r - c||^2 = ||r||^2 - 2r·c + ||c||^2，(nprobe, m, 256)
+        residuals = (query - self.centroids[probe]).reshape(nprobe, self.m, self.dim // self.m)
+        tables = (residuals ** 2).sum(axis=2)[:, :, np.newaxis] + self.codebook_norms \
+            - 2 * np.einsum('pjd,jkd->pjk', residuals, self.codebooks, optimize=True)
+        subspaces = np.arange(self.m)
+        candidate_ids, candidate_dists = [], []
+        for list_id, table in zip(probe, tables):
+            start, end = self.offsets[list_id], self.offsets[list_id + 1]
+            if start == end:
+                continue
+            codes = np.asarray(self.codes[start:end])
+            candidate_dists.append(table[subspaces, codes].sum(axis=1))
+            candidate_ids.append(np.asarray(self.ids[start:end]))
+        if not candidate_ids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        ids = np.concatenate(candidate_ids)
+        dists = np.concatenate(candidate_dists)
+
+        keep = min(len(ids), k * rerank if self.vectors is not None else k)
+        best = np.argpartition(dists, keep - 1)[:keep]
+        ids, dists = ids[best], dists[best]
+        if self.vectors is not None:
+            # 按编号排序后读取，内存映射上的访问更连续
+            order = np.argsort(ids)
+            ids = ids[order]
+            similarity = np.asarray(self.vectors[ids], dtype=np.float32) @ query
+        else:
+            similarity = 1 - dists / 2
+        top = np.argsort(-similarity)[:k]
+        return ids[top], similarity[top]
+
+    def search(self, vector, k=top_k, nprobe=None):
+        """返回[(图片路径, 余弦相似度, 该图片的预测类别), ...]"""
+        ids, similarity = self.search_ids(vector, k, nprobe)
+        results = []
+        for i, score in zip(ids, similarity):
+            label = int(self.labels[i])
+            name = self.class_names[label] if label < len(self.class_names) else str(label)
+            results.append((self.paths[i], float(score), name))
+        return results
+
+
+def benchmark(out_dir=index_dir, queries=200, k=10, nprobe=nprobe, seed=0):
+    """用库内向量作为查询，统计平均查询耗时以及相对暴力搜索的recall@k"""
+    index = SimilarityIndex(out_dir, nprobe)
+    if index.vectors is None:
+        raise ValueError("pq存储模式没有保留原始向量，无法计算召回率")
+    rng = np.random.default_rng(seed)
+    query_ids = rng.choice(len(index), min(queries, len(index)), replace=False)
+    hits = 0
+    elapsed = 0.0
+    for i in query_ids:
+        query = np.asarray(index.vectors[i], dtype=np.float32)
+        started = time.perf_counter()
+        ids, _ = index.search_ids(query, k)
+        elapsed += time.perf_counter() - started
+        exact = np.argsort(-(np.asarray(index.vectors, dtype=np.float32) @ query))[:k]
+        hits += len(np.intersect1d(ids, exact))
+    return {'queries': len(query_ids), 'ms_per_query': elapsed / len(query_ids) * 1000,
+            f'recall@{k}': hits / (len(query_ids) * k)}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="图片嵌入提取与相似图片检索")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    extract_parser = subparsers.add_parser('extract', help="批量提取嵌入并构建索引")
+    extract_parser.add_argument('input', nargs='?', default=dataset_dir, help="图片目录或tar/zip压缩包")
+    extract_parser.add_argument('--model', default=model_path, help="模型路径")
+    extract_parser.add_argument('--storage', choices=['float16', 'pq'], default=storage, help="向量存储方式")
+
+    build_parser = subparsers.add_parser('build', help="在已提取的嵌入上重新构建索引")
+    build_parser.add_argument('--nlist', type=int, default=nlist, help="倒排列表数")
+    build_parser.add_argument('--m', type=int, default=pq_m, help="乘积量化子空间数")
+    build_parser.add_argument('--storage', choices=['float16', 'pq'], default=storage, help="向量存储方式")
+
+    query_parser = subparsers.add_parser('query', help="查找与给定图片相似的图片")
+    query_parser.add_argument('image', help="查询图片路径")
+    query_parser.add_argument('--model', default=model_path, help="模型路径")
+    query_parser.add_argument('--top-k', type=int, default=top_k, help="返回的相似图片数")
+    query_parser.add_argument('--nprobe', type=int, default=nprobe, help="搜索的倒排列表数")
+
+    bench_parser = subparsers.add_parser('bench', help="测试查询耗时与召回率")
+    bench_parser.add_argument('--nprobe', type=int, default=nprobe, help="搜索的倒排列表数")
+
+    for sub in (extract_parser, build_parser, query_parser, bench_parser):
+        sub.add_argument('--index-dir', default=index_dir, help="嵌入与索引的保存目录")
+    args = parser.parse_args()
+
+    if args.command in ('extract', 'query'):
+        os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
+        from animal_classifier import AnimalClassifier
+
+        print("正在加载模型...")
+        classifier = AnimalClassifier(args.model, class_names_path, img_size)
+
+    if args.command == 'extract':
+        sources = iter_sources(args.input)
+        if not is_archive(args.input):
+            sources = list(sources)
+            if not sources:
+                print(f"在目录 {args.input} 中未找到图片文件")
+                exit(1)
+        started = time.perf_counter()
+        count = extract_embeddings(classifier, sources, args.index_dir)
+        print(f"嵌入提取完成：{count} 张图片，用时 {time.perf_counter() - started:.1f}s")
+        if count:
+            build_index(args.index_dir, storage=args.storage)
+    elif args.command == 'build':
+        build_index(args.index_dir, args.nlist, args.m, args.storage)
+    elif args.command == 'query':
+        index = SimilarityIndex(args.index_dir, args.nprobe)
+        embeddings, results = classifier.embed([args.image])
+        print(f"识别结果: {results[0]['predicted_class']} ({results[0]['confidence']:.2%})")
+        started = time.perf_counter()
+        similar = index.search(embeddings[0], args.top_k)
+        print(f"相似图片（检索用时 {(time.perf_counter() - started) * 1000:.2f} ms）:")
+        for path, score, label in similar:
+            print(f"  {score:.4f}  {label:<15} {path}")
+    else:
+        stats = benchmark(args.index_dir, nprobe=args.nprobe)
+        print(f"{stats['queries']} 次查询，平均 {stats['ms_per_query']:.2f} ms，recall@10 = {stats['recall@10']:.3f}")
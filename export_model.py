@@ -0,0 +1,29 @@
+import os
+import argparse
+from tensorflow.keras.models import load_model
+
+from animal_classifier import build_uint8_model, cast_to_float32
+
+# 配置参数
+model_path = './output/model/best_model.keras'  # 训练得到的模型
+output_path = './output/model/best_model_uint8.keras'  # 导出的推理模型
+img_size = None  # 输入尺寸（None时使用模型自身的输入尺寸）
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="导出接收uint8图片、在图内完成缩放与归一化的推理模型"
+                    "（同一批次内的图片须尺寸相同；尺寸不一的批量输入需先在主机端缩放到模型输入尺寸）")
+    parser.add_argument('--model', default=model_path, help="训练得到的模型路径")
+    parser.add_argument('--output', default=output_path, help="导出模型的保存路径")
+    args = parser.parse_args()
+
+    print("正在加载模型...")
+    custom_objects = {'cast_to_float32': cast_to_float32}
+    model = load_model(args.model, compile=False, custom_objects=custom_objects)
+
+    export = build_uint8_model(model, img_size)
+    export.summary()
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    export.save(args.output)
+    print(f"导出完成！推理模型已保存至: {args.output}")
+    print("输入: 任意尺寸的uint8 RGB图片 (batch, H, W, 3)，同一批次内尺寸须相同；输出: 各类别概率")
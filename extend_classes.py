@@ -0,0 +1,305 @@
+import os
+import shutil
+import hashlib
+import argparse
+from datetime import datetime
+import numpy as np
+
+from image_sources import is_image_name
+from progress_store import atomic_write_json, write_temp_text
+from model_report import list_dataset, sample_per_class
+
+# 配置参数
+model_path = './output/model/best_model.keras'  # 要扩展的模型（会被替换，旧版本另存备份）
+class_names_path = 'class.txt'  # 类别名称文件（与模型输出顺序一致，新类别追加在末尾）
+img_size = None  # 输入尺寸（None时使用模型自身的输入尺寸）
+data_dir = 'Animal'  # 数据集目录，每个类别一个子目录
+cache_dir = './cache/head_features'  # 分类头输入特征的缓存目录
+samples_per_class = 80  # 已有类别每类最多提取的训练图片数，验证图片另取其val_fraction（新类别使用全部图片）
+val_fraction = 0.2  # 新类别留作验证的比例；已有类别的验证图片取自train.py的validation子集
+batch_size = 32
+epochs = 40  # 分类头训练轮数（特征已缓存，每轮只需几毫秒到几秒）
+learning_rate = 1e-3
+seed = 42
+
+
+def model_fingerprint(model):
+    """对分类层之前全部权重做摘要：只替换分类头时指纹不变，重新训练主干后缓存自动失效"""
+    digest = hashlib.sha1()
+    for layer in model.layers[:-1]:
+        for weight in layer.get_weights():
+            digest.update(np.ascontiguousarray(weight).tobytes())
+    return digest.hexdigest()[:16]
+
+
+def list_class_images(class_dir, limit=None, rng=None):
+    names = sorted(n for n in os.listdir(class_dir) if is_image_name(n))
+    if limit is not None and len(names) > limit:
+        rng = rng or np.random.default_rng(seed)
+        names = sorted(rng.choice(names, limit, replace=False))
+    return [os.path.join(class_dir, n) for n in names]
+
+
+class FeatureCache:
+    """按类别缓存分类头的输入特征（create_model中512维Dense之后的特征）
+
+    每个类别一个npz文件，记录图片路径、(mtime_ns, 大小)和float16特征；
+    图片未变化且模型指纹一致时直接复用，只对新增或修改的图片做前向计算。
+    """
+
+    def __init__(self, classifier, cache_dir=cache_dir, batch_size=batch_size):
+        self.classifier = classifier
+        self.cache_dir = cache_dir
+        self.batch_size = batch_size
+        self.fingerprint = model_fingerprint(classifier.float_model)
+        self.computed = 0
+        self.reused = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, class_name):
+        return os.path.join(self.cache_dir, f'{class_name}.npz')
+
+    def _load(self, class_name):
+        try:
+            with np.load(self._path(class_name)) as data:
+                if str(data['fingerprint']) != self.fingerprint:
+                    return {}
+                return {path: (tuple(sig), feature) for path, sig, feature in
+                        zip(data['paths'], data['signatures'], data['features'])}
+        except (OSError, KeyError, ValueError):
+            return {}
+
+    def features(self, class_name, paths):
+        """返回与paths对应的特征矩阵（读取失败的图片被跳过）和实际使用的路径"""
+        cached = self._load(class_name)
+        signatures = {}
+        missing = []
+        for path in paths:
+            stat = os.stat(path)
+            signatures[path] = (stat.st_mtime_ns, stat.st_size)
+            if path not in cached or cached[path][0] != signatures[path]:
+                missing.append(path)
+
+        for start in range(0, len(missing), self.batch_size):
+            chunk = missing[start:start + self.batch_size]
+            arrays, names = [], []
+            for path in chunk:
+                try:
+                    arrays.append(self.classifier.preprocess(path))
+                    names.append(path)
+                except Exception as e:
+                    print(f"图片处理失败 {path}: {e}")
+            if arrays:
+                embeddings, _ = self.classifier.embed_batch(np.stack(arrays))
+                for path, feature in zip(names, embeddings):
+                    cached[path] = (signatures[path], feature.astype(np.float16))
+        self.computed += len(missing)
+        self.reused += len(paths) - len(missing)
+
+        used = [p for p in paths if p in cached and cached[p][0] == signatures[p]]
+        if missing:
+            # 缓存里保留所有见过的图片，抽样范围变化时无需重算
+            keep = sorted(cached)
+            np.savez(self._path(class_name), fingerprint=self.fingerprint, paths=np.array(keep),
+                     signatures=np.array([cached[p][0] for p in keep], dtype=np.int64).reshape(-1, 2),
+                     features=np.stack([cached[p][1] for p in keep]))
+        feature_dim = next(iter(cached.values()))[1].shape[-1] if cached else 0
+        matrix = np.stack([cached[p][1] for p in used]) if used else np.empty((0, feature_dim), np.float16)
+        return matrix.astype(np.float32), used
+
+
+def split(features, fraction=val_fraction, rng=None):
+    """按比例切分训练/验证特征"""
+    rng = rng or np.random.default_rng(seed)
+    order = rng.permutation(len(features))
+    n_val = int(round(len(features) * fraction)) if len(features) > 1 else 0
+    return features[order[n_val:]], features[order[:n_val]]
+
+
+def imprint_weights(kernel, bias, new_features):
+    """用新类别特征均值初始化新增的分类权重（weight imprinting），范数与已有类别权重对齐"""
+    scale = np.linalg.norm(kernel, axis=0).mean()
+    columns = []
+    for features in new_features:
+        mean = features.mean(axis=0)
+        columns.append(mean / max(np.linalg.norm(mean), 1e-12) * scale)
+    new_kernel = np.concatenate([kernel, np.stack(columns, axis=1)], axis=1)
+    new_bias = np.concatenate([bias, np.full(len(columns), bias.mean(), dtype=bias.dtype)])
+    return new_kernel, new_bias
+
+
+def train_head(kernel, bias, x_train, y_train, epochs=epochs, lr=learning_rate):
+    """在缓存特征上训练扩展后的softmax分类层，类别按样本数反比加权"""
+    import tensorflow as tf
+    from tensorflow.keras import Input, Model
+    from tensorflow.keras.layers import Dense
+
+    num_classes = kernel.shape[1]
+    inputs = Input(shape=(kernel.shape[0],))
+    head = Model(inputs, Dense(num_classes, activation='softmax')(inputs))
+    head.layers[-1].set_weights([kernel, bias])
+    head.compile(optimizer=tf.keras.optimizers.Adam(learning_rate=lr),
+                 loss='sparse_categorical_crossentropy', metrics=['accuracy'])
+    counts = np.bincount(y_train, minlength=num_classes)
+    class_weight = {i: len(y_train) / (num_classes * c) for i, c in enumerate(counts) if c}
+    head.fit(x_train, y_train, batch_size=64, epochs=epochs, class_weight=class_weight, shuffle=True, verbose=0)
+    return head.layers[-1].get_weights()
+
+
+def head_accuracy(kernel, bias, x, y):
+    """逐类别准确率：{类别编号: (正确数, 样本数)}"""
+    pred = np.argmax(x @ kernel + bias, axis=1)
+    return {int(c): (int((pred[y == c] == c).sum()), int((y == c).sum())) for c in np.unique(y)}
+
+
+def replace_head(model, kernel, bias):
+    """保留主干与512维特征层，把最终分类层换成扩展后的Dense"""
+    from tensorflow.keras.models import Model
+    from tensorflow.keras.layers import Dense
+
+    old_head = model.layers[-1]
+    new_head = Dense(kernel.shape[1], activation='softmax', dtype='float32', name=old_head.name)
+    outputs = new_head(old_head.input)
+    new_head.set_weights([kernel, bias])
+    return Model(inputs=model.inputs, outputs=outputs, name=model.name)
+
+
+def backup(path):
+    """把旧文件复制为 path.<时间戳>.bak，返回备份路径"""
+    stamp = datetime.now().strftime('%Y%m%d-%H%M%S')
+    root, ext = os.path.splitext(path)
+    backup_path = f'{root}.{stamp}.bak{ext}'
+    shutil.copy2(path, backup_path)
+    return backup_path
+
+
+def extend(classifier, new_classes, data_dir=data_dir, samples_per_class=samples_per_class, dry_run=False):
+    """为模型追加新类别，返回(新分类层权重, 报告字典)"""
+    class_names = classifier.class_names
+    duplicated = [c for c in new_classes if c in class_names]
+    if duplicated:
+        raise ValueError(f"类别已存在: {', '.join(duplicated)}")
+    for name in new_classes:
+        if not os.path.isdir(os.path.join(data_dir, name)):
+            raise ValueError(f"找不到新类别的图片目录: {os.path.join(data_dir, name)}")
+
+    cache = FeatureCache(classifier)
+    rng = np.random.default_rng(seed)
+    # 已有类别按train.py的划分取样：原分类头见过训练子集，验证只能用validation子集，否则准确率偏高
+    old_subsets = {}
+    for subset, limit in (('training', samples_per_class),
+                          ('validation', max(1, int(round(samples_per_class * val_fraction))))):
+        paths, labels = list_dataset(data_dir, class_names, subset)
+        paths, labels = sample_per_class(paths, labels, limit, seed)
+        grouped = old_subsets.setdefault(subset, {})
+        for path, label in zip(paths, labels):
+            grouped.setdefault(int(label), []).append(path)
+
+    x_train, y_train, x_val, y_val = [], [], [], []
+    new_features = []
+    all_classes = list(class_names) + list(new_classes)
+    for idx, name in enumerate(all_classes):
+        class_dir = os.path.join(data_dir, name)
+        if not os.path.isdir(class_dir):
+            print(f"警告: 已有类别 {name} 没有图片目录，分类头训练时不会出现该类样本")
+            continue
+        is_new = idx >= len(class_names)
+        if is_new:
+            # 新类别没有参与过训练，随机切分即可
+            features, _ = cache.features(name, list_class_images(class_dir))
+            if len(features) == 0:
+                raise ValueError(f"新类别 {name} 没有可用的图片")
+            train, val = split(features, rng=rng)
+        else:
+            train, _ = cache.features(name, old_subsets['training'].get(idx, []))
+            val, _ = cache.features(name, old_subsets['validation'].get(idx, []))
+        for xs, ys, part in ((x_train, y_train, train), (x_val, y_val, val)):
+            if len(part):
+                xs.append(part)
+                ys.append(np.full(len(part), idx))
+        if is_new:
+            new_features.append(train if len(train) else features)
+    print(f"特征准备完成：新计算 {cache.computed} 张，复用缓存 {cache.reused} 张")
+
+    head = classifier.float_model.layers[-1]
+    kernel, bias = head.get_weights()
+    kernel, bias = imprint_weights(kernel, bias, new_features)
+    x_train, y_train = np.concatenate(x_train), np.concatenate(y_train)
+    x_val, y_val = np.concatenate(x_val), np.concatenate(y_val)
+
+    before = head_accuracy(kernel, bias, x_val, y_val)  # 只做imprinting、未训练时的结果
+    if not dry_run:
+        kernel, bias = train_head(kernel, bias, x_train, y_train)
+    after = head_accuracy(kernel, bias, x_val, y_val)
+
+    def summarize(accuracy, classes):
+        correct = sum(accuracy[c][0] for c in classes if c in accuracy)
+        total = sum(accuracy[c][1] for c in classes if c in accuracy)
+        return correct / total if total else None
+
+    old_ids = range(len(class_names))
+    new_ids = range(len(class_names), len(all_classes))
+    report = {
+        'new_classes': list(new_classes),
+        'num_classes': len(all_classes),
+        'train_samples': int(len(y_train)),
+        'val_samples': int(len(y_val)),
+        'features_computed': cache.computed,
+        'features_reused': cache.reused,
+        'val_accuracy_old_classes': {'imprinted': summarize(before, old_ids), 'trained': summarize(after, old_ids)},
+        'val_accuracy_new_classes': {'imprinted': summarize(before, new_ids), 'trained': summarize(after, new_ids)},
+        'per_new_class': {all_classes[c]: after[c][0] / after[c][1] for c in new_ids if after.get(c, (0, 0))[1]},
+    }
+    return (kernel, bias), report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="在不重新训练主干的情况下为模型增加新类别")
+    parser.add_argument('classes', nargs='+', help="新类别名称（data_dir下同名子目录中的图片）")
+    parser.add_argument('--data-dir', default=data_dir, help="数据集目录")
+    parser.add_argument('--model', default=model_path, help="要扩展的模型路径")
+    parser.add_argument('--class-names', default=class_names_path, help="类别名称文件")
+    parser.add_argument('--samples-per-class', type=int, default=samples_per_class,
+                        help="已有类别每类最多使用的图片数")
+    parser.add_argument('--dry-run', action='store_true', help="只评估，不训练也不保存")
+    args = parser.parse_args()
+
+    os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
+    from animal_classifier import AnimalClassifier, build_uint8_model
+
+    print("正在加载模型...")
+    classifier = AnimalClassifier(args.model, args.class_names, img_size)
+    if classifier.float_model.output.shape[-1] != len(classifier.class_names):
+        print(f"模型输出 {classifier.float_model.output.shape[-1]} 类，与 {args.class_names} 中的 "
+              f"{len(classifier.class_names)} 个类别不一致，请先修正")
+        exit(1)
+
+    (kernel, bias), report = extend(classifier, args.classes, args.data_dir, args.samples_per_class, args.dry_run)
+    for key in ('val_accuracy_old_classes', 'val_accuracy_new_classes'):
+        scores = report[key]
+        print(f"{key}: imprinting后 {scores['imprinted']}, 训练后 {scores['trained']}")
+    for name, acc in report['per_new_class'].items():
+        print(f"  {name}: {acc:.2%}")
+    if args.dry_run:
+        exit(0)
+
+    model = replace_head(classifier.float_model, kernel, bias)
+    if classifier.exported_uint8:
+        model = build_uint8_model(model, classifier.img_size)
+
+    # 备份旧文件并写好两个临时文件后，才连续做两次rename，先替换class.txt再替换模型：
+    # 两次rename之间中断时，class.txt多出新类别的名称，但旧模型输出不到这些下标，已有类别的标签仍然正确；
+    # 反过来（新模型配旧class.txt）则新类别的预测没有名称。中断后可用上面的备份恢复
+    model_backup = backup(args.model)
+    class_backup = backup(args.class_names)
+    tmp_model = args.model + '.tmp.keras'
+    model.save(tmp_model)
+    tmp_class_names = write_temp_text(args.class_names, '\n'.join(classifier.class_names + list(args.classes)))
+    os.replace(tmp_class_names, args.class_names)
+    os.replace(tmp_model, args.model)
+    report.update({'model': args.model, 'model_backup': model_backup, 'class_names_backup': class_backup,
+                   'created': datetime.now().isoformat()})
+    atomic_write_json(os.path.splitext(args.model)[0] + '.extend_report.json', report)
+    print(f"已追加 {len(args.classes)} 个类别，模型共 {report['num_classes']} 类")
+    print(f"模型已保存至: {args.model}（旧版本备份: {model_backup}）")
+    print(f"类别名称已更新: {args.class_names}（旧版本备份: {class_backup}）")
@@ -0,0 +1,137 @@
+import io
+import time
+import argparse
+import numpy as np
+from PIL import Image
+
+from image_sources import list_directory
+
+try:
+    import cv2
+except ImportError:  # opencv-python-headless未安装时只提供PIL后端
+    cv2 = None
+
+# 配置参数
+default_backend = 'pil-draft'  # 默认解码后端
+
+
+def _read_bytes(source):
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if hasattr(source, 'read'):
+        return source.read()
+    with open(source, 'rb') as f:
+        return f.read()
+
+
+def _open_pil(source):
+    if isinstance(source, (bytes, bytearray)):
+        return Image.open(io.BytesIO(source))
+    return Image.open(source)
+
+
+def decode_pil(source, target_size):
+    """普通PIL解码：始终解码全分辨率"""
+    with _open_pil(source) as img:
+        return np.asarray(img.convert('RGB'))
+
+
+def decode_pil_draft(source, target_size):
+    """PIL + draft()：JPEG在DCT阶段按1/2、1/4、1/8缩放，直接解码到不小于目标尺寸的最小尺度"""
+    with _open_pil(source) as img:
+        # draft只对JPEG生效，其他格式会原样返回
+        img.draft('RGB', (target_size[1], target_size[0]))
+        return np.asarray(img.convert('RGB'))
+
+
+def decode_opencv(source, target_size):
+    """OpenCV + IMREAD_REDUCED_*：根据文件头尺寸选择最大的缩放倍数，JPEG同样在DCT阶段缩放"""
+    if cv2 is None:
+        raise RuntimeError("未安装opencv-python-headless，无法使用opencv后端")
+    data = _read_bytes(source)
+    # 只读取文件头获得原图尺寸，不解码像素
+    with Image.open(io.BytesIO(data)) as probe:
+        width, height = probe.size
+    flag = cv2.IMREAD_COLOR
+    for factor, reduced in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+                            (2, cv2.IMREAD_REDUCED_COLOR_2)):
+        if width // factor >= target_size[1] and height // factor >= target_size[0]:
+            flag = reduced
+            break
+    # OpenCV默认按EXIF旋转，PIL后端和训练时的flow_from_directory都不旋转；忽略方向使各后端结果一致
+    array = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flag | cv2.IMREAD_IGNORE_ORIENTATION)
+    if array is None:
+        # OpenCV不支持的格式（例如GIF）退回PIL
+        return decode_pil(data, target_size)
+    return cv2.cvtColor(array, cv2.COLOR_BGR2RGB)
+
+
+BACKENDS = {
+    'pil-draft': decode_pil_draft,
+    'opencv': decode_opencv,
+    'pil': decode_pil,
+}
+
+
+def available_backends():
+    return [name for name in BACKENDS if name != 'opencv' or cv2 is not None]
+
+
+def decode_image(source, target_size, backend=default_backend):
+    """把路径/字节/文件对象解码为RGB uint8数组，尺寸不小于target_size（尽量接近）"""
+    if backend not in BACKENDS:
+        raise ValueError(f"未知的解码后端: {backend}，可选: {', '.join(BACKENDS)}")
+    return BACKENDS[backend](source, target_size)
+
+
+def load_image(source, target_size, backend=default_backend):
+    """解码并用最近邻插值缩放到target_size，返回 (H, W, 3) uint8 数组"""
+    array = decode_image(source, target_size, backend)
+    if array.shape[:2] != tuple(target_size):
+        array = np.asarray(Image.fromarray(array).resize((target_size[1], target_size[0]), Image.NEAREST))
+    return array
+
+
+def benchmark(paths, target_size, backends, repeat=3):
+    """在本机上比较各解码后端的速度，并以普通PIL解码结果为基准给出像素差异"""
+    reference = {p: load_image(p, target_size, 'pil').astype(np.int16) for p in paths}
+    rows = []
+    for backend in backends:
+        best = float('inf')
+        for _ in range(repeat):
+            started = time.perf_counter()
+            for p in paths:
+                load_image(p, target_size, backend)
+            best = min(best, time.perf_counter() - started)
+        decoded_pixels = np.mean([np.prod(decode_image(p, target_size, backend).shape[:2]) for p in paths])
+        diff = np.mean([np.abs(load_image(p, target_size, backend).astype(np.int16) - reference[p]).mean()
+                        for p in paths])
+        rows.append({
+            'backend': backend,
+            'ms_per_image': best / len(paths) * 1000,
+            'images_per_sec': len(paths) / best,
+            'decoded_megapixels': decoded_pixels / 1e6,
+            'mean_abs_diff': float(diff),
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="图片解码后端微基准测试")
+    parser.add_argument('image_dir', nargs='?', default='test', help="测试图片目录")
+    parser.add_argument('--size', type=int, nargs=2, default=(456, 456), metavar=('H', 'W'), help="目标尺寸")
+    parser.add_argument('--repeat', type=int, default=3, help="重复次数（取最快一次）")
+    parser.add_argument('--limit', type=int, default=200, help="最多使用的图片数量")
+    args = parser.parse_args()
+
+    paths = list_directory(args.image_dir)[:args.limit]
+    if not paths:
+        print(f"在目录 {args.image_dir} 中未找到图片文件")
+        exit(1)
+
+    print(f"使用 {len(paths)} 张图片，目标尺寸 {tuple(args.size)}")
+    rows = benchmark(paths, tuple(args.size), available_backends(), args.repeat)
+    print(f"{'后端':<12}{'ms/张':>10}{'张/秒':>10}{'解码像素(MP)':>14}{'与PIL差异':>12}")
+    for row in rows:
+        print(f"{row['backend']:<12}{row['ms_per_image']:>10.2f}{row['images_per_sec']:>10.1f}"
+              f"{row['decoded_megapixels']:>14.2f}{row['mean_abs_diff']:>12.2f}")
@@ -0,0 +1,179 @@
+import os
+import json
+import tarfile
+import zipfile
+import threading
+
+# 配置参数
+image_extensions = ('.jpg', '.jpeg', '.png', '.bmp', '.gif')
+archive_extensions = ('.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz', '.zip')
+member_separator = '::'  # 压缩包成员路径格式: archive.tar::dir/img.jpg
+index_suffix = '.index.json'  # 随机访问索引文件（与压缩包放在同一目录）
+
+
+def is_archive(path):
+    return os.path.isfile(path) and path.lower().endswith(archive_extensions)
+
+
+def is_image_name(name):
+    return name.lower().endswith(image_extensions)
+
+
+def member_uri(archive, member):
+    return f"{archive}{member_separator}{member}"
+
+
+def split_uri(uri):
+    """把成员路径拆为(压缩包路径, 成员名)；普通文件路径返回(路径, None)"""
+    archive, sep, member = uri.partition(member_separator)
+    if sep and is_archive(archive):
+        return archive, member
+    return uri, None
+
+
+def list_directory(directory):
+    files = []
+    for root, _, names in os.walk(directory):
+        for name in names:
+            if is_image_name(name):
+                files.append(os.path.join(root, name))
+    return sorted(files)
+
+
+# ---- 顺序读取 ----
+
+def iter_archive(path):
+    """流式读取压缩包中的图片，逐个产出(成员路径, 字节)
+
+    tar（含gz/bz2/xz压缩）按流模式顺序读取，不需要随机访问，也不会把成员解压到磁盘；
+    zip按中央目录顺序逐个读取。
+    """
+    if path.lower().endswith('.zip'):
+        with zipfile.ZipFile(path) as zf:
+            for info in zf.infolist():
+                if not info.is_dir() and is_image_name(info.filename):
+                    yield member_uri(path, info.filename), zf.read(info)
+        return
+    with tarfile.open(path, 'r|*') as tf:
+        for member in tf:
+            if member.isfile() and is_image_name(member.name):
+                yield member_uri(path, member.name), tf.extractfile(member).read()
+
+
+def iter_sources(path):
+    """遍历目录或压缩包中的图片
+
+    目录产出文件路径，压缩包产出(成员路径, 字节)；两种形式都可以直接交给
+    AnimalClassifier.iter_predictions。
+    """
+    if is_archive(path):
+        yield from iter_archive(path)
+    else:
+        yield from list_directory(path)
+
+
+# ---- 随机访问 ----
+
+class ArchiveIndex:
+    """zip/无压缩tar的随机访问索引
+
+    tar记录每个成员数据区的偏移和长度，读取时直接pread，不需要从头扫描；
+    索引保存为同目录下的<压缩包>.index.json，压缩包的大小或修改时间变化后自动重建。
+    zip本身带有中央目录，直接使用ZipFile按名称读取。
+    压缩tar（.tar.gz等）无法随机访问，请使用iter_archive顺序读取。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.is_zip = path.lower().endswith('.zip')
+        if not self.is_zip and not path.lower().endswith('.tar'):
+            raise ValueError(f"压缩tar不支持随机访问，请改用无压缩tar或zip: {path}")
+        self.local = threading.local()
+        self.pid = None
+        if self.is_zip:
+            with zipfile.ZipFile(path) as zf:
+                self.names = [i.filename for i in zf.infolist() if not i.is_dir() and is_image_name(i.filename)]
+            self.offsets = {}
+        else:
+            self.offsets = self._load_or_build_tar_index()
+            self.names = list(self.offsets)
+
+    def _signature(self):
+        stat = os.stat(self.path)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def _load_or_build_tar_index(self):
+        index_path = self.path + index_suffix
+        signature = self._signature()
+        try:
+            with open(index_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.get('signature') == signature:
+                return {name: tuple(entry) for name, entry in saved['members']}
+        except (OSError, ValueError, KeyError):
+            pass
+
+        members = []
+        with tarfile.open(self.path, 'r:') as tf:
+            for member in tf:
+                if member.isfile() and is_image_name(member.name):
+                    members.append((member.name, (member.offset_data, member.size)))
+        try:
+            tmp_path = index_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'signature': signature, 'members': members}, f, ensure_ascii=False)
+            os.replace(tmp_path, index_path)
+        except OSError:
+            pass  # 压缩包所在目录只读时只在内存中使用索引
+        return dict(members)
+
+    def __len__(self):
+        return len(self.names)
+
+    def uris(self, start=0, stop=None):
+        return [member_uri(self.path, name) for name in self.names[start:stop]]
+
+    def _handle(self):
+        # fork后子进程需要重新打开文件；zip句柄不同线程之间不共享
+        if self.pid != os.getpid():
+            self.local = threading.local()
+            self.pid = os.getpid()
+        handle = getattr(self.local, 'handle', None)
+        if handle is None:
+            handle = zipfile.ZipFile(self.path) if self.is_zip else os.open(self.path, os.O_RDONLY)
+            self.local.handle = handle
+        return handle
+
+    def read(self, name):
+        handle = self._handle()
+        if self.is_zip:
+            return handle.read(name)
+        offset, size = self.offsets[name]
+        return os.pread(handle, size, offset)
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def archive_index(path):
+    """获取（并在进程内缓存）压缩包的随机访问索引"""
+    with _indexes_lock:
+        if path not in _indexes:
+            _indexes[path] = ArchiveIndex(path)
+        return _indexes[path]
+
+
+def list_sources(path):
+    """列出目录或可随机访问压缩包中的全部图片路径（压缩包成员为archive::member形式）"""
+    if is_archive(path):
+        return archive_index(path).uris()
+    return list_directory(path)
+
+
+def open_source(uri):
+    """把图片路径解析为可交给解码层的输入：普通文件返回路径，压缩包成员返回(成员路径, 字节)"""
+    archive, member = split_uri(uri)
+    if member is None:
+        return uri
+    return uri, archive_index(archive).read(member)
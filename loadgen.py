@@ -0,0 +1,303 @@
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from image_sources import list_directory
+
+# 配置参数
+image_dir = 'test'  # 回放的图片目录
+percentiles = (50, 90, 95, 99)
+
+
+class HttpTarget:
+    """通过HTTP调用推理服务（asyncio原生实现，复用keep-alive连接）"""
+
+    def __init__(self, url, top_k=3):
+        parsed = urlparse(url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.path = (parsed.path or '/predict') + f"?top_k={top_k}"
+        self.idle = []  # 空闲连接池
+
+    async def _connection(self):
+        """返回(reader, writer, 是否为复用的空闲连接)"""
+        if self.idle:
+            return self.idle.pop() + (True,)
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+        return reader, writer, False
+
+    async def _exchange(self, reader, writer, data):
+        """在一个连接上发送请求并读取完整响应，返回(状态码, 响应头, 响应体, 连接是否可复用)"""
+        header = (f"POST {self.path} HTTP/1.1\r\nHost: {self.host}:{self.port}\r\n"
+                  f"Content-Type: application/octet-stream\r\nContent-Length: {len(data)}\r\n"
+                  f"Connection: keep-alive\r\n\r\n")
+        writer.write(header.encode('latin-1') + data)
+        await writer.drain()
+
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionError("服务端关闭了连接")
+        version, status = status_line.split()[:2]
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            key, _, value = line.decode('latin-1').partition(':')
+            headers[key.strip().lower()] = value.strip()
+        body = await reader.readexactly(int(headers.get('content-length', 0)))
+        # HTTP/1.0默认关闭连接，除非显式声明keep-alive；HTTP/1.1默认保持，除非声明close
+        connection = headers.get('connection', '').lower()
+        reusable = connection == 'keep-alive' if version == b'HTTP/1.0' else connection != 'close'
+        return int(status), headers, body, reusable
+
+    async def predict(self, data):
+        reader, writer, pooled = await self._connection()
+        try:
+            status, headers, body, reusable = await self._exchange(reader, writer, data)
+        except (ConnectionError, asyncio.IncompleteReadError):
+            writer.close()
+            if not pooled:
+                raise
+            # 空闲连接可能已被服务端关闭（读到EOF），换一个新连接重试一次
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+            try:
+                status, headers, body, reusable = await self._exchange(reader, writer, data)
+            except Exception:
+                writer.close()
+                raise
+        except Exception:
+            writer.close()
+            raise
+        if reusable:
+            self.idle.append((reader, writer))
+        else:
+            writer.close()
+
+        payload = json.loads(body) if body else {}
+        if status != 200:
+            raise RuntimeError(f"HTTP {status}: {payload.get('error', '')}")
+        return payload
+
+    async def close(self):
+        for _, writer in self.idle:
+            writer.close()
+        self.idle.clear()
+
+
+class InProcessTarget:
+    """在当前进程内直接调用模型（在线程池中执行，不经过网络）"""
+
+    def __init__(self, model_path, workers=1):
+        from animal_classifier import AnimalClassifier
+
+        self.classifier = AnimalClassifier(model_path)
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def _predict(self, data, submitted):
+        # 与服务端的queue_ms一致：记录请求在线程池中等待空闲线程的时间
+        queue_ms = (time.perf_counter() - submitted) * 1000
+        self.classifier.predict([data])
+        return {'queue_ms': queue_ms}
+
+    async def predict(self, data):
+        submitted = time.perf_counter()
+        return await asyncio.get_running_loop().run_in_executor(self.executor, self._predict, data, submitted)
+
+    async def close(self):
+        self.executor.shutdown()
+
+
+async def run_load(target, payloads, qps=None, concurrency=8, duration=30.0, max_requests=None,
+                   max_in_flight=256):
+    """发送负载并返回每个请求的记录
+
+    - 指定qps时为开环模式：按泊松到达节奏发送，客户端并发上限为max_in_flight，
+      超出上限的请求在客户端排队（计入client_queue_ms）；
+    - 否则为闭环模式：concurrency个并发用户，每个用户收到响应后立即发送下一个请求。
+    """
+    records = []
+    start = time.perf_counter()
+    end_at = start + duration
+    counter = {'sent': 0}
+
+    def next_payload():
+        if max_requests is not None and counter['sent'] >= max_requests:
+            return None
+        if time.perf_counter() >= end_at:
+            return None
+        counter['sent'] += 1
+        return payloads[counter['sent'] % len(payloads)]
+
+    async def one_request(data, scheduled):
+        sent = time.perf_counter()
+        record = {'scheduled': scheduled - start, 'client_queue_ms': (sent - scheduled) * 1000}
+        try:
+            result = await target.predict(data)
+            record['ok'] = True
+            record['server_queue_ms'] = result.get('queue_ms')
+            record['batch_size'] = result.get('batch_size')
+        except Exception as e:
+            record['ok'] = False
+            record['error'] = str(e)
+        finished = time.perf_counter()
+        record['finished'] = finished - start
+        record['latency_ms'] = (finished - scheduled) * 1000
+        records.append(record)
+
+    if qps:
+        semaphore = asyncio.Semaphore(max_in_flight)
+        tasks = []
+
+        async def limited(data, scheduled):
+            async with semaphore:
+                await one_request(data, scheduled)
+
+        scheduled = start
+        while True:
+            data = next_payload()
+            if data is None:
+                break
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(limited(data, scheduled)))
+            scheduled += random.expovariate(qps)
+        await asyncio.gather(*tasks)
+    else:
+        async def user():
+            while True:
+                data = next_payload()
+                if data is None:
+                    return
+                await one_request(data, time.perf_counter())
+
+        await asyncio.gather(*(user() for _ in range(concurrency)))
+
+    await target.close()
+    return records
+
+
+def summarize(records, bucket_seconds=1.0):
+    """汇总延迟分位数、吞吐量、错误率和排队延迟，并按时间分桶"""
+
+    def pct(values):
+        values = [v for v in values if v is not None]
+        if not values:
+            return {}
+        arr = np.asarray(values, dtype=np.float64)
+        stats = {f"p{p}": float(np.percentile(arr, p)) for p in percentiles}
+        stats.update(mean=float(arr.mean()), max=float(arr.max()))
+        return stats
+
+    ok = [r for r in records if r['ok']]
+    elapsed = max((r['finished'] for r in records), default=0.0)
+    summary = {
+        'requests': len(records),
+        'errors': len(records) - len(ok),
+        'error_rate': (len(records) - len(ok)) / len(records) if records else 0.0,
+        'elapsed_s': elapsed,
+        'throughput_rps': len(ok) / elapsed if elapsed > 0 else 0.0,
+        'latency_ms': pct([r['latency_ms'] for r in ok]),
+        'client_queue_ms': pct([r['client_queue_ms'] for r in records]),
+        'server_queue_ms': pct([r.get('server_queue_ms') for r in ok]),
+        'mean_batch_size': float(np.mean([r['batch_size'] for r in ok if r.get('batch_size')]))
+        if any(r.get('batch_size') for r in ok) else None,
+    }
+
+    timeline = []
+    num_buckets = int(elapsed // bucket_seconds) + 1 if records else 0
+    for i in range(num_buckets):
+        lo, hi = i * bucket_seconds, (i + 1) * bucket_seconds
+        bucket = [r for r in records if lo <= r['finished'] < hi]
+        bucket_ok = [r for r in bucket if r['ok']]
+        latencies = pct([r['latency_ms'] for r in bucket_ok])
+        timeline.append({
+            't': lo,
+            'completed': len(bucket_ok),
+            'errors': len(bucket) - len(bucket_ok),
+            'latency_p50_ms': latencies.get('p50'),
+            'latency_p99_ms': latencies.get('p99'),
+            'client_queue_mean_ms': pct([r['client_queue_ms'] for r in bucket]).get('mean'),
+        })
+    summary['timeline'] = timeline
+    return summary
+
+
+def print_table(results):
+    """打印多组配置的对比表"""
+    header = f"{'配置':<24}{'请求数':>8}{'错误率':>8}{'吞吐(rps)':>11}" + \
+             ''.join(f"{'p' + str(p) + '(ms)':>11}" for p in percentiles) + f"{'排队均值(ms)':>13}"
+    print(header)
+    print('-' * len(header))
+    for label, s in results:
+        latency = s['latency_ms']
+        queue_ms = s['server_queue_ms'].get('mean', s['client_queue_ms'].get('mean', 0.0))
+        print(f"{label:<24}{s['requests']:>8}{s['error_rate']:>8.2%}{s['throughput_rps']:>11.1f}" +
+              ''.join(f"{latency.get('p' + str(p), float('nan')):>11.1f}" for p in percentiles) +
+              f"{queue_ms:>13.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="推理服务负载生成与延迟/吞吐测试")
+    parser.add_argument('--url', default='http://127.0.0.1:8000/predict', help="推理服务地址")
+    parser.add_argument('--in-process', action='store_true', help="不经过HTTP，直接在进程内调用模型")
+    parser.add_argument('--model', default='./output/model/best_model.keras', help="进程内模式使用的模型路径")
+    parser.add_argument('--images', default=image_dir, help="回放的图片目录")
+    parser.add_argument('--qps', type=float, help="开环模式的目标QPS（不指定则为闭环并发模式）")
+    parser.add_argument('--concurrency', type=int, default=8, help="闭环模式的并发数")
+    parser.add_argument('--duration', type=float, default=30.0, help="测试时长(秒)")
+    parser.add_argument('--requests', type=int, help="最多发送的请求数")
+    parser.add_argument('--label', help="本次配置的名称（用于对比表）")
+    parser.add_argument('--output', help="结果JSON保存路径")
+    parser.add_argument('--compare', nargs='+', metavar='JSON', help="只对比已保存的结果文件")
+    args = parser.parse_args()
+
+    if args.compare:
+        results = []
+        for path in args.compare:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            results.append((data['config'].get('label') or os.path.basename(path), data['summary']))
+        print_table(results)
+        return
+
+    files = list_directory(args.images)
+    if not files:
+        print(f"在目录 {args.images} 中未找到图片文件")
+        exit(1)
+    payloads = []
+    for path in files:
+        with open(path, 'rb') as f:
+            payloads.append(f.read())
+
+    target = InProcessTarget(args.model, args.concurrency) if args.in_process else HttpTarget(args.url)
+    mode = f"开环 {args.qps} QPS" if args.qps else f"闭环 并发{args.concurrency}"
+    print(f"开始压测: {mode}, 时长 {args.duration}s, 图片 {len(payloads)} 张")
+    records = asyncio.run(run_load(target, payloads, qps=args.qps, concurrency=args.concurrency,
+                                   duration=args.duration, max_requests=args.requests))
+    summary = summarize(records)
+
+    config = {
+        'label': args.label or mode,
+        'target': 'in-process' if args.in_process else args.url,
+        'qps': args.qps,
+        'concurrency': args.concurrency,
+        'duration': args.duration,
+        'images': args.images,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'config': config, 'summary': summary}, f, ensure_ascii=False, indent=2)
+        print(f"结果已保存至: {args.output}")
+    print_table([(config['label'], summary)])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import os
+import time
+import numpy as np
+
+# 配置参数
+dataset_extensions = ('.png', '.jpg', '.jpeg', '.bmp', '.ppm', '.tif', '.tiff')  # 与flow_from_directory一致
+validation_split = 0.2  # 与train.py的ImageDataGenerator一致
+latency_runs = 30  # 单张延迟的测量次数（取中位数）
+throughput_batch = 16  # 吞吐量测试的批大小
+
+
+def list_dataset(data_dir, class_names, subset='validation', split=validation_split):
+    """按flow_from_directory的规则列出数据集图片，返回(路径列表, 类别编号数组)
+
+    每个类别的文件按名称排序，前split比例作为验证集、其余作为训练集，与train.py的划分完全一致；
+    类别编号按class_names（即模型输出顺序）确定，不在class_names中的子目录被跳过。
+    """
+    index = {name: i for i, name in enumerate(class_names)}
+    paths, labels = [], []
+    for name in sorted(os.listdir(data_dir)):
+        class_dir = os.path.join(data_dir, name)
+        if not os.path.isdir(class_dir) or name not in index:
+            continue
+        files = []
+        for root, _, names in sorted(os.walk(class_dir, followlinks=True), key=lambda x: x[0]):
+            files.extend(os.path.join(root, n) for n in sorted(names) if n.lower().endswith(dataset_extensions))
+        boundary = int(split * len(files))
+        selected = files[:boundary] if subset == 'validation' else files[boundary:]
+        paths.extend(selected)
+        labels.extend([index[name]] * len(selected))
+    return paths, np.asarray(labels, dtype=np.int32)
+
+
+def sample_per_class(paths, labels, limit, seed=0):
+    """每个类别最多保留limit张（None为全部），用于在CPU上缩短评估时间"""
+    if limit is None:
+        return paths, labels
+    rng = np.random.default_rng(seed)
+    keep = []
+    for idx in np.unique(labels):
+        members = np.flatnonzero(labels == idx)
+        keep.extend(rng.choice(members, min(limit, len(members)), replace=False))
+    keep = np.sort(keep)
+    return [paths[i] for i in keep], labels[keep]
+
+
+def evaluate(classifier, paths, labels, batch_size=32):
+    """在带标签的图片上评估，返回{'accuracy', 'per_class': {类别: 准确率}, 'probabilities'}"""
+    probabilities = []
+    for _, prediction in classifier.iter_predictions(paths, batch_size):
+        if 'error' in prediction:
+            probabilities.append(np.full(len(classifier.class_names), np.nan, dtype=np.float32))
+        else:
+            probabilities.append(prediction['probabilities'])
+    probabilities = np.stack(probabilities)
+    return summarize_accuracy(probabilities, labels, classifier.class_names)
+
+
+def summarize_accuracy(probabilities, labels, class_names):
+    """由概率矩阵和真实标签计算总体与逐类别准确率"""
+    valid = ~np.isnan(probabilities).any(axis=1)
+    predicted = np.argmax(np.nan_to_num(probabilities), axis=1)
+    correct = (predicted == labels) & valid
+    per_class = {}
+    for idx in np.unique(labels):
+        mask = (labels == idx) & valid
+        if mask.any():
+            name = class_names[idx] if idx < len(class_names) else str(idx)
+            per_class[name] = float(correct[mask].mean())
+    return {'accuracy': float(correct[valid].mean()) if valid.any() else 0.0, 'per_class': per_class,
+            'probabilities': probabilities}
+
+
+def measure_latency(classifier, runs=latency_runs, batch=throughput_batch, seed=0):
+    """测量CPU推理速度：单张图片延迟（中位数，毫秒）与批量吞吐量（张/秒）
+
+    使用随机的img_size大小输入，排除解码耗时，只比较模型本身。
+    """
+    rng = np.random.default_rng(seed)
+    shape = (classifier.img_size[0], classifier.img_size[1], 3)
+    single = classifier.preprocess(rng.integers(0, 256, shape, dtype=np.uint8))[np.newaxis]
+    batched = np.stack([classifier.preprocess(rng.integers(0, 256, shape, dtype=np.uint8)) for _ in range(batch)])
+    for _ in range(3):  # 预热：图追踪与内存分配
+        classifier.predict_batch(single)
+    classifier.predict_batch(batched)
+
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        classifier.predict_batch(single)
+        timings.append(time.perf_counter() - started)
+    batch_runs = max(3, runs // 5)
+    started = time.perf_counter()
+    for _ in range(batch_runs):
+        classifier.predict_batch(batched)
+    elapsed = time.perf_counter() - started
+    return {'latency_ms': float(np.median(timings) * 1000), 'latency_p90_ms': float(np.percentile(timings, 90) * 1000),
+            'throughput_ips': batch * batch_runs / elapsed}
+
+
+def model_size(path, model=None):
+    """模型文件大小（MB）与参数量；model给出时额外统计非零参数量（剪枝后有效）"""
+    info = {'file_mb': os.path.getsize(path) / 1024 / 1024}
+    if model is not None:
+        weights = model.get_weights()
+        info['params'] = int(sum(w.size for w in weights))
+        info['nonzero_params'] = int(sum(np.count_nonzero(w) for w in weights))
+    return info
+
+
+def print_comparison(rows, keys=('accuracy', 'latency_ms', 'throughput_ips', 'file_mb', 'params')):
+    """打印对比表，rows为[(名称, 指标字典), ...]"""
+    labels = {'accuracy': '准确率', 'latency_ms': '单张延迟(ms)', 'throughput_ips': '吞吐量(张/秒)',
+              'file_mb': '文件大小(MB)', 'gzip_mb': '压缩后(MB)', 'params': '参数量', 'nonzero_params': '非零参数量'}
+    print(f"{'模型':<20}" + ''.join(f"{labels.get(k, k):>16}" for k in keys))
+    for name, metrics in rows:
+        cells = []
+        for key in keys:
+            value = metrics.get(key)
+            if value is None:
+                cells.append(f"{'-':>16}")
+            elif isinstance(value, float):
+                cells.append(f"{value:>16.4f}" if key == 'accuracy' else f"{value:>16.2f}")
+            else:
+                cells.append(f"{value:>16,}")
+        print(f"{name:<20}" + ''.join(cells))
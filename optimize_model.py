@@ -0,0 +1,328 @@
+import os
+import csv
+import gzip
+import argparse
+from datetime import datetime
+import numpy as np
+import tensorflow as tf
+from tensorflow.keras.models import load_model, Model
+from tensorflow.keras.layers import (Dense, BatchNormalization, Dropout, Lambda, GlobalAveragePooling2D, Conv2D,
+                                     DepthwiseConv2D)
+from tensorflow.keras.callbacks import Callback
+
+from animal_classifier import AnimalClassifier, cast_to_float32, load_class_names
+from distill import make_dataset
+from model_report import list_dataset, sample_per_class, evaluate, measure_latency, model_size, print_comparison
+from progress_store import atomic_write_json
+from backbones import BACKBONES
+
+# 配置参数
+data_dir = '/kaggle/input/animals/Animal/Animal'  # 数据集路径（与train.py相同）
+model_path = './output/model/best_model.keras'  # 待优化的模型
+output_path = './output/model/best_model_optimized.keras'  # 优化后模型的保存路径
+class_names_path = 'class.txt'
+img_size = None  # 输入尺寸（None时使用模型自身的输入尺寸）
+head_prune_ratio = 0.5  # 分类头1024/512两个隐藏层各裁掉的神经元比例（结构化剪枝，真正变小）
+backbone_prune_layers = None  # 做幅值剪枝的主干层名前缀（None时按模型的主干从backbones.py中选取）
+backbone_sparsity = 0.5  # 上述层卷积核的目标稀疏度
+clusters = 16  # 权重聚类的簇数（0为不聚类）；聚类后每个权重只需4bit索引，压缩后明显变小
+fine_tune_epochs = 2  # 剪枝后的短微调轮数（0为不微调）
+fine_tune_steps = None  # 每轮步数（None为完整一轮）
+fine_tune_lr = 1e-5
+batch_size = 12
+eval_per_class = None  # 评估时每个类别最多使用的验证图片数（None为全部）
+
+
+# ---- 分类头结构化剪枝 ----
+
+def head_structure(model):
+    """按create_model的结构解析分类头：返回(GAP层, [(Dense, BN, Dropout比率), ...], 最终Dense)"""
+    gap_index = next(i for i, layer in enumerate(model.layers) if isinstance(layer, GlobalAveragePooling2D))
+    blocks, final = [], None
+    for layer in model.layers[gap_index + 1:]:
+        if isinstance(layer, Dense):
+            blocks.append([layer, None, 0.0])
+        elif isinstance(layer, BatchNormalization) and blocks:
+            blocks[-1][1] = layer
+        elif isinstance(layer, Dropout) and blocks:
+            blocks[-1][2] = layer.rate
+    final = blocks.pop()[0]
+    return model.layers[gap_index], blocks, final
+
+
+def prune_head(model, ratio=head_prune_ratio):
+    """结构化剪枝分类头的隐藏层，返回新模型与各层保留的神经元数
+
+    神经元重要性 = 下一层对应输入权重的L1范数 × BN缩放系数|gamma/sqrt(var+eps)|；
+    被裁掉的神经元按其BN输出的期望值（约为beta）折算进下一层的偏置，剪枝后无需微调就接近原精度。
+    """
+    gap, blocks, final = head_structure(model)
+    weights = []  # 每个隐藏层: (kernel, bias, BN参数或None)
+    for dense, bn, _ in blocks:
+        kernel, bias = dense.get_weights()
+        weights.append([kernel, bias, bn.get_weights() if bn is not None else None])
+    final_kernel, final_bias = final.get_weights()
+
+    kept_units = []
+    for i, (kernel, bias, bn_weights) in enumerate(weights):
+        next_kernel = weights[i + 1][0] if i + 1 < len(weights) else final_kernel
+        scale = np.ones(kernel.shape[1], dtype=np.float32)
+        offset = np.zeros(kernel.shape[1], dtype=np.float32)
+        if bn_weights is not None:
+            gamma, beta, mean, var = bn_weights
+            scale = np.abs(gamma) / np.sqrt(var + 1e-3)
+            offset = beta
+        importance = np.abs(next_kernel).sum(axis=1) * scale
+        keep = np.sort(np.argsort(importance)[::-1][:max(1, int(round(kernel.shape[1] * (1 - ratio))))])
+        removed = np.setdiff1d(np.arange(kernel.shape[1]), keep)
+
+        # 被裁掉神经元的期望输出折算进下一层偏置
+        compensation = offset[removed] @ next_kernel[removed]
+        if i + 1 < len(weights):
+            weights[i + 1][1] = weights[i + 1][1] + compensation
+            weights[i + 1][0] = next_kernel[keep]
+        else:
+            final_bias = final_bias + compensation
+            final_kernel = next_kernel[keep]
+        weights[i][0], weights[i][1] = kernel[:, keep], bias[keep]
+        if bn_weights is not None:
+            weights[i][2] = [w[keep] for w in bn_weights]
+        kept_units.append(len(keep))
+
+    # 在主干输出上重建分类头（层的dtype策略沿用原模型，混合精度训练的模型保持一致）
+    x = gap.output
+    new_layers = []
+    for (dense, bn, rate), units in zip(blocks, kept_units):
+        new_dense = Dense(units, activation=dense.activation, kernel_regularizer=dense.kernel_regularizer,
+                          dtype=dense.dtype_policy, name=dense.name)
+        x = new_dense(x)
+        new_bn = None
+        if bn is not None:
+            new_bn = BatchNormalization(dtype=bn.dtype_policy, name=bn.name)
+            x = new_bn(x)
+        x = Dropout(rate)(x)
+        new_layers.append((new_dense, new_bn))
+    x = Lambda(cast_to_float32, name='cast_to_float32')(x)
+    new_final = Dense(final_kernel.shape[1], activation='softmax', dtype='float32', name=final.name)
+    outputs = new_final(x)
+    pruned = Model(inputs=model.inputs, outputs=outputs, name=model.name)
+
+    for (new_dense, new_bn), (kernel, bias, bn_weights) in zip(new_layers, weights):
+        new_dense.set_weights([kernel, bias])
+        if new_bn is not None:
+            new_bn.set_weights(bn_weights)
+    new_final.set_weights([final_kernel, final_bias])
+    return pruned, kept_units
+
+
+# ---- 主干幅值剪枝 ----
+
+def prunable_layers(model, prefixes=backbone_prune_layers):
+    """按层名前缀选出要做幅值剪枝的卷积层；prefixes为None时使用backbones.py中第一个能匹配上的主干的前缀"""
+
+    def select(candidates):
+        return [layer for layer in model.layers
+                if isinstance(layer, (Conv2D, DepthwiseConv2D)) and layer.name.startswith(tuple(candidates))]
+
+    if prefixes is not None:
+        layers = select(prefixes)
+    else:
+        layers = next((found for found in (select(spec['prune']) for spec in BACKBONES.values()) if found), [])
+    if not layers:
+        raise ValueError(f"没有找到可剪枝的主干层（前缀: {prefixes or '按backbones.py自动选择'}），"
+                         f"请通过backbone_prune_layers指定")
+    return layers
+
+
+def magnitude_mask(kernel, sparsity):
+    """按绝对值把最小的sparsity比例权重置零的掩码"""
+    if sparsity <= 0:
+        return np.ones_like(kernel, dtype=bool)
+    threshold = np.quantile(np.abs(kernel), sparsity)
+    return np.abs(kernel) > threshold
+
+
+class MagnitudePruning(Callback):
+    """不依赖tfmot的幅值剪枝（tfmot不支持Keras 3）
+
+    稀疏度按多项式曲线从0增长到目标值（前2/3的训练步内，与tfmot的PolynomialDecay相同），
+    每update_every步按当前权重重新计算掩码，每步结束后把被剪掉的权重重新置零。
+    训练结束后模型里只剩普通层和已经为零的权重，不需要额外的strip步骤。
+    """
+
+    def __init__(self, layers, target_sparsity, total_steps, update_every=50):
+        super().__init__()
+        self.prune_layers = layers
+        self.target = target_sparsity
+        self.end_step = max(1, int(total_steps * 2 / 3))
+        self.update_every = update_every
+        self.masks = {}
+        self.step = 0
+
+    def sparsity_at(self, step):
+        progress = min(1.0, step / self.end_step)
+        return self.target * (1 - (1 - progress) ** 3)
+
+    def apply(self, update_masks):
+        sparsity = self.sparsity_at(self.step)
+        for layer in self.prune_layers:
+            kernel_var = layer.depthwise_kernel if isinstance(layer, DepthwiseConv2D) else layer.kernel
+            kernel = kernel_var.numpy()
+            if update_masks or layer.name not in self.masks:
+                self.masks[layer.name] = magnitude_mask(kernel, sparsity)
+            kernel_var.assign(kernel * self.masks[layer.name])
+
+    def on_train_batch_end(self, batch, logs=None):
+        self.step += 1
+        # 达到目标稀疏度之后掩码固定，只重新置零
+        self.apply(self.step <= self.end_step and (self.step % self.update_every == 0 or self.step == self.end_step))
+
+    def on_train_end(self, logs=None):
+        # 确保最终达到目标稀疏度
+        self.step = max(self.step, self.end_step)
+        self.apply(True)
+
+
+def fine_tune(model, layers, sparsity=backbone_sparsity, data_dir=data_dir, epochs=fine_tune_epochs,
+              steps=fine_tune_steps):
+    """边剪枝边短微调：冻结被剪枝层之前的主干（BN保持推理模式），只训练剪枝涉及的层和分类头"""
+    class_names = load_class_names(class_names_path)
+    paths, labels = list_dataset(data_dir, class_names, 'training')
+    targets = np.eye(len(class_names), dtype=np.float32)[labels]
+    dataset = make_dataset(paths, targets, img_size or model.input_shape[1:3], batch_size).repeat()
+    steps_per_epoch = steps or int(np.ceil(len(paths) / batch_size))
+
+    first_trainable = min([model.layers.index(layer) for layer in layers] +
+                          [model.layers.index(head_structure(model)[0])])
+    for i, layer in enumerate(model.layers):
+        layer.trainable = i >= first_trainable and not isinstance(layer, BatchNormalization)
+    optimizer = tf.keras.optimizers.Adam(learning_rate=fine_tune_lr)
+    if any(layer.dtype_policy.name == 'mixed_float16' for layer in model.layers):
+        # 重建时的全局策略是float32，Keras不会自动加损失缩放；float16梯度需要手动包装以免下溢
+        optimizer = tf.keras.mixed_precision.LossScaleOptimizer(optimizer)
+    model.compile(optimizer=optimizer, loss='categorical_crossentropy', metrics=['accuracy'])
+    pruning = MagnitudePruning(layers, sparsity, total_steps=epochs * steps_per_epoch)
+    model.fit(dataset, epochs=epochs, steps_per_epoch=steps_per_epoch, callbacks=[pruning], verbose=1)
+
+
+# ---- 权重聚类 ----
+
+def cluster_weights(kernel, n_clusters=clusters, iters=20):
+    """一维k-means把权重量化为n_clusters个共享值（线性初始化，零权重保持为零以保留稀疏性）"""
+    nonzero = kernel != 0
+    values = kernel[nonzero]
+    if values.size <= n_clusters:
+        return kernel
+    centroids = np.linspace(values.min(), values.max(), n_clusters)
+    for _ in range(iters):
+        # 质心排序后按相邻中点划分区间，比逐点求距离快得多
+        centroids.sort()
+        assignment = np.searchsorted((centroids[1:] + centroids[:-1]) / 2, values)
+        sums = np.bincount(assignment, weights=values, minlength=n_clusters)
+        counts = np.bincount(assignment, minlength=n_clusters)
+        centroids = np.where(counts > 0, sums / np.maximum(counts, 1), centroids)
+    centroids.sort()
+    clustered = np.zeros_like(kernel)
+    clustered[nonzero] = centroids[np.searchsorted((centroids[1:] + centroids[:-1]) / 2, values)]
+    return clustered
+
+
+def apply_clustering(model, layers, n_clusters=clusters):
+    for layer in layers:
+        kernel_var = layer.depthwise_kernel if isinstance(layer, DepthwiseConv2D) else layer.kernel
+        kernel_var.assign(cluster_weights(kernel_var.numpy(), n_clusters).astype(kernel_var.dtype))
+
+
+def gzip_size_mb(path):
+    """gzip压缩后的大小：稀疏和聚类后的权重在下载/部署时才体现出体积优势"""
+    with open(path, 'rb') as f:
+        return len(gzip.compress(f.read(), compresslevel=6)) / 1024 / 1024
+
+
+def report_model(path, val_paths, val_labels):
+    """在CPU上测量准确率、延迟与大小"""
+    with tf.device('/CPU:0'):
+        classifier = AnimalClassifier(path, class_names_path, img_size)
+        metrics = evaluate(classifier, val_paths, val_labels)
+        metrics.update(measure_latency(classifier))
+        metrics.update(model_size(path, classifier.float_model))
+    metrics['gzip_mb'] = gzip_size_mb(path)
+    return metrics
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="结构化剪枝、幅值剪枝与权重聚类，导出更小更快的模型")
+    parser.add_argument('--model', default=model_path, help="待优化的模型")
+    parser.add_argument('--output', default=output_path, help="优化后模型的保存路径")
+    parser.add_argument('--data-dir', default=data_dir, help="数据集路径（微调与评估）")
+    parser.add_argument('--head-ratio', type=float, default=head_prune_ratio, help="分类头隐藏层裁掉的比例")
+    parser.add_argument('--sparsity', type=float, default=backbone_sparsity, help="主干选定层的目标稀疏度")
+    parser.add_argument('--clusters', type=int, default=clusters, help="权重聚类簇数（0为不聚类）")
+    parser.add_argument('--epochs', type=int, default=fine_tune_epochs, help="微调轮数（0为不微调）")
+    parser.add_argument('--steps', type=int, default=fine_tune_steps, help="每轮微调步数")
+    parser.add_argument('--eval-per-class', type=int, default=eval_per_class, help="每类最多评估的验证图片数")
+    args = parser.parse_args()
+
+    class_names = load_class_names(class_names_path)
+    val_paths, val_labels = list_dataset(args.data_dir, class_names, 'validation')
+    val_paths, val_labels = sample_per_class(val_paths, val_labels, args.eval_per_class)
+    print(f"评估样本数: {len(val_paths)}")
+
+    print("正在评估原模型...")
+    before = report_model(args.model, val_paths, val_labels)
+
+    model = load_model(args.model, compile=False, custom_objects={'cast_to_float32': cast_to_float32})
+    model, kept_units = prune_head(model, args.head_ratio)
+    print(f"分类头结构化剪枝完成，隐藏层神经元数: {kept_units}")
+
+    layers = prunable_layers(model)
+    if args.epochs > 0:
+        fine_tune(model, layers, args.sparsity, args.data_dir, args.epochs, args.steps)
+    else:
+        MagnitudePruning(layers, args.sparsity, total_steps=1).on_train_end()  # 不微调时一次性剪到目标稀疏度
+    print(f"主干幅值剪枝完成：{len(layers)} 层，目标稀疏度 {args.sparsity:.0%}")
+
+    if args.clusters:
+        _, blocks, final = head_structure(model)
+        apply_clustering(model, layers + [dense for dense, _, _ in blocks] + [final], args.clusters)
+        print(f"权重聚类完成：每层 {args.clusters} 个共享值")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    model.save(args.output)
+    print(f"优化后的模型已保存至: {args.output}")
+
+    print("正在评估优化后的模型...")
+    after = report_model(args.output, val_paths, val_labels)
+
+    print("\n优化前后对比（CPU）:")
+    print_comparison([('original', before), ('optimized', after)],
+                     keys=('accuracy', 'latency_ms', 'throughput_ips', 'file_mb', 'gzip_mb', 'nonzero_params'))
+
+    # 逐类别准确率变化，按下降幅度排序
+    per_class_path = os.path.splitext(args.output)[0] + '.per_class.csv'
+    rows = sorted(((name, before['per_class'].get(name), after['per_class'].get(name)) for name in class_names
+                   if name in before['per_class']), key=lambda r: (r[2] or 0) - (r[1] or 0))
+    with open(per_class_path, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.writer(f)
+        writer.writerow(['class', 'accuracy_before', 'accuracy_after', 'delta'])
+        for name, acc_before, acc_after in rows:
+            writer.writerow([name, acc_before, acc_after, (acc_after or 0) - (acc_before or 0)])
+    print("下降最多的类别:")
+    for name, acc_before, acc_after in rows[:5]:
+        after_text = f"{acc_after:.2%}" if acc_after is not None else "无样本"
+        print(f"  {name}: {acc_before:.2%} -> {after_text}")
+
+    report = {
+        'created': datetime.now().isoformat(),
+        'model': args.model,
+        'output': args.output,
+        'head_units': kept_units,
+        'backbone_layers': [layer.name for layer in layers],
+        'backbone_sparsity': args.sparsity,
+        'clusters': args.clusters,
+        'fine_tune_epochs': args.epochs,
+        'before': {k: v for k, v in before.items() if k != 'probabilities'},
+        'after': {k: v for k, v in after.items() if k != 'probabilities'},
+    }
+    atomic_write_json(os.path.splitext(args.output)[0] + '.report.json', report)
+    print(f"逐类别结果: {per_class_path}")
@@ -0,0 +1,106 @@
+import os
+import time
+import numpy as np
+import tensorflow as tf
+
+# 配置参数
+cpuinfo_path = '/proc/cpuinfo'
+bf16_cpu_flags = frozenset({'avx512_bf16', 'amx_bf16'})  # CPU原生支持bfloat16计算的指令集标志
+probe_img_size = (64, 64)  # 启动探测用的输入尺寸（只比较相对速度，尽量短）
+probe_batch = 8
+probe_steps = 5
+fallback_margin = 1.25  # float32需比候选策略快25%以上才推翻按设备的选择（小网络的计时受启动开销影响）
+policy_env = 'ANIMAL_PRECISION'  # 设置该环境变量（如float32）可跳过自动选择
+
+
+def cpu_flags(path=cpuinfo_path):
+    """读取CPU指令集标志；非Linux或读取失败时返回空集合"""
+    try:
+        with open(path, encoding='utf-8', errors='ignore') as f:
+            for line in f:
+                if line.startswith('flags'):
+                    return set(line.split(':', 1)[1].split())
+    except OSError:
+        pass
+    return set()
+
+
+def detect_policy():
+    """按设备给出候选精度策略，返回(策略名, 原因)
+
+    GPU上使用mixed_float16（Tensor Core）；CPU支持AVX512-BF16/AMX时使用mixed_bfloat16；
+    其他CPU上float16/bfloat16都是软件模拟，比float32更慢，使用float32。
+    """
+    gpus = tf.config.list_physical_devices('GPU')
+    if gpus:
+        details = tf.config.experimental.get_device_details(gpus[0])
+        return 'mixed_float16', f"GPU {details.get('device_name', gpus[0].name)}"
+    supported = sorted(bf16_cpu_flags & cpu_flags())
+    if supported:
+        return 'mixed_bfloat16', f"CPU支持 {', '.join(supported)}"
+    return 'float32', "CPU不支持bfloat16指令"
+
+
+def probe_step_time(policy, img_size=probe_img_size, batch=probe_batch, steps=probe_steps):
+    """在指定策略下训练一个小卷积网络，返回单步训练耗时的中位数（毫秒）
+
+    结构与分类模型相同（卷积 + BN + GAP + float32输出），只用于比较不同策略在当前设备上的相对速度。
+    """
+    from tensorflow.keras import Input, Model
+    from tensorflow.keras.layers import Conv2D, BatchNormalization, GlobalAveragePooling2D, Dense
+
+    previous = tf.keras.mixed_precision.global_policy().name
+    tf.keras.mixed_precision.set_global_policy(policy)
+    try:
+        inputs = Input(shape=(img_size[0], img_size[1], 3))
+        x = inputs
+        for filters in (32, 64, 128):
+            x = Conv2D(filters, 3, strides=2, padding='same', activation='relu')(x)
+            x = BatchNormalization()(x)
+        x = GlobalAveragePooling2D()(x)
+        outputs = Dense(10, activation='softmax', dtype=tf.float32)(x)
+        model = Model(inputs, outputs)
+        model.compile(optimizer='adam', loss='sparse_categorical_crossentropy')
+
+        rng = np.random.default_rng(0)
+        images = rng.random((batch, img_size[0], img_size[1], 3), dtype=np.float32)
+        labels = rng.integers(0, 10, batch)
+        model.train_on_batch(images, labels)  # 预热：图追踪与内存分配
+        timings = []
+        for _ in range(steps):
+            started = time.perf_counter()
+            model.train_on_batch(images, labels)
+            timings.append(time.perf_counter() - started)
+        return float(np.median(timings) * 1000)
+    finally:
+        tf.keras.mixed_precision.set_global_policy(previous)
+
+
+def select_policy(policy='auto', probe=True):
+    """选择并设置全局精度策略，返回选择报告{'policy', 'reason', 'step_ms'}
+
+    policy为'auto'时按设备选择候选策略；probe=True时再与float32各跑几步比较，只有float32明显更快
+    （超过fallback_margin，例如旧GPU没有Tensor Core、CPU虽有标志但bfloat16内核更慢）才退回float32，
+    持平时保留按设备的选择。环境变量ANIMAL_PRECISION优先。
+    """
+    policy = os.environ.get(policy_env, policy)
+    manual = policy != 'auto'
+    if manual:
+        reason = "手动指定"
+    else:
+        policy, reason = detect_policy()
+
+    step_ms = {}
+    if probe:
+        step_ms[policy] = probe_step_time(policy)
+        if policy != 'float32':
+            step_ms['float32'] = probe_step_time('float32')
+            if not manual and step_ms['float32'] * fallback_margin < step_ms[policy]:
+                reason += "，但实测明显慢于float32"
+                policy = 'float32'
+
+    tf.keras.mixed_precision.set_global_policy(policy)
+    report = {'policy': policy, 'reason': reason, 'step_ms': step_ms}
+    timing = '，'.join(f"{name} {ms:.1f}ms/步" for name, ms in step_ms.items())
+    print(f"精度策略: {policy}（{reason}）" + (f"；探测: {timing}" if timing else ""))
+    return report
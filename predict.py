@@ -1,118 +1,103 @@
 import os
-import numpy as np
-import tensorflow as tf
-from tensorflow.keras.preprocessing import image
-from tensorflow.keras.models import load_model
-import pandas as pd
+import csv
+from animal_classifier import AnimalClassifier
+from prediction_writer import open_writer
+from image_sources import is_archive, iter_sources
+from prefilter import PreFilter, print_report
+from tta import iter_tta_predictions
 
 # 禁用GPU（确保使用CPU）
 os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
 
 # 配置参数
 model_path = './output/model/best_model.keras'  # 替换为你的模型路径
-image_dir = 'test'  # 替换为你的图片目录路径
-output_csv = 'predictions.csv'  # 预测结果保存路径
-img_size = (456, 456)  # 与训练时相同的尺寸
+image_dir = 'test'  # 替换为你的图片目录路径，也可以是tar/tar.gz/zip压缩包（不解压，直接流式读取）
+output_path = 'predictions.csv'  # 预测结果保存路径（扩展名为.parquet时输出Parquet）
+save_probabilities = False  # 是否保存每张图片完整的类别概率向量（仅Parquet）
+img_size = None  # 输入尺寸（None时使用模型自身的输入尺寸）
 class_names_path = 'class.txt'  # 类别名称文件路径（可选）
-
-# 定义Lambda层使用的函数
-def cast_to_float32(x):
-    return tf.cast(x, tf.float32)
+batch_size = 16  # 每次前向推理的图片数量
+decode_backend = 'pil-draft'  # 图片解码后端：pil-draft / opencv / pil（见image_decode.py）
+uint8_input = True  # 向模型传入uint8图片，缩放与归一化在计算图内完成（见export_model.py）
+use_prefilter = False  # 预筛选：空白/损坏/过暗/过曝图片不送入模型（阈值见prefilter.py）
+skipped_csv = 'skipped.csv'  # 被预筛选跳过的图片及原因
+use_tta = False  # 测试时增强：翻转/裁剪/多尺度视图批量推理后取平均（视图列表见tta.py）
+tta_low_confidence = None  # 只对原图置信度低于该值的图片做TTA，例如0.6（None表示全部都做）
 
 # 加载模型
 print("正在加载模型...")
 try:
-    custom_objects = {'cast_to_float32': cast_to_float32}
-    model = load_model(model_path, compile=False, custom_objects=custom_objects)
-    model.compile(optimizer='adam', loss='categorical_crossentropy', metrics=['accuracy'])
+    classifier = AnimalClassifier(model_path, class_names_path, img_size, top_k=3,
+                                  decode_backend=decode_backend, uint8_input=uint8_input)
     print("模型加载成功！")
-    model.summary()
+    classifier.model.summary()
 except Exception as e:
     print(f"模型加载失败: {str(e)}")
     exit(1)
 
-# 加载类别名称（如果可用）
-if os.path.exists(class_names_path):
-    with open(class_names_path, 'r') as f:
-        class_names = [line.strip() for line in f.readlines()]
-    print(f"已加载 {len(class_names)} 个类别名称")
+# 类别名称（如果可用）
+if classifier.class_names:
+    print(f"已加载 {len(classifier.class_names)} 个类别名称")
 else:
-    class_names = None
     print("未找到类别名称文件，将使用数字标签")
 
-# 支持的图片格式
-image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.gif']
-
-# 获取图片文件列表
-image_files = []
-for root, _, files in os.walk(image_dir):
-    for file in files:
-        if any(file.lower().endswith(ext) for ext in image_extensions):
-            image_files.append(os.path.join(root, file))
-
-if not image_files:
-    print(f"在目录 {image_dir} 中未找到图片文件")
-    exit(1)
-
-print(f"找到 {len(image_files)} 张待预测图片")
+# 获取图片列表：目录先列出全部文件；压缩包边读边预测，总数未知
+if is_archive(image_dir):
+    image_files = iter_sources(image_dir)
+    total = None
+    print(f"从压缩包 {image_dir} 中流式读取图片")
+else:
+    image_files = list(iter_sources(image_dir))
+    total = len(image_files)
+    if not image_files:
+        print(f"在目录 {image_dir} 中未找到图片文件")
+        exit(1)
+    print(f"找到 {total} 张待预测图片")
 
-# 创建结果列表
-results = []
+# 结果按行增量写出，不在内存中累积
+writer = open_writer(output_path, classifier.class_names, top_k=3, include_probabilities=save_probabilities)
+preview = []
+prefilter = PreFilter() if use_prefilter else None
+if prefilter is not None:
+    skipped_file = open(skipped_csv, 'w', newline='', encoding='utf-8-sig')
+    skipped_writer = csv.writer(skipped_file)
+    skipped_writer.writerow(['file_path', 'reason'])
 
-# 批量处理图片
-for i, img_path in enumerate(image_files):
-    # 加载和预处理图片
-    img = image.load_img(img_path, target_size=img_size)
-    img_array = image.img_to_array(img) / 255.0
-    img_array = np.expand_dims(img_array, axis=0)  # 添加批次维度
-    
-    # 预测
-    predictions = model.predict(img_array, verbose=0)[0]
-    top_idx = np.argmax(predictions)
-    confidence = predictions[top_idx]
-    
-    # 获取类别名称
-    if class_names and len(class_names) > top_idx:
-        predicted_class = class_names[top_idx]
-    else:
-        predicted_class = str(top_idx)
-    
-    # 获取top3预测结果
-    top3_indices = np.argsort(predictions)[::-1][:3]
-    top3_classes = []
-    top3_confidences = []
-    
-    for idx in top3_indices:
-        if class_names and len(class_names) > idx:
-            top3_classes.append(class_names[idx])
-        else:
-            top3_classes.append(str(idx))
-        top3_confidences.append(float(predictions[idx]))
-    
-    # 添加到结果
-    result = {
-        'file_path': img_path,
-        'predicted_class': predicted_class,
-        'confidence': confidence,
-        'top1_class': top3_classes[0],
-        'top1_confidence': top3_confidences[0],
-        'top2_class': top3_classes[1],
-        'top2_confidence': top3_confidences[1],
-        'top3_class': top3_classes[2],
-        'top3_confidence': top3_confidences[2]
-    }
+# 批量处理图片（解码与推理流水线并行）
+if use_tta:
+    predictions = iter_tta_predictions(classifier, image_files, low_confidence=tta_low_confidence,
+                                       prefilter=prefilter)
+else:
+    predictions = classifier.iter_predictions(image_files, batch_size, prefilter)
+for i, (img_path, prediction) in enumerate(predictions):
+    if 'skipped' in prediction:
+        skipped_writer.writerow([img_path, prediction['skipped']])
+        continue
+    if 'error' in prediction:
+        print(f"图片处理失败 {img_path}: {prediction['error']}")
+        continue
     
-    results.append(result)
+    # 写入top3预测结果
+    writer.write(img_path, prediction)
+    if len(preview) < 5:
+        preview.append((img_path, prediction['predicted_class'], prediction['confidence']))
     
     # 打印进度
-    if (i + 1) % 10 == 0 or (i + 1) == len(image_files):
-        print(f"已处理 {i+1}/{len(image_files)} 张图片")
+    if (i + 1) % 10 == 0 or (i + 1) == total:
+        print(f"已处理 {i+1}/{total or '?'} 张图片")
 
-# 保存结果到CSV
-df = pd.DataFrame(results)
-df.to_csv(output_csv, index=False, encoding='utf-8-sig')  # 使用utf-8-sig支持中文
+writer.close()
+if prefilter is not None:
+    skipped_file.close()
 
-print(f"\n预测完成！结果已保存至: {output_csv}")
+print(f"\n预测完成！共 {writer.rows_written} 条结果已保存至: {output_path}")
 print("="*50)
 print("结果预览:")
-print(df[['file_path', 'predicted_class', 'confidence']].head())
\ No newline at end of file
+for img_path, predicted_class, confidence in preview:
+    print(f"{img_path}  {predicted_class}  {confidence:.4f}")
+
+if prefilter is not None:
+    print("="*50)
+    model_seconds = classifier.inference_seconds / classifier.inference_images if classifier.inference_images else None
+    print_report(prefilter.report(model_seconds))
+    print(f"跳过的图片及原因已保存至: {skipped_csv}")
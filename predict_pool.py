@@ -0,0 +1,223 @@
+import os
+import time
+import argparse
+import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy as np
+from prediction_writer import prediction_row, open_writer
+from image_sources import list_sources, open_source
+
+# 配置参数
+model_path = './output/model/best_model.keras'  # 模型路径
+image_dir = 'test'  # 图片目录路径，或zip/无压缩tar压缩包（按索引随机读取成员分给各进程）
+output_path = 'predictions.csv'  # 预测结果保存路径（扩展名为.parquet时输出Parquet）
+img_size = None  # 输入尺寸（None时使用模型自身的输入尺寸）
+class_names_path = 'class.txt'  # 类别名称文件路径（可选）
+batch_size = 16  # 每个进程每次前向推理的图片数量
+chunk_batches = 2  # 每个工作块包含的批次数（块越小负载越均衡，调度开销越大）
+decode_backend = 'pil-draft'  # 图片解码后端（见image_decode.py）
+weight_alignment = 64  # 共享内存中每个权重的起始偏移对齐字节数（对齐后TensorFlow可直接引用，不再复制）
+
+# 每个工作进程在初始化时构建自己的模型结构，权重引用父进程放入共享内存的同一份数据
+_classifier = None
+_shared_block = None
+
+
+def share_weights(model_path):
+    """父进程只加载一次模型，把全部权重复制进一块共享内存，返回(共享内存块, 模型描述)
+
+    模型描述包含结构(JSON)和每个权重在共享内存中的(偏移, 形状, dtype)，可以直接传给spawn出的子进程。
+    """
+    from tensorflow.keras.models import load_model
+    from animal_classifier import cast_to_float32
+
+    model = load_model(model_path, compile=False, custom_objects={'cast_to_float32': cast_to_float32})
+    weights = model.get_weights()
+    layout, offset = [], 0
+    for weight in weights:
+        offset = -(-offset // weight_alignment) * weight_alignment
+        layout.append((offset, weight.shape, weight.dtype.str))
+        offset += weight.nbytes
+    block = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+    for weight, (start, shape, dtype) in zip(weights, layout):
+        np.ndarray(shape, dtype, buffer=block.buf, offset=start)[...] = weight
+    spec = {'name': block.name, 'config': model.to_json(), 'layout': layout, 'nbytes': offset}
+    del model, weights
+    return block, spec
+
+
+def attach_model(spec):
+    """在子进程中按结构重建模型并引用共享内存中的权重，返回(模型, state_mapping)
+
+    set_weights会把权重复制进每个进程自己的变量；这里在StatelessScope中构建模型，变量保持未初始化、
+    不分配内存，推理时再用state_mapping把变量映射到共享内存上的零拷贝张量。
+    """
+    global _shared_block
+    import tensorflow as tf
+    from animal_classifier import cast_to_float32
+
+    _shared_block = shared_memory.SharedMemory(name=spec['name'])  # 保持引用，进程存活期间映射有效
+    with tf.keras.StatelessScope(initialize_variables=False):
+        model = tf.keras.models.model_from_json(spec['config'], custom_objects={'cast_to_float32': cast_to_float32})
+    values = [tf.convert_to_tensor(np.ndarray(shape, dtype, buffer=_shared_block.buf, offset=start))
+              for start, shape, dtype in spec['layout']]
+    return model, list(zip(model.weights, values))
+
+
+def load_classifier(spec, decode_backend):
+    from animal_classifier import AnimalClassifier
+
+    model, state_mapping = attach_model(spec)
+    # 子进程已有多个，单进程内不再开多个解码线程
+    return AnimalClassifier(class_names_path=class_names_path, img_size=img_size, top_k=3, decode_workers=1,
+                            decode_backend=decode_backend, model=model, state_mapping=state_mapping)
+
+
+def _init_worker(spec, decode_backend):
+    """子进程（spawn）中构建模型并接入共享权重：父进程不fork已初始化的TensorFlow，避免死锁"""
+    global _classifier
+    _classifier = load_classifier(spec, decode_backend)
+
+
+def _predict_chunk(args):
+    index, paths = args
+    rows, errors = [], []
+
+    def items():
+        # 读取压缩包成员失败时记为该图片的错误，不中断整个imap
+        for path in paths:
+            try:
+                yield open_source(path)
+            except Exception as e:
+                errors.append((path, str(e)))
+
+    for path, prediction in _classifier.iter_predictions(items(), batch_size):
+        if 'error' in prediction:
+            errors.append((path, prediction['error']))
+            continue
+        rows.append(prediction_row(path, prediction))
+    return index, os.getpid(), rows, errors
+
+
+def read_memory(pid):
+    """读取进程的RSS与PSS(KB)；PSS按共享页面的进程数均摊，求和即为实际占用的物理内存"""
+    values = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup', 'r') as f:
+            for line in f:
+                key, _, rest = line.partition(':')
+                if key in ('Rss', 'Pss'):
+                    values[key.lower()] = int(rest.split()[0])
+    except OSError:
+        pass
+    return values
+
+
+def memory_snapshot(pids):
+    per_process = {pid: read_memory(pid) for pid in pids}
+    return {
+        'rss_mb': sum(m.get('rss', 0) for m in per_process.values()) / 1024,
+        'pss_mb': sum(m.get('pss', 0) for m in per_process.values()) / 1024,
+    }
+
+
+def run_pool(image_files, workers, start_method='spawn', chunk_size=None, writer=None):
+    """用workers个进程预测image_files，按输入顺序返回(结果行, 错误列表, 统计信息)
+
+    传入writer时结果按块顺序直接写出，不再在内存中累积（返回的结果行为空）。
+    """
+    chunk_size = chunk_size or batch_size * chunk_batches
+    chunks = [(i, image_files[i:i + chunk_size]) for i in range(0, len(image_files), chunk_size)]
+
+    block, spec = share_weights(model_path)
+    context = mp.get_context(start_method)
+    rows, errors = [], []
+    peak = {'rss_mb': 0.0, 'pss_mb': 0.0}
+    worker_images = {}
+    single_process = {}
+    started = time.perf_counter()
+    parent = read_memory(os.getpid())  # 父进程加载模型并写入共享内存后的占用
+    pool = context.Pool(workers, initializer=_init_worker, initargs=(spec, decode_backend))
+    try:
+        done = 0
+        # imap按提交顺序返回结果；chunksize=1让空闲进程随时领取下一块，实现动态负载均衡
+        for index, pid, chunk_rows, chunk_errors in pool.imap(_predict_chunk, chunks, chunksize=1):
+            if writer is not None:
+                for row in chunk_rows:
+                    writer.write_row(row)
+            else:
+                rows.extend(chunk_rows)
+            errors.extend(chunk_errors)
+            worker_images[pid] = worker_images.get(pid, 0) + len(chunk_rows) + len(chunk_errors)
+            done += len(chunk_rows) + len(chunk_errors)
+            # 工作进程的PID来自各块的返回结果；第一个返回结果的进程作为单进程占用的参考
+            single_process = single_process or read_memory(pid)
+            snapshot = memory_snapshot([os.getpid()] + list(worker_images))
+            peak = {key: max(peak[key], snapshot[key]) for key in peak}
+            print(f"已处理 {done}/{len(image_files)} 张图片")
+    finally:
+        pool.terminate()
+        pool.join()
+        block.close()
+        block.unlink()
+    elapsed = time.perf_counter() - started
+
+    stats = {
+        'workers': workers,
+        'start_method': start_method,
+        'images': len(image_files),
+        'elapsed_s': elapsed,
+        'images_per_sec': len(image_files) / elapsed if elapsed > 0 else 0.0,
+        'single_process_rss_mb': single_process.get('rss', 0) / 1024,
+        'shared_weights_mb': spec['nbytes'] / 1024 / 1024,
+        'parent_pss_mb': parent.get('pss', 0) / 1024,
+        'peak_total_rss_mb': peak['rss_mb'],
+        'peak_total_pss_mb': peak['pss_mb'],
+        # 每增加一个工作进程的实际内存增量（共享权重已按进程数均摊进各自的PSS）
+        'per_worker_pss_mb': max(0.0, peak['pss_mb'] - parent.get('pss', 0) / 1024) / workers,
+        'images_per_worker': sorted(worker_images.values(), reverse=True),
+    }
+    return rows, errors, stats
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="多进程批量预测（权重只加载一次，放在共享内存中供各进程引用）")
+    parser.add_argument('image_dir', nargs='?', default=image_dir, help="图片目录或zip/tar压缩包")
+    parser.add_argument('--model', default=model_path, help="模型路径")
+    parser.add_argument('--output', default=output_path, help="结果保存路径（.csv 或 .parquet）")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="工作进程数")
+    parser.add_argument('--chunk-size', type=int, help="每个工作块的图片数（默认 batch_size*chunk_batches）")
+    parser.add_argument('--start-method', choices=['spawn', 'forkserver'], default='spawn',
+                        help="子进程启动方式；子进程从共享内存引用权重，不fork已初始化的TensorFlow")
+    args = parser.parse_args()
+    model_path = args.model
+
+    # 各进程平分CPU核心，避免N个进程各自开满线程池互相争抢；必须在导入TensorFlow之前设置
+    threads = max(1, (os.cpu_count() or 1) // args.workers)
+    os.environ.setdefault("TF_NUM_INTRAOP_THREADS", str(threads))
+    os.environ.setdefault("TF_NUM_INTEROP_THREADS", "1")
+    os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
+
+    image_files = list_sources(args.image_dir)
+    if not image_files:
+        print(f"在目录 {args.image_dir} 中未找到图片文件")
+        exit(1)
+    print(f"找到 {len(image_files)} 张待预测图片，使用 {args.workers} 个进程（{args.start_method}）")
+
+    from animal_classifier import load_class_names
+
+    with open_writer(args.output, load_class_names(class_names_path)) as writer:
+        _, errors, stats = run_pool(image_files, args.workers, args.start_method, args.chunk_size, writer)
+    for path, error in errors:
+        print(f"图片处理失败 {path}: {error}")
+
+    print(f"\n预测完成！共 {writer.rows_written} 条结果已保存至: {args.output}")
+    print("=" * 50)
+    print(f"耗时 {stats['elapsed_s']:.1f}s, 吞吐 {stats['images_per_sec']:.1f} 张/秒")
+    if stats['single_process_rss_mb']:
+        print(f"单个工作进程RSS: {stats['single_process_rss_mb']:.0f} MB")
+    print(f"峰值总RSS: {stats['peak_total_rss_mb']:.0f} MB（共享页面被重复计算）")
+    print(f"峰值总PSS: {stats['peak_total_pss_mb']:.0f} MB（实际物理内存占用）")
+    print(f"共享权重: {stats['shared_weights_mb']:.0f} MB（只存一份），"
+          f"每个工作进程的PSS增量: {stats['per_worker_pss_mb']:.0f} MB")
+    print(f"各进程处理图片数: {stats['images_per_worker']}")
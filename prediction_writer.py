@@ -0,0 +1,188 @@
+import csv
+import json
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pyarrow未安装时只能输出CSV
+    pa = None
+    pq = None
+
+# 配置参数
+row_group_size = 50000  # Parquet每个行组的行数（写满一组就落盘，内存占用与总行数无关）
+compression = 'zstd'  # Parquet压缩算法
+
+
+def prediction_row(path, prediction, top_k=3):
+    """把AnimalClassifier的预测结果整理为一行输出（与predict.py的CSV列一致）"""
+    row = {
+        'file_path': path,
+        'predicted_class': prediction['predicted_class'],
+        'confidence': prediction['confidence'],
+    }
+    for k, (name, confidence) in enumerate(prediction['top_k'][:top_k], 1):
+        row[f'top{k}_class'] = name
+        row[f'top{k}_confidence'] = confidence
+    return row
+
+
+class CsvPredictionWriter:
+    """逐行追加写CSV（utf-8-sig，便于Excel打开中文）"""
+
+    def __init__(self, path, top_k=3):
+        self.path = path
+        self.top_k = top_k
+        self.file = open(path, 'w', newline='', encoding='utf-8-sig')
+        self.writer = None
+        self.rows_written = 0
+
+    def write(self, path, prediction):
+        self.write_row(prediction_row(path, prediction, self.top_k))
+
+    def write_row(self, row, probabilities=None):
+        if self.writer is None:
+            self.writer = csv.DictWriter(self.file, fieldnames=list(row))
+            self.writer.writeheader()
+        self.writer.writerow(row)
+        self.rows_written += 1
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ParquetPredictionWriter:
+    """按行组增量写Parquet
+
+    类别名列使用字典编码（int16索引 + 类别名字典），置信度为float32；
+    include_probabilities=True时额外保存每张图片完整的类别概率向量（定长float32列表）。
+    类别名列表写入文件元数据class_names，下游可直接按索引还原。
+    """
+
+    def __init__(self, path, class_names=(), top_k=3, include_probabilities=False,
+                 row_group_size=row_group_size, compression=compression):
+        if pa is None:
+            raise RuntimeError("未安装pyarrow，无法写入Parquet（pip install pyarrow）")
+        self.path = path
+        self.top_k = top_k
+        self.include_probabilities = include_probabilities
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self.class_names = list(class_names)
+        self.class_index = {name: i for i, name in enumerate(self.class_names)}
+        self.columns = ['file_path', 'predicted_class', 'confidence']
+        for k in range(1, top_k + 1):
+            self.columns += [f'top{k}_class', f'top{k}_confidence']
+        self.buffer = {name: [] for name in self.columns}
+        self.probabilities = []
+        self.schema = None
+        self.writer = None
+        self.rows_written = 0
+
+    def _class_id(self, name):
+        # 未在类别表中的名称追加到字典末尾（例如没有class.txt时的数字标签）
+        if name not in self.class_index:
+            self.class_index[name] = len(self.class_names)
+            self.class_names.append(name)
+        return self.class_index[name]
+
+    def write(self, path, prediction):
+        self.write_row(prediction_row(path, prediction, self.top_k), prediction.get('probabilities'))
+
+    def write_row(self, row, probabilities=None):
+        for name in self.columns:
+            value = row[name]
+            self.buffer[name].append(self._class_id(value) if name.endswith('_class') else value)
+        if self.include_probabilities:
+            if probabilities is None:
+                raise ValueError("include_probabilities=True时每一行都需要提供概率向量")
+            self.probabilities.append(np.asarray(probabilities, dtype=np.float32))
+        if len(self.buffer['file_path']) >= self.row_group_size:
+            self._flush()
+
+    def _build_schema(self):
+        class_type = pa.dictionary(pa.int16(), pa.string())
+        fields = []
+        for name in self.columns:
+            if name.endswith('_class'):
+                fields.append(pa.field(name, class_type))
+            elif name.endswith('confidence'):
+                fields.append(pa.field(name, pa.float32()))
+            else:
+                fields.append(pa.field(name, pa.string()))
+        if self.include_probabilities:
+            num_classes = len(self.probabilities[0]) if self.probabilities else len(self.class_names)
+            fields.append(pa.field('probabilities', pa.list_(pa.float32(), num_classes)))
+        return pa.schema(fields)
+
+    def _flush(self):
+        if not self.buffer['file_path']:
+            return
+        if self.schema is None:
+            self.schema = self._build_schema()
+        dictionary = pa.array(self.class_names, type=pa.string())
+        arrays = []
+        for name in self.columns:
+            values = self.buffer[name]
+            if name.endswith('_class'):
+                arrays.append(pa.DictionaryArray.from_arrays(pa.array(values, type=pa.int16()), dictionary))
+            elif name.endswith('confidence'):
+                arrays.append(pa.array(np.asarray(values, dtype=np.float32)))
+            else:
+                arrays.append(pa.array(values, type=pa.string()))
+        if self.include_probabilities:
+            flat = pa.array(np.concatenate(self.probabilities))
+            arrays.append(pa.FixedSizeListArray.from_arrays(flat, len(self.probabilities[0])))
+        table = pa.Table.from_arrays(arrays, schema=self.schema)
+
+        if self.writer is None:
+            self.writer = pq.ParquetWriter(self.path, self.schema, compression=self.compression)
+        self.writer.write_table(table, row_group_size=self.row_group_size)
+        self.rows_written += table.num_rows
+        self.buffer = {name: [] for name in self.columns}
+        self.probabilities = []
+
+    def close(self):
+        self._flush()
+        if self.writer is None:
+            # 没有任何结果时也写出一个带表结构的空文件
+            self.schema = self._build_schema()
+            self.writer = pq.ParquetWriter(self.path, self.schema, compression=self.compression)
+        # 完整类别表（含运行中追加的名称）写入文件元数据
+        self.writer.add_key_value_metadata({'class_names': json.dumps(self.class_names, ensure_ascii=False)})
+        self.writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def open_writer(path, class_names=(), top_k=3, include_probabilities=False):
+    """按扩展名选择输出格式：.parquet写Parquet，其余写CSV"""
+    if path.lower().endswith('.parquet'):
+        return ParquetPredictionWriter(path, class_names, top_k, include_probabilities)
+    if include_probabilities:
+        raise ValueError("完整概率向量只支持Parquet输出，请把输出文件扩展名改为.parquet")
+    return CsvPredictionWriter(path, top_k)
+
+
+def save_report(df, path):
+    """按扩展名保存训练报表：.parquet为列式文件（浮点列转float32、文本列字典编码），其余为Excel"""
+    if not path.lower().endswith('.parquet'):
+        df.to_excel(path, index=False)
+        return
+    df = df.copy()
+    for column in df.columns:
+        if df[column].dtype == np.float64:
+            df[column] = df[column].astype(np.float32)
+        elif df[column].dtype == object:
+            df[column] = df[column].astype('category')
+    df.to_parquet(path, index=False, compression=compression)
@@ -0,0 +1,124 @@
+import io
+import os
+import time
+import threading
+from collections import Counter
+import numpy as np
+from PIL import Image
+
+# 配置参数
+thumb_size = 64  # 判断用缩略图的边长
+min_std = 3.0  # 灰度标准差低于该值视为空白画面
+min_entropy = 1.5  # 灰度直方图熵(bit)低于该值视为空白画面
+dark_mean = 15.0  # 平均亮度低于该值……
+dark_p95 = 40.0  # ……且95%分位亮度也低于该值时视为过暗（夜间无补光）
+bright_mean = 245.0  # 平均亮度高于该值视为过曝
+frame_diff_threshold = None  # 与同目录上一张保留图片的缩略图平均差低于该值视为无变化（None为关闭）
+
+
+class PreFilter:
+    """模型之前的廉价预筛选
+
+    每张图片只解码一张很小的灰度缩略图（JPEG借助draft在DCT阶段缩小），据此判断：
+    - corrupt: 无法解码或文件被截断；
+    - dark / overexposed: 曝光异常（夜间无补光的近黑画面等）；
+    - blank: 方差/熵过低（纯色、镜头被遮挡）；
+    - unchanged: 与同目录上一张保留的图片几乎相同（需设置frame_diff_threshold）。
+    analyze()只依赖单张图片，可在解码线程池中并行调用；decide()需要按输入顺序调用。
+    """
+
+    def __init__(self, thumb_size=thumb_size, min_std=min_std, min_entropy=min_entropy, dark_mean=dark_mean,
+                 dark_p95=dark_p95, bright_mean=bright_mean, frame_diff_threshold=frame_diff_threshold):
+        self.thumb_size = thumb_size
+        self.min_std = min_std
+        self.min_entropy = min_entropy
+        self.dark_mean = dark_mean
+        self.dark_p95 = dark_p95
+        self.bright_mean = bright_mean
+        self.frame_diff_threshold = frame_diff_threshold
+        self.previous = {}  # 目录 -> 上一张保留图片的缩略图
+        self.lock = threading.Lock()
+        self.counts = Counter()
+        self.checked = 0
+        self.analyze_seconds = 0.0
+
+    def _thumbnail(self, source):
+        img = Image.open(io.BytesIO(source) if isinstance(source, (bytes, bytearray)) else source)
+        with img:
+            img.draft('L', (self.thumb_size, self.thumb_size))
+            img = img.convert('L')
+            img.thumbnail((self.thumb_size, self.thumb_size), Image.NEAREST)
+            return np.asarray(img, dtype=np.float32)
+
+    def analyze(self, source):
+        """计算单张图片的缩略图指标，返回{'reason': 跳过原因或None, ...}"""
+        started = time.perf_counter()
+        try:
+            thumb = self._thumbnail(source)
+        except Exception as e:
+            metrics = {'reason': 'corrupt', 'detail': str(e)}
+        else:
+            hist = np.bincount(thumb.astype(np.uint8).ravel(), minlength=256) / thumb.size
+            nonzero = hist[hist > 0]
+            metrics = {
+                'thumb': thumb,
+                'mean': float(thumb.mean()),
+                'std': float(thumb.std()),
+                'p95': float(np.percentile(thumb, 95)),
+                'entropy': float(-(nonzero * np.log2(nonzero)).sum()),
+            }
+            if metrics['mean'] < self.dark_mean and metrics['p95'] < self.dark_p95:
+                metrics['reason'] = 'dark'
+            elif metrics['mean'] > self.bright_mean:
+                metrics['reason'] = 'overexposed'
+            elif metrics['std'] < self.min_std or metrics['entropy'] < self.min_entropy:
+                metrics['reason'] = 'blank'
+            else:
+                metrics['reason'] = None
+        with self.lock:
+            self.analyze_seconds += time.perf_counter() - started
+        return metrics
+
+    def decide(self, path, metrics):
+        """按输入顺序确定最终结果（加入与同目录上一张图片的帧差判断），返回跳过原因或None"""
+        reason = metrics['reason']
+        if reason is None and self.frame_diff_threshold is not None:
+            folder = os.path.dirname(path)
+            thumb = metrics['thumb']
+            previous = self.previous.get(folder)
+            if previous is not None and previous.shape == thumb.shape and \
+                    np.abs(thumb - previous).mean() < self.frame_diff_threshold:
+                reason = 'unchanged'
+            else:
+                self.previous[folder] = thumb
+        with self.lock:
+            self.checked += 1
+            if reason is not None:
+                self.counts[reason] += 1
+        return reason
+
+    def report(self, model_seconds_per_image=None):
+        """汇总跳过数量与节省的计算量"""
+        skipped = sum(self.counts.values())
+        summary = {
+            'checked': self.checked,
+            'skipped': skipped,
+            'skipped_fraction': skipped / self.checked if self.checked else 0.0,
+            'reasons': dict(self.counts),
+            'prefilter_ms_per_image': self.analyze_seconds / self.checked * 1000 if self.checked else 0.0,
+        }
+        if model_seconds_per_image is not None:
+            summary['model_ms_per_image'] = model_seconds_per_image * 1000
+            summary['model_seconds_saved'] = skipped * model_seconds_per_image
+            summary['prefilter_seconds'] = self.analyze_seconds
+        return summary
+
+
+def print_report(summary):
+    print(f"预筛选: 检查 {summary['checked']} 张，跳过 {summary['skipped']} 张 "
+          f"({summary['skipped_fraction']:.1%})，每张耗时 {summary['prefilter_ms_per_image']:.2f} ms")
+    for reason, count in sorted(summary['reasons'].items(), key=lambda x: -x[1]):
+        print(f"  {reason}: {count}")
+    if 'model_seconds_saved' in summary:
+        print(f"模型每张耗时 {summary['model_ms_per_image']:.1f} ms，预计节省模型计算 "
+              f"{summary['model_seconds_saved']:.1f}s（预筛选本身耗时 {summary['prefilter_seconds']:.1f}s）")
@@ -0,0 +1,325 @@
+import os
+import queue
+import sqlite3
+import atexit
+import threading
+from datetime import datetime
+
+from progress_store import ProgressStore, default_stats
+
+# 配置参数
+db_path = 'progress.db'  # 进度数据库路径
+default_profile = 'default'  # 默认用户名
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS profile_stats (
+    profile_id INTEGER PRIMARY KEY REFERENCES profiles(id),
+    total_recognitions INTEGER NOT NULL DEFAULT 0,
+    correct_guesses INTEGER NOT NULL DEFAULT 0,
+    last_played TEXT
+);
+CREATE TABLE IF NOT EXISTS unlocked_animals (
+    profile_id INTEGER NOT NULL REFERENCES profiles(id),
+    animal TEXT NOT NULL,
+    source TEXT NOT NULL,
+    unlocked_at TEXT NOT NULL,
+    PRIMARY KEY (profile_id, animal)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS recognitions (
+    id INTEGER PRIMARY KEY,
+    profile_id INTEGER NOT NULL REFERENCES profiles(id),
+    animal TEXT NOT NULL,
+    confidence REAL NOT NULL,
+    image_path TEXT,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS quiz_results (
+    id INTEGER PRIMARY KEY,
+    profile_id INTEGER NOT NULL REFERENCES profiles(id),
+    animal TEXT NOT NULL,
+    chosen TEXT NOT NULL,
+    correct INTEGER NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_recognitions_profile_time ON recognitions(profile_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_quiz_profile_time ON quiz_results(profile_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_stats_correct ON profile_stats(correct_guesses DESC);
+"""
+
+# 排行榜支持的指标
+LEADERBOARD_QUERIES = {
+    'correct_guesses': """
+        SELECT p.name, s.correct_guesses FROM profile_stats s
+        JOIN profiles p ON p.id = s.profile_id
+        ORDER BY s.correct_guesses DESC LIMIT ?
+    """,
+    'animals_unlocked': """
+        SELECT p.name, u.cnt FROM (
+            SELECT profile_id, COUNT(*) AS cnt FROM unlocked_animals GROUP BY profile_id
+        ) u JOIN profiles p ON p.id = u.profile_id
+        ORDER BY u.cnt DESC LIMIT ?
+    """,
+}
+
+
+def now():
+    return datetime.now().isoformat()
+
+
+def connect(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")  # 读写互不阻塞
+    conn.execute("PRAGMA synchronous=NORMAL")  # WAL模式下仍保证崩溃一致性
+    conn.execute("PRAGMA foreign_keys=ON")
+    return conn
+
+
+class SQLiteProgressStore:
+    """基于SQLite的多用户进度存储
+
+    提供与ProgressStore相同的unlocked/stats/unlock/increment/close接口，
+    另外记录识别历史与小游戏答题结果，并支持排行榜查询。
+    每个用户操作对应一个小事务，由单独的写线程按顺序执行，界面线程只读内存缓存。
+    """
+
+    def __init__(self, path=db_path, profile=default_profile):
+        self.path = path
+        self.writer_conn = connect(path)
+        self.writer_conn.executescript(SCHEMA)
+        self.writer_lock = threading.Lock()  # 写连接可能被写线程和切换用户同时使用
+        self.reader_conn = connect(path)
+        self.reader_lock = threading.Lock()
+
+        self.lock = threading.Lock()
+        self.unlocked = set()
+        self.stats = dict(default_stats)
+        self.profile = None
+        self.profile_id = None
+        self.switch_profile(profile)
+
+        self.writes = queue.Queue()
+        self.closed = False
+        self.writer = threading.Thread(target=self._write_loop, daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
+
+    # ---- 用户 ----
+
+    def _ensure_profile(self, name):
+        with self.writer_lock, self.writer_conn:
+            self.writer_conn.execute("INSERT OR IGNORE INTO profiles(name, created_at) VALUES (?, ?)", (name, now()))
+            profile_id = self.writer_conn.execute("SELECT id FROM profiles WHERE name = ?", (name,)).fetchone()[0]
+            self.writer_conn.execute("INSERT OR IGNORE INTO profile_stats(profile_id) VALUES (?)", (profile_id,))
+        return profile_id
+
+    def switch_profile(self, name):
+        """切换当前用户并重新加载其进度（就地更新缓存，外部引用保持有效）"""
+        if getattr(self, 'writes', None) is not None:
+            self.flush()
+        self._load_profile(name)
+
+    def switch_profile_async(self, name, callback=None):
+        """在写线程中切换用户（排在已提交的写入之后，界面线程不等待），完成后在写线程中调用callback()"""
+        def task():
+            self._load_profile(name)
+            if callback is not None:
+                callback()
+        self.writes.put(task)
+
+    def _load_profile(self, name):
+        profile_id = self._ensure_profile(name)
+        with self.reader_lock:
+            animals = [row[0] for row in self.reader_conn.execute(
+                "SELECT animal FROM unlocked_animals WHERE profile_id = ?", (profile_id,))]
+            total, correct, last_played = self.reader_conn.execute(
+                "SELECT total_recognitions, correct_guesses, last_played FROM profile_stats WHERE profile_id = ?",
+                (profile_id,)).fetchone()
+        with self.lock:
+            self.profile = name
+            self.profile_id = profile_id
+            self.unlocked.clear()
+            self.unlocked.update(animals)
+            self.stats.clear()
+            self.stats.update(total_recognitions=total, correct_guesses=correct,
+                              animals_unlocked=len(animals), last_played=last_played)
+
+    def profiles(self):
+        """返回所有用户名"""
+        with self.reader_lock:
+            return [row[0] for row in self.reader_conn.execute("SELECT name FROM profiles ORDER BY name")]
+
+    # ---- 写入 ----
+
+    def _write_loop(self):
+        while True:
+            item = self.writes.get()
+            try:
+                if item is None:
+                    return
+                if callable(item):
+                    # 查询/切换用户等任务：排在之前提交的写入之后执行，不需要界面线程调用flush()等待
+                    try:
+                        item()
+                    except sqlite3.Error as e:
+                        print(f"读取用户进度失败: {e}")
+                    continue
+                sql_ops = item
+                try:
+                    with self.writer_lock, self.writer_conn:
+                        for sql, params in sql_ops:
+                            self.writer_conn.execute(sql, params)
+                except sqlite3.Error as e:
+                    print(f"保存用户进度失败: {e}")
+            finally:
+                self.writes.task_done()
+
+    def _submit(self, *sql_ops):
+        """提交一个事务（包含一条或多条SQL）到写线程"""
+        self.writes.put(list(sql_ops))
+
+    def _touch_sql(self, profile_id, timestamp):
+        return ("UPDATE profile_stats SET last_played = ? WHERE profile_id = ?", (timestamp, profile_id))
+
+    def unlock(self, animal, source='recognition'):
+        """解锁动物，返回是否为新解锁"""
+        timestamp = now()
+        with self.lock:
+            if animal in self.unlocked:
+                return False
+            self.unlocked.add(animal)
+            self.stats["animals_unlocked"] = len(self.unlocked)
+            self.stats["last_played"] = timestamp
+            profile_id = self.profile_id
+        self._submit(
+            ("INSERT OR IGNORE INTO unlocked_animals(profile_id, animal, source, unlocked_at) VALUES (?, ?, ?, ?)",
+             (profile_id, animal, source, timestamp)),
+            self._touch_sql(profile_id, timestamp))
+        return True
+
+    def increment(self, key, n=1):
+        """累加某项统计（total_recognitions / correct_guesses）"""
+        if key not in ('total_recognitions', 'correct_guesses'):
+            raise ValueError(f"不支持的统计项: {key}")
+        timestamp = now()
+        with self.lock:
+            self.stats[key] = self.stats.get(key, 0) + n
+            self.stats["last_played"] = timestamp
+            profile_id = self.profile_id
+        self._submit(
+            (f"UPDATE profile_stats SET {key} = {key} + ? WHERE profile_id = ?", (n, profile_id)),
+            self._touch_sql(profile_id, timestamp))
+
+    def record_recognition(self, animal, confidence, image_path=None):
+        """记录一次识别结果"""
+        with self.lock:
+            profile_id = self.profile_id
+        self._submit(
+            ("INSERT INTO recognitions(profile_id, animal, confidence, image_path, created_at) VALUES (?, ?, ?, ?, ?)",
+             (profile_id, animal, float(confidence), image_path, now())))
+
+    def record_quiz(self, animal, chosen):
+        """记录一次答题结果，答对时同时累加得分并解锁动物；返回是否答对"""
+        correct = animal == chosen
+        with self.lock:
+            profile_id = self.profile_id
+        self._submit(
+            ("INSERT INTO quiz_results(profile_id, animal, chosen, correct, created_at) VALUES (?, ?, ?, ?, ?)",
+             (profile_id, animal, chosen, int(correct), now())))
+        if correct:
+            self.increment('correct_guesses')
+            self.unlock(animal, source='quiz')
+        return correct
+
+    # ---- 查询 ----
+
+    def leaderboard(self, metric='correct_guesses', limit=10):
+        """排行榜，返回[(用户名, 数值), ...]"""
+        self.flush()
+        with self.reader_lock:
+            return self.reader_conn.execute(LEADERBOARD_QUERIES[metric], (limit,)).fetchall()
+
+    def leaderboard_async(self, callback, metric='correct_guesses', limit=10):
+        """在写线程中查询排行榜，完成后在写线程中调用callback(结果)（界面线程需自行转回主线程）"""
+        def task():
+            with self.writer_lock:
+                rows = self.writer_conn.execute(LEADERBOARD_QUERIES[metric], (limit,)).fetchall()
+            callback(rows)
+        self.writes.put(task)
+
+    def recent_recognitions(self, limit=20):
+        """当前用户最近的识别记录"""
+        self.flush()
+        with self.reader_lock:
+            return self.reader_conn.execute(
+                "SELECT animal, confidence, image_path, created_at FROM recognitions "
+                "WHERE profile_id = ? ORDER BY created_at DESC LIMIT ?", (self.profile_id, limit)).fetchall()
+
+    # ---- 生命周期 ----
+
+    def flush(self):
+        """等待所有已提交的写入完成"""
+        self.writes.join()
+
+    def close(self):
+        """退出前写入所有未完成的事务（可重复调用）"""
+        if self.closed:
+            return
+        self.closed = True
+        self.writes.put(None)
+        self.writer.join()
+        self.writer_conn.close()
+        self.reader_conn.close()
+
+
+def migrate_json(store, unlocked_path='unlocked_animals.json', stats_path='user_stats.json',
+                 journal_path='progress.journal'):
+    """把旧版JSON进度（含未写入快照的日志）导入当前用户，导入后将旧文件重命名为*.migrated
+
+    返回是否执行了迁移。
+    """
+    if not any(os.path.exists(p) for p in (unlocked_path, stats_path, journal_path)):
+        return False
+
+    legacy = ProgressStore(unlocked_path, stats_path, journal_path)
+    legacy.close()
+    timestamp = legacy.stats.get("last_played") or now()
+    store.flush()
+    with store.writer_lock, store.writer_conn:
+        store.writer_conn.executemany(
+            "INSERT OR IGNORE INTO unlocked_animals(profile_id, animal, source, unlocked_at) VALUES (?, ?, 'json', ?)",
+            [(store.profile_id, animal, timestamp) for animal in sorted(legacy.unlocked)])
+        store.writer_conn.execute(
+            "UPDATE profile_stats SET total_recognitions = total_recognitions + ?, "
+            "correct_guesses = correct_guesses + ?, last_played = ? WHERE profile_id = ?",
+            (legacy.stats.get("total_recognitions", 0), legacy.stats.get("correct_guesses", 0),
+             timestamp, store.profile_id))
+    for path in (unlocked_path, stats_path, journal_path):
+        if os.path.exists(path):
+            os.replace(path, path + '.migrated')
+    store.switch_profile(store.profile)
+    return True
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="用户进度数据库工具")
+    parser.add_argument('--db', default=db_path, help="数据库路径")
+    parser.add_argument('--profile', default=default_profile, help="用户名")
+    parser.add_argument('--migrate', action='store_true', help="把当前目录下的JSON进度导入该用户")
+    parser.add_argument('--leaderboard', choices=sorted(LEADERBOARD_QUERIES), help="显示排行榜")
+    args = parser.parse_args()
+
+    store = SQLiteProgressStore(args.db, args.profile)
+    if args.migrate:
+        print("迁移完成" if migrate_json(store) else "未找到需要迁移的JSON进度文件")
+    if args.leaderboard:
+        for rank, (name, value) in enumerate(store.leaderboard(args.leaderboard), 1):
+            print(f"{rank}. {name}: {value}")
+    print(f"用户 {store.profile}: 已解锁 {len(store.unlocked)} 种动物, 统计 {store.stats}")
+    store.close()
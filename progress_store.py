@@ -0,0 +1,221 @@
+import os
+import json
+import time
+import socket
+import atexit
+import threading
+from datetime import datetime
+
+# 配置参数
+unlocked_path = 'unlocked_animals.json'  # 已解锁动物快照
+stats_path = 'user_stats.json'  # 用户统计快照
+journal_path = 'progress.journal'  # 追加写入的操作日志
+flush_delay = 2.0  # 合并写入的延迟(秒)
+
+default_stats = {
+    "total_recognitions": 0,
+    "correct_guesses": 0,
+    "animals_unlocked": 0,
+    "last_played": None
+}
+
+
+def write_temp_text(path, text):
+    """把文本写入path旁的临时文件并落盘，返回临时文件路径（由调用方os.replace到path）
+
+    临时文件名带主机名和进程号，多台机器在共享文件系统上写同一目录时互不覆盖（见shard_predict.py）。
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{socket.gethostname()}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    return tmp_path
+
+
+def atomic_write_text(path, text):
+    """先写临时文件并落盘，再通过rename原子替换目标文件"""
+    os.replace(write_temp_text(path, text), path)
+
+
+def atomic_write_json(path, data, indent=None):
+    atomic_write_text(path, json.dumps(data, ensure_ascii=False, indent=indent))
+
+
+class ProgressStore:
+    """用户进度存储（已解锁动物 + 用户统计）
+
+    - 所有修改在内存中完成并追加写入操作日志，调用方不会等待快照写盘；
+    - 后台线程合并一段时间内的修改，以"写临时文件+rename"的方式原子更新快照，
+      快照写完后截断日志；
+    - 启动时读取快照并重放日志，即使在任意时刻崩溃也不会损坏进度；
+    - 线程安全，识别线程和界面线程可以同时修改。
+    """
+
+    def __init__(self, unlocked_path=unlocked_path, stats_path=stats_path, journal_path=journal_path,
+                 flush_delay=flush_delay):
+        self.unlocked_path = unlocked_path
+        self.stats_path = stats_path
+        self.journal_path = journal_path
+        self.flush_delay = flush_delay
+
+        self.lock = threading.Lock()
+        self.cond = threading.Condition(self.lock)
+        self.unlocked = set()
+        self.stats = dict(default_stats)
+        self.seq = 0  # 最近一次操作的序号
+        self.pending_ops = []  # 尚未写入快照的操作
+        self.dirty = False
+        self.writing = False  # 是否正在写快照
+        self.closed = False
+
+        self._load()
+        self.journal = open(self.journal_path, 'a', encoding='utf-8')
+        self.flusher = threading.Thread(target=self._flush_loop, daemon=True)
+        self.flusher.start()
+        atexit.register(self.close)
+
+    # ---- 加载与重放 ----
+
+    def _load(self):
+        try:
+            if os.path.exists(self.unlocked_path):
+                with open(self.unlocked_path, 'r', encoding='utf-8') as f:
+                    self.unlocked = set(json.load(f))
+            if os.path.exists(self.stats_path):
+                with open(self.stats_path, 'r', encoding='utf-8') as f:
+                    self.stats.update(json.load(f))
+        except ValueError as e:
+            print(f"用户进度文件无法解析，将重新开始记录: {e}")
+        self.seq = self.stats.pop('_journal_seq', 0)
+        snapshot_seq = self.seq
+
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        op = json.loads(line)
+                    except ValueError:
+                        # 崩溃时最后一行可能只写了一半，忽略即可
+                        continue
+                    # 统计类操作不是幂等的，只重放快照之后的部分
+                    if op['op'] == 'unlock' or op['seq'] > snapshot_seq:
+                        self._apply(op)
+                        self.pending_ops.append(op)
+                    self.seq = max(self.seq, op['seq'])
+        self.dirty = bool(self.pending_ops)
+        self.stats["animals_unlocked"] = len(self.unlocked)
+
+    def _apply(self, op):
+        if op['op'] == 'unlock':
+            self.unlocked.add(op['animal'])
+            self.stats["animals_unlocked"] = len(self.unlocked)
+        elif op['op'] == 'incr':
+            self.stats[op['key']] = self.stats.get(op['key'], 0) + op['n']
+        elif op['op'] == 'set':
+            self.stats[op['key']] = op['value']
+
+    # ---- 修改接口 ----
+
+    def _record(self, op):
+        """在锁内应用操作、写日志并唤醒后台写入线程"""
+        self.seq += 1
+        op['seq'] = self.seq
+        self._apply(op)
+        self.pending_ops.append(op)
+        self.journal.write(json.dumps(op, ensure_ascii=False) + '\n')
+        self.journal.flush()
+        self.dirty = True
+        self.cond.notify()
+
+    def unlock(self, animal):
+        """解锁动物，返回是否为新解锁"""
+        with self.lock:
+            if animal in self.unlocked:
+                return False
+            self._record({'op': 'unlock', 'animal': animal})
+            self._record({'op': 'set', 'key': 'last_played', 'value': datetime.now().isoformat()})
+            return True
+
+    def increment(self, key, n=1):
+        """累加某项统计"""
+        with self.lock:
+            self._record({'op': 'incr', 'key': key, 'n': n})
+            self._record({'op': 'set', 'key': 'last_played', 'value': datetime.now().isoformat()})
+
+    # ---- 写入快照 ----
+
+    def _flush_loop(self):
+        with self.lock:
+            while not self.closed:
+                if not self.dirty:
+                    self.cond.wait()
+                    continue
+                # 等待一小段时间，把连续的修改合并成一次写入
+                deadline = time.monotonic() + self.flush_delay
+                while not self.closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+                if not self.closed:
+                    self._flush_locked()
+
+    def _flush_locked(self):
+        """在持有锁的情况下准备快照，写盘时释放锁"""
+        while self.writing:
+            self.cond.wait()
+        if not self.dirty:
+            return
+        self.writing = True
+        try:
+            self._write_snapshot_locked()
+        finally:
+            self.writing = False
+            self.cond.notify_all()
+
+    def _write_snapshot_locked(self):
+        unlocked = sorted(self.unlocked)
+        stats = dict(self.stats, _journal_seq=self.seq)
+        snapshot_seq = self.seq
+        self.dirty = False
+
+        self.lock.release()
+        try:
+            atomic_write_json(self.unlocked_path, unlocked)
+            atomic_write_json(self.stats_path, stats)
+        except OSError as e:
+            print(f"保存用户进度失败: {e}")
+            self.lock.acquire()
+            self.dirty = True
+            return
+        self.lock.acquire()
+
+        # 快照已包含的操作从日志中移除，只保留写快照期间新增的操作
+        self.pending_ops = [op for op in self.pending_ops if op['seq'] > snapshot_seq]
+        self.journal.close()
+        tmp_path = self.journal_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for op in self.pending_ops:
+                f.write(json.dumps(op, ensure_ascii=False) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.journal_path)
+        self.journal = open(self.journal_path, 'a', encoding='utf-8')
+
+    def flush(self):
+        """立即同步写入快照"""
+        with self.lock:
+            self._flush_locked()
+
+    def close(self):
+        """退出前写入所有未保存的修改（可重复调用）"""
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.cond.notify_all()
+            self._flush_locked()
+            self.journal.close()
@@ -0,0 +1,155 @@
+import os
+import json
+import random
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+
+from image_sources import is_image_name
+from zoo_icon_cache import add_rounded_corners
+
+# 配置参数
+images_dir = 'Animal'  # 动物图片目录（按类别分子目录）
+cache_dir = 'cache/quiz'  # 索引与缩放后图片的缓存目录
+max_display_size = (500, 350)  # 游戏中图片的最大显示尺寸
+corner_radius = 15  # 圆角半径
+
+
+class QuizImageBank:
+    """小游戏图片库
+
+    - 每个类别的图片列表建立索引并持久化，按目录mtime增量刷新，出题时不再listdir；
+    - 图片预先缩放到显示尺寸并加好圆角后存入缓存目录，出题时只需读取小图；
+    - 在用户答题期间后台预取下一题的图片。
+    """
+
+    def __init__(self, images_dir=images_dir, cache_dir=cache_dir, max_size=max_display_size,
+                 radius=corner_radius, workers=2):
+        self.images_dir = images_dir
+        self.cache_dir = cache_dir
+        self.max_size = tuple(max_size)
+        self.radius = radius
+        self.index_path = os.path.join(cache_dir, 'index.json')
+        self.lock = threading.Lock()
+        self.index = self._load_index()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+
+    def _load_index(self):
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_index(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self.index_path + '.tmp'
+        with self.lock:
+            data = json.dumps(self.index)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(tmp_path, self.index_path)
+
+    def _refresh_class(self, animal):
+        """目录mtime变化时重新列出该类别的图片，返回是否有更新"""
+        animal_dir = os.path.join(self.images_dir, animal)
+        try:
+            mtime_ns = os.stat(animal_dir).st_mtime_ns
+        except OSError:
+            with self.lock:
+                return self.index.pop(animal, None) is not None
+        with self.lock:
+            entry = self.index.get(animal)
+            if entry is not None and entry['mtime_ns'] == mtime_ns:
+                return False
+        files = sorted(f for f in os.listdir(animal_dir) if is_image_name(f))
+        with self.lock:
+            self.index[animal] = {'mtime_ns': mtime_ns, 'files': files}
+        return True
+
+    def refresh(self, animals=None):
+        """增量刷新索引（只重新扫描有变化的类别目录），返回更新的类别数量"""
+        if animals is None:
+            animals = sorted(os.listdir(self.images_dir)) if os.path.isdir(self.images_dir) else []
+        changed = sum(1 for animal in animals if self._refresh_class(animal))
+        if changed:
+            self._save_index()
+        return changed
+
+    def list_images(self, animal):
+        """返回某个类别的图片文件名列表"""
+        with self.lock:
+            entry = self.index.get(animal)
+        if entry is None:
+            # 索引中没有该类别时按需扫描
+            if self._refresh_class(animal):
+                self._save_index()
+            with self.lock:
+                entry = self.index.get(animal)
+        return entry['files'] if entry else []
+
+    def _display_path(self, source_path, st):
+        key = f"{source_path}|{st.st_mtime_ns}|{st.st_size}|{self.max_size}|{self.radius}"
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.cache_dir, 'images', digest[:2], digest + '.png')
+
+    def get_display_image(self, animal, filename):
+        """返回缩放到显示尺寸并加圆角的PIL图片，优先读取缓存"""
+        source_path = os.path.join(self.images_dir, animal, filename)
+        st = os.stat(source_path)
+        display_path = self._display_path(source_path, st)
+        if os.path.exists(display_path):
+            with Image.open(display_path) as img:
+                img.load()
+                return img
+
+        with Image.open(source_path) as img:
+            # JPEG按DCT缩放直接解码到接近显示尺寸，避免解码全分辨率原图
+            img.draft('RGB', self.max_size)
+            img = img.convert('RGBA')
+        img.thumbnail(self.max_size, Image.LANCZOS)
+        img = add_rounded_corners(img, self.radius)
+
+        os.makedirs(os.path.dirname(display_path), exist_ok=True)
+        tmp_path = display_path + '.tmp.png'
+        img.save(tmp_path)
+        os.replace(tmp_path, display_path)
+        return img
+
+    def load_random(self, animal):
+        """随机选择该类别的一张图片并加载，返回(图片路径, PIL图片)；没有图片时返回(None, None)"""
+        files = self.list_images(animal)
+        if not files:
+            return None, None
+        filename = random.choice(files)
+        return os.path.join(self.images_dir, animal, filename), self.get_display_image(animal, filename)
+
+    def prefetch(self, animal):
+        """在后台线程中加载该类别的随机图片，返回Future"""
+        return self.executor.submit(self.load_random, animal)
+
+    def build_all(self, animals=None):
+        """建立索引并预先生成所有图片的显示尺寸版本，返回处理的图片数量"""
+        self.refresh(animals)
+        with self.lock:
+            jobs = [(animal, f) for animal, entry in self.index.items()
+                    if animals is None or animal in animals for f in entry['files']]
+
+        def build(job):
+            try:
+                self.get_display_image(*job)
+                return True
+            except Exception as e:
+                print(f"处理图片失败 {os.path.join(self.images_dir, *job)}: {e}")
+                return False
+
+        return sum(self.executor.map(build, jobs))
+
+
+if __name__ == "__main__":
+    # 预处理：建立图片索引并生成所有显示尺寸图片
+    bank = QuizImageBank(workers=os.cpu_count() or 2)
+    print(f"正在建立图片库: {images_dir} -> {cache_dir}")
+    count = bank.build_all()
+    print(f"完成！共处理 {count} 张图片")
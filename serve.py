@@ -0,0 +1,224 @@
+import os
+import json
+import time
+import queue
+import argparse
+import threading
+from email import policy
+from email.parser import BytesParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+from animal_classifier import AnimalClassifier
+
+# 禁用GPU（确保使用CPU）
+os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
+
+# 配置参数
+model_path = './output/model/best_model.keras'  # 模型路径
+class_names_path = 'class.txt'  # 类别名称文件路径
+img_size = None  # 输入尺寸（None时使用模型自身的输入尺寸）
+host = '127.0.0.1'  # 监听地址
+port = 8000  # 监听端口
+max_batch_size = 16  # 单个微批次的最大图片数
+max_queue_delay_ms = 10  # 第一张图片进入队列后最多等待多久凑批(ms)
+max_queue_size = 256  # 等待队列上限，超过后直接返回503
+request_timeout = 30  # 单个请求的最长等待时间(秒)
+default_top_k = 3
+
+
+class PendingRequest:
+    """等待微批处理的单个请求"""
+
+    def __init__(self, array, top_k):
+        self.array = array
+        self.top_k = top_k
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """动态微批处理
+
+    并发请求先进入队列，后台线程取出第一条后在max_queue_delay_ms内继续收集，
+    直到凑满max_batch_size，然后一次前向推理并把结果分发回各个请求。
+    """
+
+    def __init__(self, classifier, max_batch_size=max_batch_size,
+                 max_queue_delay_ms=max_queue_delay_ms, max_queue_size=max_queue_size):
+        self.classifier = classifier
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_queue_delay_ms / 1000.0
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.stats_lock = threading.Lock()
+        self.stats = {'requests': 0, 'batches': 0, 'images': 0, 'rejected': 0, 'errors': 0}
+        self.worker = threading.Thread(target=self._run, daemon=True)
+        self.worker.start()
+
+    def submit(self, array, top_k):
+        """提交请求；队列已满时返回None"""
+        request = PendingRequest(array, top_k)
+        try:
+            self.queue.put_nowait(request)
+        except queue.Full:
+            with self.stats_lock:
+                self.stats['rejected'] += 1
+            return None
+        return request
+
+    def _collect(self):
+        batch = [self.queue.get()]
+        deadline = batch[0].enqueued_at + self.max_delay
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                # 已到期也把队列中现成的请求一起带上
+                try:
+                    batch.append(self.queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.perf_counter()
+            try:
+                inputs = np.stack([r.array for r in batch])
+                probabilities = self.classifier.predict_batch(inputs)
+            except Exception as e:
+                for r in batch:
+                    r.error = str(e)
+                    r.done.set()
+                with self.stats_lock:
+                    self.stats['errors'] += len(batch)
+                continue
+            inference_ms = (time.perf_counter() - started) * 1000
+
+            for r, probs in zip(batch, probabilities):
+                formatted = self.classifier.format_result(probs, r.top_k)
+                r.result = {
+                    'predictions': [{'class': name, 'confidence': confidence}
+                                    for name, confidence in formatted['top_k']],
+                    'queue_ms': (started - r.enqueued_at) * 1000,
+                    'inference_ms': inference_ms,
+                    'batch_size': len(batch),
+                }
+                r.done.set()
+            with self.stats_lock:
+                self.stats['batches'] += 1
+                self.stats['images'] += len(batch)
+
+
+def read_upload(handler):
+    """读取请求体中的图片：支持直接上传图片字节，或multipart/form-data的第一个文件字段"""
+    length = int(handler.headers.get('Content-Length', 0))
+    body = handler.rfile.read(length)
+    content_type = handler.headers.get('Content-Type', '')
+    if not content_type.startswith('multipart/form-data'):
+        return body
+    message = BytesParser(policy=policy.HTTP).parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode('latin-1') + body)
+    for part in message.iter_parts():
+        if part.get_filename() is not None or part.get_param('name', header='content-disposition') == 'image':
+            return part.get_payload(decode=True)
+    raise ValueError("multipart请求中没有找到图片字段")
+
+
+class PredictHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # 所有响应都带Content-Length，可以保持连接，省去每个请求的TCP建连
+    batcher = None  # 由main设置
+    classifier = None
+
+    def _send_json(self, status, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/healthz':
+            self._send_json(200, {'status': 'ok'})
+        elif path == '/stats':
+            with self.batcher.stats_lock:
+                stats = dict(self.batcher.stats, queue_depth=self.batcher.queue.qsize())
+            self._send_json(200, stats)
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/predict':
+            self.close_connection = True  # 未读取的请求体会残留在连接上，不能复用
+            self._send_json(404, {'error': 'not found'})
+            return
+        started = time.perf_counter()
+        with self.batcher.stats_lock:
+            self.batcher.stats['requests'] += 1
+        try:
+            data = read_upload(self)  # 先读完请求体，出错时连接仍可复用
+            top_k = int(parse_qs(url.query).get('top_k', [default_top_k])[0])
+            array = self.classifier.preprocess(data)
+        except Exception as e:
+            self._send_json(400, {'error': f"无法解析图片: {e}"})
+            return
+
+        request = self.batcher.submit(array, top_k)
+        if request is None:
+            self._send_json(503, {'error': '服务繁忙，请稍后重试'})
+            return
+        if not request.done.wait(request_timeout):
+            self._send_json(504, {'error': '推理超时'})
+            return
+        if request.error is not None:
+            self._send_json(500, {'error': request.error})
+            return
+        result = dict(request.result, total_ms=(time.perf_counter() - started) * 1000)
+        self._send_json(200, result)
+
+    def log_message(self, format, *args):
+        # 高并发时逐条打印访问日志开销较大，这里关闭
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description="动物识别HTTP推理服务（动态微批处理）")
+    parser.add_argument('--model', default=model_path, help="模型路径")
+    parser.add_argument('--host', default=host, help="监听地址")
+    parser.add_argument('--port', type=int, default=port, help="监听端口")
+    parser.add_argument('--max-batch-size', type=int, default=max_batch_size, help="微批次最大图片数")
+    parser.add_argument('--max-queue-delay-ms', type=float, default=max_queue_delay_ms, help="凑批最长等待时间(ms)")
+    parser.add_argument('--max-queue-size', type=int, default=max_queue_size, help="等待队列上限")
+    args = parser.parse_args()
+
+    print("正在加载模型...")
+    classifier = AnimalClassifier(args.model, class_names_path, img_size)
+    # 预热：提前完成图追踪，避免第一个请求承担额外延迟
+    classifier.predict_batch(np.zeros((1, classifier.img_size[0], classifier.img_size[1], 3), dtype=np.float32))
+    print("模型加载成功！")
+
+    PredictHandler.classifier = classifier
+    PredictHandler.batcher = MicroBatcher(classifier, args.max_batch_size, args.max_queue_delay_ms,
+                                          args.max_queue_size)
+    server = ThreadingHTTPServer((args.host, args.port), PredictHandler)
+    server.daemon_threads = True
+    print(f"服务已启动: http://{args.host}:{args.port}/predict")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
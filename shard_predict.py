@@ -0,0 +1,259 @@
+import os
+import json
+import zlib
+import socket
+import tarfile
+import hashlib
+import zipfile
+import argparse
+from datetime import datetime
+
+from image_sources import list_sources, open_source
+from prediction_writer import prediction_row, open_writer
+from progress_store import atomic_write_json
+from animal_classifier import AnimalClassifier, load_class_names
+
+# 配置参数
+model_path = './output/model/best_model.keras'  # 模型路径
+class_names_path = 'class.txt'  # 类别名称文件路径
+img_size = None  # 输入尺寸（None时使用模型自身的输入尺寸）
+manifest_path = 'manifest.jsonl'  # 清单文件（放在共享文件系统上）
+output_dir = 'shards'  # 各分片结果目录（放在共享文件系统上）
+batch_size = 16  # 每次前向推理的图片数量
+decode_backend = 'pil-draft'  # 图片解码后端（见image_decode.py）
+
+
+def shard_of(uri, num_shards):
+    """按路径哈希分配分片：与枚举顺序、其他输入的增减无关，重建清单后分配不变"""
+    return int(hashlib.sha1(uri.encode('utf-8')).hexdigest()[:8], 16) % num_shards
+
+
+def parse_shard(text):
+    """解析 "i/N"（i从0开始）"""
+    index, _, total = text.partition('/')
+    index, total = int(index), int(total)
+    if not 0 <= index < total:
+        raise argparse.ArgumentTypeError(f"分片编号应满足 0 <= i < N: {text}")
+    return index, total
+
+
+def shard_name(index, total):
+    return f"shard-{index:05d}-of-{total:05d}"
+
+
+# ---- 清单 ----
+
+def build_manifest(inputs, num_shards, path=manifest_path):
+    """枚举输入（目录、zip或无压缩tar）生成清单：首行为元信息，之后每行一个条目"""
+    uris = []
+    for source in inputs:
+        uris.extend(list_sources(source))
+    counts = [0] * num_shards
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        header = {'num_shards': num_shards, 'count': len(uris), 'inputs': list(inputs),
+                  'created_at': datetime.now().isoformat()}
+        f.write(json.dumps(header, ensure_ascii=False) + '\n')
+        for item_id, uri in enumerate(uris):
+            shard = shard_of(uri, num_shards)
+            counts[shard] += 1
+            f.write(json.dumps({'id': item_id, 'uri': uri, 'shard': shard}, ensure_ascii=False) + '\n')
+    os.replace(tmp_path, path)
+    return header, counts
+
+
+def read_manifest(path=manifest_path, shard=None):
+    """返回(元信息, 条目列表)；指定shard时只返回该分片的条目"""
+    with open(path, 'r', encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        items = []
+        for line in f:
+            item = json.loads(line)
+            if shard is None or item['shard'] == shard:
+                items.append(item)
+    return header, items
+
+
+# ---- 单个分片 ----
+
+def read_checkpoint(path, repair=True):
+    """读取分片已有的结果（JSONL），返回{uri: 记录}
+
+    崩溃时写了一半的最后一行会被忽略；repair=True时同时从文件中截掉，以便续写
+    （合并时分片可能仍在运行，只读不截断）。
+    """
+    done = {}
+    if not os.path.exists(path):
+        return done
+    with open(path, 'rb+' if repair else 'rb') as f:
+        data = f.read()
+        complete = data[:data.rfind(b'\n') + 1]
+        if repair and len(complete) != len(data):
+            f.truncate(len(complete))
+    for line in complete.decode('utf-8').splitlines():
+        record = json.loads(line)
+        done[record['uri']] = record
+    return done
+
+
+def acquire_lock(lock_path, force=False):
+    """用O_EXCL创建锁文件，防止两台机器同时处理同一分片（只依赖共享文件系统）"""
+    if force and os.path.exists(lock_path):
+        os.remove(lock_path)
+    try:
+        fd = os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        with open(lock_path, 'r', encoding='utf-8') as f:
+            owner = f.read().strip()
+        raise RuntimeError(f"分片正在被 {owner} 处理（如确认该进程已退出，请加 --force）")
+    with os.fdopen(fd, 'w', encoding='utf-8') as f:
+        f.write(f"{socket.gethostname()}:{os.getpid()} {datetime.now().isoformat()}")
+
+
+def run_shard(index, total, manifest=manifest_path, out_dir=output_dir, retry_failed=False, force=False,
+              model=model_path):
+    """处理一个分片：结果逐条追加到shard-i-of-N.jsonl，中断后重新运行会跳过已完成的条目"""
+    header, items = read_manifest(manifest, shard=index)
+    if header['num_shards'] != total:
+        raise ValueError(f"清单按 {header['num_shards']} 个分片生成，与 --shard {index}/{total} 不一致")
+
+    os.makedirs(out_dir, exist_ok=True)
+    name = shard_name(index, total)
+    results_path = os.path.join(out_dir, name + '.jsonl')
+    done_path = os.path.join(out_dir, name + '.done.json')
+    lock_path = os.path.join(out_dir, name + '.lock')
+    acquire_lock(lock_path, force)
+    try:
+        done = read_checkpoint(results_path)
+        if retry_failed:
+            done = {uri: r for uri, r in done.items() if 'error' not in r}
+        todo = [item['uri'] for item in items if item['uri'] not in done]
+        print(f"分片 {index}/{total}: 共 {len(items)} 条，已完成 {len(items) - len(todo)} 条，待处理 {len(todo)} 条")
+
+        if todo:
+            classifier = AnimalClassifier(model, class_names_path, img_size, top_k=3,
+                                          decode_backend=decode_backend)
+
+            with open(results_path, 'a', encoding='utf-8') as f:
+                def record(entry):
+                    f.write(json.dumps(entry, ensure_ascii=False) + '\n')
+                    done[entry['uri']] = entry
+
+                def sources():
+                    for uri in todo:
+                        try:
+                            yield open_source(uri)
+                        except (OSError, KeyError, EOFError, zlib.error, zipfile.BadZipFile, tarfile.TarError) as e:
+                            # 文件或压缩包成员无法读取（包括压缩包损坏），直接记为失败，不中断整个分片
+                            record({'uri': uri, 'error': str(e)})
+
+                for i, (uri, prediction) in enumerate(classifier.iter_predictions(sources(), batch_size), 1):
+                    if 'error' in prediction:
+                        record({'uri': uri, 'error': prediction['error']})
+                    else:
+                        record(dict(prediction_row(uri, prediction), uri=uri))
+                    if i % batch_size == 0:
+                        f.flush()  # 每批落盘一次，中断最多重算一批
+                    if i % 100 == 0:
+                        print(f"已处理 {i}/{len(todo)} 张图片")
+                f.flush()
+                os.fsync(f.fileno())
+
+        failed = sum(1 for item in items if 'error' in done.get(item['uri'], {}))
+        atomic_write_json(done_path, {
+            'shard': index, 'num_shards': total, 'items': len(items), 'failed': failed,
+            'host': socket.gethostname(), 'finished_at': datetime.now().isoformat(),
+        }, indent=2)
+        print(f"分片 {index}/{total} 完成，失败 {failed} 条")
+    finally:
+        os.remove(lock_path)
+
+
+# ---- 合并 ----
+
+def merge(manifest=manifest_path, out_dir=output_dir, output='predictions.csv', report_path=None):
+    """合并各分片结果（按分片顺序，分片内按清单顺序），并报告缺失、失败和未完成的分片
+
+    分片结果逐个读取，内存中同时只保存一个分片的结果。
+    """
+    # 只扫描一遍清单，按分片归组
+    with open(manifest, 'r', encoding='utf-8') as f:
+        header = json.loads(f.readline())
+        total = header['num_shards']
+        shard_uris = [[] for _ in range(total)]
+        for line in f:
+            item = json.loads(line)
+            shard_uris[item['shard']].append(item['uri'])
+    missing, failed, incomplete_shards = [], [], []
+    with open_writer(output, load_class_names(class_names_path)) as writer:
+        for index in range(total):
+            name = shard_name(index, total)
+            if not os.path.exists(os.path.join(out_dir, name + '.done.json')):
+                incomplete_shards.append(index)
+            results = read_checkpoint(os.path.join(out_dir, name + '.jsonl'), repair=False)
+            for uri in shard_uris[index]:
+                record = results.get(uri)
+                if record is None:
+                    missing.append(uri)
+                elif 'error' in record:
+                    failed.append({'uri': uri, 'error': record['error']})
+                else:
+                    record.pop('uri')
+                    writer.write_row(record)
+
+    report = {
+        'manifest_items': header['count'],
+        'merged': writer.rows_written,
+        'missing': len(missing),
+        'failed': len(failed),
+        'incomplete_shards': incomplete_shards,
+        'missing_items': missing,
+        'failed_items': failed,
+    }
+    report_path = report_path or os.path.join(out_dir, 'merge_report.json')
+    atomic_write_json(report_path, report, indent=2)
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="基于清单的分片批量预测（多机共享文件系统，无需协调服务）")
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('build-manifest', help="枚举输入并生成带分片分配的清单")
+    p.add_argument('inputs', nargs='+', help="图片目录、zip或无压缩tar")
+    p.add_argument('--shards', type=int, required=True, help="分片数N")
+    p.add_argument('--manifest', default=manifest_path, help="清单路径")
+
+    p = sub.add_parser('run', help="处理一个分片（可断点续跑）")
+    p.add_argument('--shard', type=parse_shard, required=True, help="分片 i/N，i从0开始")
+    p.add_argument('--manifest', default=manifest_path, help="清单路径")
+    p.add_argument('--output-dir', default=output_dir, help="分片结果目录")
+    p.add_argument('--retry-failed', action='store_true', help="重新处理之前失败的条目")
+    p.add_argument('--force', action='store_true', help="忽略残留的分片锁")
+    p.add_argument('--model', default=model_path, help="模型路径")
+
+    p = sub.add_parser('merge', help="合并各分片结果并报告缺失/失败条目")
+    p.add_argument('--manifest', default=manifest_path, help="清单路径")
+    p.add_argument('--output-dir', default=output_dir, help="分片结果目录")
+    p.add_argument('--output', default='predictions.csv', help="合并结果路径（.csv 或 .parquet）")
+    args = parser.parse_args()
+
+    if args.command == 'build-manifest':
+        header, counts = build_manifest(args.inputs, args.shards, args.manifest)
+        print(f"清单已保存至 {args.manifest}: 共 {header['count']} 条，{args.shards} 个分片")
+        print(f"各分片条目数: 最少 {min(counts)}，最多 {max(counts)}")
+    elif args.command == 'run':
+        os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
+        run_shard(*args.shard, args.manifest, args.output_dir, args.retry_failed, args.force, args.model)
+    else:
+        report = merge(args.manifest, args.output_dir, args.output)
+        print(f"合并完成: {report['merged']}/{report['manifest_items']} 条结果已保存至 {args.output}")
+        print(f"缺失 {report['missing']} 条，失败 {report['failed']} 条，"
+              f"未完成分片: {report['incomplete_shards'] or '无'}")
+        if report['missing'] or report['failed'] or report['incomplete_shards']:
+            print(f"详细列表见 {os.path.join(args.output_dir, 'merge_report.json')}")
+            exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+import os
+import csv
+import argparse
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from PIL import Image
+
+from image_decode import decode_image
+from image_sources import is_archive, iter_sources
+
+# 配置参数
+model_path = './output/model/best_model.keras'  # 模型路径
+class_names_path = 'class.txt'  # 类别名称文件路径
+img_size = None  # 输入尺寸即切块尺寸（None时使用模型自身的输入尺寸）
+tile_overlap = 0.25  # 相邻切块的重叠比例
+pooling = 'max'  # 切块结果聚合方式：max（小目标更敏感）/ mean
+include_global = True  # 是否把整图缩放后的结果也作为一个"切块"参与聚合（照顾占满画面的大目标）
+batch_size = 16  # 每次前向推理的切块数（可来自多张图片）
+decode_workers = 2  # 解码线程数（全分辨率解码，内存占用较大，不宜过多）
+output_csv = 'tiled_predictions.csv'  # 每张图片的聚合结果
+top_k = 3
+
+
+def tile_grid(height, width, tile, overlap=tile_overlap):
+    """计算覆盖整张图片的切块左上角坐标；最后一行/列贴齐右下边缘"""
+
+    def starts(length):
+        if length <= tile:
+            return [0]
+        stride = max(1, int(tile * (1 - overlap)))
+        positions = list(range(0, length - tile, stride))
+        positions.append(length - tile)
+        return positions
+
+    return [(y, x) for y in starts(height) for x in starts(width)]
+
+
+class TileBatcher:
+    """把一张或多张图片的切块写入预分配的批缓冲区，凑满一批就推理
+
+    切块直接从解码后的整图缓冲区按视图切片写入批缓冲区的槽位，不产生单独的切块副本；
+    多张图片的切块可以共享同一批次，某张图片的全部切块推理完成后产出其结果。
+    """
+
+    def __init__(self, classifier, batch_size=batch_size, overlap=tile_overlap, include_global=include_global):
+        self.classifier = classifier
+        self.tile = classifier.img_size
+        self.overlap = overlap
+        self.include_global = include_global
+        self.buffer = np.empty((batch_size, self.tile[0], self.tile[1], 3), dtype=np.uint8)
+        self.slots = []  # 每个槽位对应的(图片编号, 切块编号)
+        self.images = {}  # 图片编号 -> 等待中的图片信息
+        self.next_id = 0
+
+    def add(self, name, array):
+        """加入一张已解码的RGB uint8图片，返回因此完成的[(名称, 切块坐标, 切块概率), ...]"""
+        height, width = array.shape[:2]
+        th, tw = self.tile
+        scale = 1.0
+        if height < th or width < tw:
+            # 比切块还小的边先放大到切块尺寸
+            scale = max(th / height, tw / width)
+            array = np.asarray(Image.fromarray(array).resize(
+                (max(tw, round(width * scale)), max(th, round(height * scale))), Image.NEAREST))
+
+        grid = tile_grid(array.shape[0], array.shape[1], th, self.overlap)
+        views = [array[y:y + th, x:x + tw] for y, x in grid]
+        # 输出坐标换算回原图像素
+        coords = [(round(x / scale), round(y / scale), round(tw / scale), round(th / scale)) for y, x in grid]
+        if self.include_global and len(grid) > 1:
+            coords.append((0, 0, width, height))
+            views.append(np.asarray(Image.fromarray(array).resize((tw, th), Image.NEAREST)))
+
+        return self.add_views(name, views, coords)
+
+    def add_views(self, name, views, coords):
+        """加入一张图片的若干个输入尺寸的视图（切块、TTA增强视图等），coords为每个视图的说明"""
+        image_id = self.next_id
+        self.next_id += 1
+        self.images[image_id] = {'name': name, 'coords': coords, 'probs': [None] * len(coords),
+                                 'remaining': len(coords)}
+        finished = []
+        for tile_index, view in enumerate(views):
+            slot = len(self.slots)
+            self.buffer[slot] = view
+            self.slots.append((image_id, tile_index))
+            if len(self.slots) == len(self.buffer):
+                finished.extend(self.flush())
+        return finished
+
+    def flush(self):
+        """推理当前批缓冲区中的切块，返回因此完成的图片结果"""
+        if not self.slots:
+            return []
+        batch = self.buffer[:len(self.slots)]
+        if not self.classifier.uint8_input:
+            batch = batch.astype(np.float32) / 255.0
+        probabilities = self.classifier.predict_batch(batch)
+
+        finished = []
+        for (image_id, tile_index), probs in zip(self.slots, probabilities):
+            info = self.images[image_id]
+            info['probs'][tile_index] = probs
+            info['remaining'] -= 1
+            if info['remaining'] == 0:
+                del self.images[image_id]
+                finished.append((info['name'], info['coords'], np.stack(info['probs'])))
+        self.slots = []
+        return finished
+
+
+def aggregate(classifier, coords, tile_probs, pooling=pooling, top_k=top_k):
+    """按max/mean聚合切块概率，并给出每个候选类别得分最高的切块坐标"""
+    pooled = tile_probs.max(axis=0) if pooling == 'max' else tile_probs.mean(axis=0)
+    top_indices = np.argsort(pooled)[::-1][:top_k]
+    candidates = []
+    for i in top_indices:
+        best_tile = int(np.argmax(tile_probs[:, i]))
+        candidates.append({
+            'class': classifier.class_name(i),
+            'score': float(pooled[i]),
+            'best_tile': coords[best_tile],
+            'best_tile_confidence': float(tile_probs[best_tile, i]),
+        })
+    return {'predicted_class': candidates[0]['class'], 'confidence': candidates[0]['score'],
+            'candidates': candidates, 'num_tiles': len(coords)}
+
+
+def iter_decoded(sources, target_size, backend='pil', workers=decode_workers, prefilter=None):
+    """在线程池中解码图片，逐个产出(名称, RGB uint8数组, 错误信息)
+
+    sources的元素为文件路径或(名称, 字节)；最多预取workers*2张，控制内存占用。
+    传入prefilter（见prefilter.py）时先在解码线程中检查缩略图，被筛掉的图片不解码，
+    产出(名称, None, {'skipped': 原因})，与iter_predictions的跳过结果一致。
+    """
+
+    def decode(item):
+        name, source = item if isinstance(item, tuple) else (item, item)
+        metrics = None
+        try:
+            if prefilter is not None:
+                metrics = prefilter.analyze(source)
+                if metrics['reason'] is not None:
+                    return name, None, None, metrics
+            return name, decode_image(source, target_size, backend), None, metrics
+        except Exception as e:
+            return name, None, str(e), metrics
+
+    def finish(name, array, error, metrics):
+        if prefilter is not None and error is None:
+            # 帧差等依赖前后顺序的判断在这里按输入顺序进行
+            reason = prefilter.decide(name, metrics)
+            if reason is not None:
+                return name, None, {'skipped': reason}
+        return name, array, error
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending = deque()
+        iterator = iter(sources)
+        while True:
+            while len(pending) < workers * 2:
+                item = next(iterator, None)
+                if item is None:
+                    break
+                pending.append(executor.submit(decode, item))
+            if not pending:
+                break
+            yield finish(*pending.popleft().result())
+
+
+def iter_tiled_predictions(classifier, sources, batch_size=batch_size, overlap=tile_overlap,
+                           include_global=include_global, workers=decode_workers):
+    """流式切块预测：逐个产出(名称, 切块坐标, 切块概率)或(名称, None, 错误信息)"""
+    batcher = TileBatcher(classifier, batch_size, overlap, include_global)
+    # 使用全分辨率解码，切块需要原始像素
+    for name, array, error in iter_decoded(sources, classifier.img_size, 'pil', workers):
+        if error is not None:
+            yield name, None, error
+            continue
+        yield from batcher.add(name, array)
+    yield from batcher.flush()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="高分辨率图片切块识别")
+    parser.add_argument('input', help="图片目录或tar/zip压缩包")
+    parser.add_argument('--model', default=model_path, help="模型路径")
+    parser.add_argument('--output', default=output_csv, help="聚合结果CSV路径")
+    parser.add_argument('--tiles-output', help="逐切块结果CSV路径（可选）")
+    parser.add_argument('--pooling', choices=['max', 'mean'], default=pooling, help="切块结果聚合方式")
+    parser.add_argument('--overlap', type=float, default=tile_overlap, help="相邻切块重叠比例")
+    parser.add_argument('--no-global', action='store_true', help="不加入整图缩放结果")
+    args = parser.parse_args()
+
+    os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
+    from animal_classifier import AnimalClassifier
+
+    print("正在加载模型...")
+    classifier = AnimalClassifier(args.model, class_names_path, img_size, top_k=top_k)
+    sources = iter_sources(args.input)
+    if not is_archive(args.input):
+        sources = list(sources)
+        if not sources:
+            print(f"在目录 {args.input} 中未找到图片文件")
+            exit(1)
+
+    fields = ['file_path', 'pooling', 'num_tiles', 'predicted_class', 'confidence']
+    for k in range(1, top_k + 1):
+        fields += [f'top{k}_class', f'top{k}_score', f'top{k}_tile']
+    tiles_file = open(args.tiles_output, 'w', newline='', encoding='utf-8-sig') if args.tiles_output else None
+    tiles_writer = None
+    if tiles_file:
+        tiles_writer = csv.writer(tiles_file)
+        tiles_writer.writerow(['file_path', 'tile_index', 'x', 'y', 'width', 'height', 'class', 'confidence'])
+
+    count = 0
+    with open(args.output, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for name, coords, tile_probs in iter_tiled_predictions(classifier, sources, overlap=args.overlap,
+                                                               include_global=not args.no_global):
+            if coords is None:
+                print(f"图片处理失败 {name}: {tile_probs}")
+                continue
+            result = aggregate(classifier, coords, tile_probs, args.pooling)
+            row = {'file_path': name, 'pooling': args.pooling, 'num_tiles': result['num_tiles'],
+                   'predicted_class': result['predicted_class'], 'confidence': result['confidence']}
+            for k, candidate in enumerate(result['candidates'], 1):
+                row[f'top{k}_class'] = candidate['class']
+                row[f'top{k}_score'] = candidate['score']
+                row[f'top{k}_tile'] = '{},{},{},{}'.format(*candidate['best_tile'])
+            writer.writerow(row)
+            if tiles_writer:
+                for tile_index, ((x, y, w, h), probs) in enumerate(zip(coords, tile_probs)):
+                    best = int(np.argmax(probs))
+                    tiles_writer.writerow([name, tile_index, x, y, w, h, classifier.class_name(best),
+                                           float(probs[best])])
+            count += 1
+            if count % 10 == 0:
+                print(f"已处理 {count} 张图片")
+    if tiles_file:
+        tiles_file.close()
+    print(f"\n切块预测完成！共 {count} 张图片，结果已保存至: {args.output}")
@@ -1,22 +1,21 @@
-import os
 import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 import tensorflow as tf
 from tensorflow.keras.preprocessing.image import ImageDataGenerator
-from tensorflow.keras.applications import EfficientNetB6
-from tensorflow.keras.models import Model, save_model, load_model
-from tensorflow.keras.layers import Dense, GlobalAveragePooling2D, Dropout, BatchNormalization, Lambda
+from tensorflow.keras.models import load_model
 from tensorflow.keras.optimizers import Adam
 from tensorflow.keras.callbacks import EarlyStopping, ModelCheckpoint, ReduceLROnPlateau, LearningRateScheduler, Callback
-from tensorflow.keras.regularizers import l2
 from sklearn.metrics import confusion_matrix, classification_report
 import seaborn as sns
 import random
 import math
-
-# 启用混合精度训练以加速（GPU兼容）
-tf.keras.mixed_precision.set_global_policy('mixed_float16')
+from image_decode import load_image
+from prediction_writer import save_report
+from progress_store import atomic_write_json
+from animal_classifier import cast_to_float32
+from backbones import build_classifier, get_backbone
+from precision import select_policy
 
 # 设置随机种子确保可复现性
 tf.random.set_seed(42)
@@ -36,14 +35,24 @@ class LRTracker(Callback):
 
 # 参数配置
 data_dir = '/kaggle/input/animals/Animal/Animal'  # 数据集路径
-num_classes = 100
-img_size = (456, 456)  # B6模型推荐尺寸
+backbone = 'efficientnetb6'  # 主干网络：efficientnetb0-b7 / mobilenetv3small / mobilenetv3large / resnet50（见backbones.py）
+img_size = (456, 456)  # 输入尺寸（None时使用主干的推荐尺寸）
+freeze_fraction = 0.3  # 按相对深度冻结主干的前30%（对齐到block边界；B6约为原来的前200层）
 batch_size = 12  # 增加批次大小以提高GPU利用率
 epochs = 20  # 减少轮数以适应12小时限制
 patience = 5  # 早停等待轮数
 l2_reg = 1e-4  # L2正则化系数
 dropout_rate = 0.3  # Dropout比率
 initial_lr = 1e-4  # 初始学习率
+decode_backend = 'pil-draft'  # 样本可视化时的图片解码后端（见image_decode.py）
+report_format = 'xlsx'  # 训练报表格式：xlsx / parquet（列式存储，需要pyarrow）
+precision_policy = 'auto'  # 精度策略：auto（GPU用mixed_float16，支持BF16的CPU用mixed_bfloat16，否则float32）或手动指定
+
+img_size = tuple(img_size or (get_backbone(backbone)['img_size'],) * 2)
+
+# 按设备选择精度策略（CPU上模拟float16很慢），并做一次启动探测
+precision_report = select_policy(precision_policy)
+atomic_write_json('/kaggle/working/precision_policy.json', precision_report)
 
 # 创建数据增强
 train_datagen = ImageDataGenerator(
@@ -84,6 +93,10 @@ val_generator = train_datagen.flow_from_directory(
 
 # 获取类别名称
 class_names = list(train_generator.class_indices.keys())
+num_classes = len(class_names)  # 按数据集子目录数确定（extend_classes.py追加的类别重新训练时自动包含）
+# 类别名称按模型输出顺序保存，与模型一起部署
+with open('/kaggle/working/class.txt', 'w', encoding='utf-8') as f:
+    f.write('\n'.join(class_names))
 print(f"训练样本数: {train_generator.samples}, 验证样本数: {val_generator.samples}")
 
 # 加速学习率调度
@@ -104,33 +117,8 @@ def accelerated_lr_schedule(epoch):
 
 # 构建模型
 def create_model():
-    base_model = EfficientNetB6(
-        include_top=False,
-        weights='imagenet',
-        input_shape=(img_size[0], img_size[1], 3),
-        pooling=None
-    )
-    
-    # 冻结底层，微调上层
-    base_model.trainable = True
-    for layer in base_model.layers[:200]:
-        layer.trainable = False
-    
-    # 添加自定义顶层
-    x = base_model.output
-    x = GlobalAveragePooling2D()(x)
-    x = Dense(1024, activation='relu', kernel_regularizer=l2(l2_reg))(x)
-    x = BatchNormalization()(x)
-    x = Dropout(dropout_rate)(x)
-    x = Dense(512, activation='relu', kernel_regularizer=l2(l2_reg))(x)
-    x = BatchNormalization()(x)
-    x = Dropout(dropout_rate/2)(x)
-    
-    # 修复：使用Lambda层进行类型转换
-    x = Lambda(lambda t: tf.cast(t, tf.float32))(x)
-    predictions = Dense(num_classes, activation='softmax', dtype=tf.float32)(x)
-    
-    model = Model(inputs=base_model.input, outputs=predictions)
+    # 主干、输入尺寸与冻结深度均可配置；冻结底层，微调上层，顶层结构见backbones.build_classifier
+    model = build_classifier(num_classes, backbone, img_size, freeze_fraction, l2_reg, dropout_rate)
     
     model.compile(
         optimizer=Adam(learning_rate=initial_lr),
@@ -189,7 +177,7 @@ if 'lr' not in history.history:
 
 # 保存训练历史
 history_df = pd.DataFrame(history.history)
-history_df.to_excel('/kaggle/working/training_history.xlsx', index=False)
+save_report(history_df, f'/kaggle/working/training_history.{report_format}')
 
 # 绘制训练曲线
 plt.figure(figsize=(12, 10))
@@ -225,7 +213,7 @@ plt.savefig('/kaggle/working/training_metrics.png', dpi=150)
 plt.close()
 
 # 加载最佳模型
-model = load_model('/kaggle/working/best_model.keras')
+model = load_model('/kaggle/working/best_model.keras', custom_objects={'cast_to_float32': cast_to_float32})
 
 # 在验证集上评估
 print("\n在验证集上评估模型...")
@@ -277,7 +265,7 @@ for i, class_name in enumerate(class_names):
 
 # 保存类别准确率结果
 metrics_df = pd.DataFrame(class_metrics)
-metrics_df.to_excel('/kaggle/working/class_accuracy_report.xlsx', index=False)
+save_report(metrics_df, f'/kaggle/working/class_accuracy_report.{report_format}')
 
 # 绘制混淆矩阵热力图（简化版，只显示前20类）
 plt.figure(figsize=(15, 13))
@@ -315,8 +303,7 @@ sample_probs = []
 
 for idx in sample_indices:
     img_path = val_generator.filepaths[idx]
-    img = tf.keras.preprocessing.image.load_img(img_path, target_size=img_size)
-    img_array = tf.keras.preprocessing.image.img_to_array(img) / 255.0
+    img_array = load_image(img_path, img_size, decode_backend) / 255.0
     sample_images.append(img_array)
     sample_true_labels.append(class_names[y_true[idx]])
     
@@ -347,8 +334,8 @@ minutes = int(total_minutes % 60)
 print("="*50)
 print("所有操作已完成！")
 print(f"最佳模型已保存为: best_model.keras")
-print(f"训练历史已保存为: training_history.xlsx")
-print(f"类别准确率报告已保存为: class_accuracy_report.xlsx")
+print(f"训练历史已保存为: training_history.{report_format}")
+print(f"类别准确率报告已保存为: class_accuracy_report.{report_format}")
 print(f"验证集准确率: {val_acc:.4f}")
 print(f"总训练时间: {hours}小时 {minutes}分钟")
 print("="*50)
\ No newline at end of file
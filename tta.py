@@ -0,0 +1,157 @@
+import os
+import argparse
+import numpy as np
+from PIL import Image
+
+from tiling import TileBatcher, iter_decoded
+from image_sources import is_archive, iter_sources
+from prediction_writer import open_writer
+
+# 配置参数
+model_path = './output/model/best_model.keras'  # 模型路径
+class_names_path = 'class.txt'  # 类别名称文件路径
+img_size = None  # 输入尺寸（None时使用模型自身的输入尺寸）
+tta_views = ('full', 'hflip', 'center', 'top_left', 'top_right', 'bottom_left', 'bottom_right',
+             'scale_0.85', 'scale_1.15')  # 默认使用的增强视图
+crop_fraction = 0.875  # 中心/四角裁剪保留的边长比例
+low_confidence = None  # 只对原图置信度低于该值的图片做TTA（None表示全部图片都做）
+batch_size = 32  # 每次前向推理的视图数（可来自多张图片）
+decode_workers = 4
+output_csv = 'predictions_tta.csv'
+
+
+def resize(array, size):
+    """最近邻缩放（与训练时flow_from_directory一致）"""
+    if array.shape[:2] == tuple(size):
+        return array
+    return np.asarray(Image.fromarray(array).resize((size[1], size[0]), Image.NEAREST))
+
+
+def make_view(array, view, size, crop=crop_fraction):
+    """从同一张已解码图片生成一个增强视图（输出为size大小的uint8数组）"""
+    height, width = array.shape[:2]
+    if view == 'full':
+        return resize(array, size)
+    if view == 'hflip':
+        return resize(array, size)[:, ::-1]
+    if view == 'vflip':
+        return resize(array, size)[::-1]
+    if view.startswith('scale_'):
+        # 先整体缩放，再中心裁剪（放大）或边缘填充（缩小）回目标尺寸
+        scale = float(view[len('scale_'):])
+        scaled = resize(array, (max(1, round(size[0] * scale)), max(1, round(size[1] * scale))))
+        if scale >= 1:
+            y = (scaled.shape[0] - size[0]) // 2
+            x = (scaled.shape[1] - size[1]) // 2
+            return scaled[y:y + size[0], x:x + size[1]]
+        pad_y, pad_x = size[0] - scaled.shape[0], size[1] - scaled.shape[1]
+        return np.pad(scaled, ((pad_y // 2, pad_y - pad_y // 2), (pad_x // 2, pad_x - pad_x // 2), (0, 0)),
+                      mode='edge')
+
+    ch, cw = round(height * crop), round(width * crop)
+    offsets = {
+        'center': ((height - ch) // 2, (width - cw) // 2),
+        'top_left': (0, 0),
+        'top_right': (0, width - cw),
+        'bottom_left': (height - ch, 0),
+        'bottom_right': (height - ch, width - cw),
+    }
+    if view not in offsets:
+        raise ValueError(f"未知的TTA视图: {view}")
+    y, x = offsets[view]
+    return resize(array[y:y + ch, x:x + cw], size)
+
+
+def iter_tta_predictions(classifier, sources, views=tta_views, batch_size=batch_size,
+                         low_confidence=low_confidence, workers=decode_workers, prefilter=None):
+    """批量TTA预测：逐个产出(名称, 结果)
+
+    每张图片只解码一次，所有增强视图都从同一个解码缓冲区生成，多张图片的视图共享同一次前向推理，
+    最后对各视图的概率取平均。结果在format_result的基础上增加'tta_views'（实际使用的视图数）。
+    指定low_confidence时先只推理原图，置信度低于阈值的图片才追加其余视图。
+    传入prefilter时被筛掉的图片不解码、不进模型，结果为{'skipped': 原因}。
+    """
+    batcher = TileBatcher(classifier, batch_size)
+    views = list(views)
+    extra_views = [v for v in views if v != 'full']
+    first_pass = []  # 选择性TTA时等待原图推理的(名称, 解码数组)
+    full_probs = {}  # 选择性TTA时已得到的原图概率
+
+    def finish(done):
+        for name, used_views, probs in done:
+            if name in full_probs:
+                probs = np.vstack([full_probs.pop(name)[np.newaxis], probs])
+                used_views = ['full'] + list(used_views)
+            result = classifier.format_result(probs.mean(axis=0))
+            result['tta_views'] = len(used_views)
+            yield name, result
+
+    def run_first_pass():
+        batch = np.stack([classifier.preprocess(resize(array, classifier.img_size)) for _, array in first_pass])
+        for (name, array), probs in zip(first_pass, classifier.predict_batch(batch)):
+            if probs.max() >= low_confidence or not extra_views:
+                result = classifier.format_result(probs)
+                result['tta_views'] = 1
+                yield name, result
+            else:
+                full_probs[name] = probs
+                yield from finish(batcher.add_views(
+                    name, [make_view(array, v, classifier.img_size) for v in extra_views], extra_views))
+        first_pass.clear()
+
+    for name, array, error in iter_decoded(sources, classifier.img_size, classifier.decode_backend, workers,
+                                           prefilter):
+        if error is not None:
+            yield name, error if isinstance(error, dict) else {'error': error}
+            continue
+        if low_confidence is None:
+            yield from finish(batcher.add_views(
+                name, [make_view(array, v, classifier.img_size) for v in views], views))
+        else:
+            first_pass.append((name, array))
+            if len(first_pass) == batch_size:
+                yield from run_first_pass()
+    if first_pass:
+        yield from run_first_pass()
+    yield from finish(batcher.flush())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="批量测试时增强(TTA)预测")
+    parser.add_argument('input', help="图片目录或tar/zip压缩包")
+    parser.add_argument('--model', default=model_path, help="模型路径")
+    parser.add_argument('--output', default=output_csv, help="结果保存路径（.csv 或 .parquet）")
+    parser.add_argument('--views', nargs='+', default=list(tta_views),
+                        help="增强视图: full hflip vflip center top_left top_right bottom_left bottom_right scale_<s>")
+    parser.add_argument('--low-confidence', type=float, default=low_confidence,
+                        help="只对原图置信度低于该值的图片做TTA")
+    args = parser.parse_args()
+
+    os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
+    from animal_classifier import AnimalClassifier
+
+    print("正在加载模型...")
+    classifier = AnimalClassifier(args.model, class_names_path, img_size, top_k=3)
+    sources = iter_sources(args.input)
+    if not is_archive(args.input):
+        sources = list(sources)
+        if not sources:
+            print(f"在目录 {args.input} 中未找到图片文件")
+            exit(1)
+
+    images = views_total = 0
+    with open_writer(args.output, classifier.class_names) as writer:
+        for name, prediction in iter_tta_predictions(classifier, sources, args.views,
+                                                     low_confidence=args.low_confidence):
+            if 'error' in prediction:
+                print(f"图片处理失败 {name}: {prediction['error']}")
+                continue
+            writer.write(name, prediction)
+            images += 1
+            views_total += prediction['tta_views']
+            if images % 10 == 0:
+                print(f"已处理 {images} 张图片")
+
+    print(f"\nTTA预测完成！共 {images} 张图片，结果已保存至: {args.output}")
+    if images:
+        print(f"平均每张图片推理 {views_total / images:.2f} 个视图")
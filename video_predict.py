@@ -0,0 +1,260 @@
+import os
+import csv
+import time
+import queue
+import argparse
+import threading
+import numpy as np
+import cv2
+
+# 配置参数
+model_path = './output/model/best_model.keras'  # 模型路径
+class_names_path = 'class.txt'  # 类别名称文件路径
+img_size = None  # 输入尺寸（None时使用模型自身的输入尺寸）
+video_extensions = ('.mp4', '.avi', '.mov', '.mkv', '.m4v', '.wmv')
+output_csv = 'video_segments.csv'  # 片段结果保存路径
+batch_size = 16  # 每次前向推理的帧数
+sample_fps = 2.0  # 固定采样模式下每秒送入模型的帧数
+scene_check_fps = 5.0  # 场景切换模式下每秒检查的帧数
+scene_threshold = 12.0  # 场景切换阈值（缩略灰度图的平均像素差，0-255）
+scene_max_interval = 2.0  # 场景切换模式下两次采样的最长间隔(秒)，静止画面也会定期采样
+smoothing_seconds = 1.0  # 概率指数滑动平均的时间常数(秒)，越大越平滑
+min_segment_seconds = 1.0  # 短于该时长的片段并入前一个片段
+min_confidence = 0.3  # 平滑后置信度低于该值的帧记为"未识别"
+unknown_label = '未识别'
+
+
+class FrameReader:
+    """后台线程解码视频并采样
+
+    不需要的帧只调用grab()（解复用+解码，不做颜色转换和拷贝），采样帧才retrieve()；
+    采样帧在线程内缩放到模型输入尺寸，主线程只负责拼批和推理。
+    mode='fps'时按sample_fps均匀采样；mode='scene'时按scene_check_fps检查画面，
+    与上一个采样帧差异超过scene_threshold或间隔超过scene_max_interval才送入模型。
+    """
+
+    def __init__(self, path, img_size, mode='fps', sample_fps=sample_fps,
+                 scene_check_fps=scene_check_fps, scene_threshold=scene_threshold,
+                 scene_max_interval=scene_max_interval, queue_size=64):
+        self.capture = cv2.VideoCapture(path)
+        if not self.capture.isOpened():
+            raise IOError(f"无法打开视频: {path}")
+        self.img_size = img_size
+        self.mode = mode
+        self.fps = self.capture.get(cv2.CAP_PROP_FPS) or 25.0
+        self.frame_count = int(self.capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        check_fps = sample_fps if mode == 'fps' else scene_check_fps
+        self.step = max(1, int(round(self.fps / check_fps)))
+        self.scene_threshold = scene_threshold
+        self.scene_max_interval = scene_max_interval
+        self.frames = queue.Queue(maxsize=queue_size)
+        self.decoded = 0
+        self.sampled = 0
+        self.error = None
+        self.stopped = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        last_thumb = None
+        last_time = None
+        index = 0
+        try:
+            while not self.stopped:
+                if not self.capture.grab():
+                    break
+                self.decoded += 1
+                if index % self.step == 0:
+                    ok, frame = self.capture.retrieve()
+                    if ok:
+                        timestamp = index / self.fps
+                        if self.mode == 'scene':
+                            thumb = cv2.resize(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), (64, 36),
+                                               interpolation=cv2.INTER_AREA).astype(np.int16)
+                            changed = last_thumb is None or np.abs(thumb - last_thumb).mean() > self.scene_threshold
+                            if not changed and timestamp - last_time < self.scene_max_interval:
+                                index += 1
+                                continue
+                            last_thumb, last_time = thumb, timestamp
+                        array = cv2.resize(frame, (self.img_size[1], self.img_size[0]),
+                                           interpolation=cv2.INTER_NEAREST)
+                        self.frames.put((index, timestamp, cv2.cvtColor(array, cv2.COLOR_BGR2RGB)))
+                        self.sampled += 1
+                index += 1
+        except Exception as e:
+            self.error = e
+        finally:
+            self.capture.release()
+            self.frames.put(None)
+
+    def __iter__(self):
+        while True:
+            item = self.frames.get()
+            if item is None:
+                break
+            yield item
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        self.stopped = True
+        # 清空队列，避免后台线程阻塞在put上
+        while self.thread.is_alive():
+            try:
+                self.frames.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+
+def predict_frames(classifier, reader, batch_size=batch_size):
+    """按批推理采样帧，返回[(帧号, 时间戳, 概率向量), ...]"""
+    results = []
+    batch, meta = [], []
+
+    def run_batch():
+        for (index, timestamp), probs in zip(meta, classifier.predict_batch(np.stack(batch))):
+            results.append((index, timestamp, probs))
+        batch.clear()
+        meta.clear()
+
+    for index, timestamp, array in reader:
+        batch.append(classifier.preprocess(array))
+        meta.append((index, timestamp))
+        if len(batch) == batch_size:
+            run_batch()
+    if batch:
+        run_batch()
+    return results
+
+
+def smooth(frame_results, time_constant=smoothing_seconds):
+    """对概率向量做指数滑动平均，抑制单帧抖动
+
+    权重按相邻采样帧的时间间隔计算，场景切换模式下采样不均匀时平滑程度仍与时间对应。
+    """
+    smoothed = []
+    state = None
+    last_time = None
+    for index, timestamp, probs in frame_results:
+        if state is None:
+            state = probs
+        else:
+            weight = 1.0 - np.exp(-(timestamp - last_time) / time_constant)
+            state = weight * probs + (1 - weight) * state
+        last_time = timestamp
+        smoothed.append((index, timestamp, state))
+    return smoothed
+
+
+def build_segments(smoothed, class_name, frame_interval, min_segment=min_segment_seconds,
+                   min_conf=min_confidence):
+    """把逐帧平滑结果合并为片段[{'start', 'end', 'label', 'confidence', 'frames'}]
+
+    每个采样帧覆盖到下一个采样帧为止，最后一帧覆盖frame_interval。
+    """
+    segments = []
+    for i, (index, timestamp, probs) in enumerate(smoothed):
+        end = smoothed[i + 1][1] if i + 1 < len(smoothed) else timestamp + frame_interval
+        idx = int(np.argmax(probs))
+        label = class_name(idx) if probs[idx] >= min_conf else unknown_label
+        if segments and segments[-1]['label'] == label:
+            segment = segments[-1]
+            segment['end'] = end
+            segment['scores'].append(probs)
+        else:
+            segments.append({'start': timestamp, 'end': end, 'label': label,
+                             'class_index': idx, 'scores': [probs]})
+
+    # 过短的片段并入前一个片段，再合并相邻的同类片段
+    merged = []
+    for segment in segments:
+        if merged and (segment['end'] - segment['start'] < min_segment or merged[-1]['label'] == segment['label']):
+            merged[-1]['end'] = segment['end']
+            merged[-1]['scores'].extend(segment['scores'])
+        else:
+            merged.append(segment)
+
+    for segment in merged:
+        scores = np.stack(segment.pop('scores'))
+        idx = segment.pop('class_index')
+        segment['frames'] = len(scores)
+        segment['confidence'] = float(scores[:, idx].mean())
+    return merged
+
+
+def predict_video(classifier, path, batch_size=batch_size, **reader_options):
+    """识别单个视频，返回(片段列表, 统计信息)；reader_options透传给FrameReader"""
+    started = time.perf_counter()
+    reader = FrameReader(path, classifier.img_size, **reader_options)
+    try:
+        frame_results = predict_frames(classifier, reader, batch_size)
+    finally:
+        reader.close()
+    elapsed = time.perf_counter() - started
+
+    # 采样帧代表到下一个检查点为止的时间
+    frame_interval = reader.step / reader.fps
+    segments = build_segments(smooth(frame_results), classifier.class_name, frame_interval)
+    duration = reader.decoded / reader.fps
+    stats = {
+        'video': path,
+        'duration_s': duration,
+        'decoded_frames': reader.decoded,
+        'sampled_frames': reader.sampled,
+        'elapsed_s': elapsed,
+        'decoded_fps': reader.decoded / elapsed if elapsed > 0 else 0.0,
+        'realtime_factor': duration / elapsed if elapsed > 0 else 0.0,
+    }
+    return segments, stats
+
+
+def list_videos(path):
+    if os.path.isfile(path):
+        return [path]
+    videos = []
+    for root, _, names in os.walk(path):
+        videos.extend(os.path.join(root, n) for n in names if n.lower().endswith(video_extensions))
+    return sorted(videos)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="视频动物识别（后台解码、帧采样、时序平滑）")
+    parser.add_argument('input', help="视频文件或目录")
+    parser.add_argument('--model', default=model_path, help="模型路径")
+    parser.add_argument('--output', default=output_csv, help="片段结果CSV路径")
+    parser.add_argument('--mode', choices=['fps', 'scene'], default='fps', help="采样方式：固定帧率 / 场景切换")
+    parser.add_argument('--sample-fps', type=float, default=sample_fps, help="固定采样模式的采样帧率")
+    parser.add_argument('--scene-threshold', type=float, default=scene_threshold, help="场景切换阈值")
+    args = parser.parse_args()
+
+    os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
+    from animal_classifier import AnimalClassifier
+
+    videos = list_videos(args.input)
+    if not videos:
+        print(f"在 {args.input} 中未找到视频文件")
+        exit(1)
+
+    print("正在加载模型...")
+    classifier = AnimalClassifier(args.model, class_names_path, img_size)
+    with open(args.output, 'w', newline='', encoding='utf-8-sig') as f:
+        writer = csv.DictWriter(f, fieldnames=['video', 'start_s', 'end_s', 'label', 'confidence', 'frames'])
+        writer.writeheader()
+        for video in videos:
+            try:
+                segments, stats = predict_video(classifier, video, mode=args.mode, sample_fps=args.sample_fps,
+                                                scene_threshold=args.scene_threshold)
+            except Exception as e:
+                print(f"视频处理失败 {video}: {e}")
+                continue
+            for segment in segments:
+                writer.writerow({'video': video, 'start_s': round(segment['start'], 2),
+                                 'end_s': round(segment['end'], 2), 'label': segment['label'],
+                                 'confidence': round(segment['confidence'], 4), 'frames': segment['frames']})
+            print(f"{video}: 时长 {stats['duration_s']:.1f}s, 解码 {stats['decoded_frames']} 帧, "
+                  f"推理 {stats['sampled_frames']} 帧, 用时 {stats['elapsed_s']:.1f}s "
+                  f"({stats['realtime_factor']:.1f}x 实时), {len(segments)} 个片段")
+            for segment in segments:
+                print(f"  {segment['start']:7.1f}s - {segment['end']:7.1f}s  {segment['label']}"
+                      f"  ({segment['confidence']:.2f})")
+    print(f"\n结果已保存至: {args.output}")
@@ -0,0 +1,327 @@
+import os
+import csv
+import json
+import time
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import argparse
+from datetime import datetime
+
+from image_sources import is_image_name
+from prediction_writer import prediction_row
+from progress_store import atomic_write_json
+
+# 配置参数
+model_path = './output/model/best_model.keras'  # 模型路径
+class_names_path = 'class.txt'  # 类别名称文件路径
+img_size = None  # 输入尺寸（None时使用模型自身的输入尺寸）
+image_dir = 'test'  # 监听的图片目录
+output_csv = 'predictions.csv'  # 结果追加写入的CSV
+index_path = 'watch_index.json'  # 已处理文件索引快照（路径 -> [mtime_ns, size]）
+batch_window = 0.5  # 第一张新图片到达后最多等待多久凑批(秒)
+batch_size = 16  # 单批最多图片数
+poll_interval = 2.0  # 轮询模式的扫描间隔(秒)
+settle_seconds = 1.0  # 轮询模式下文件最后修改后需要静置的时间，避免读到写了一半的文件
+
+# inotify常量（见<sys/inotify.h>）
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct('iIII')
+
+
+class InotifyWatcher:
+    """基于inotify（ctypes调用libc，不需要第三方库）的递归目录监听
+
+    只在文件写完关闭（IN_CLOSE_WRITE）或移入（IN_MOVED_TO）时报告，不会读到写了一半的文件；
+    新建的子目录会自动加入监听。事件队列溢出时返回None，由调用方做一次全量扫描。
+    """
+
+    needs_settle = False
+
+    def __init__(self, root):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1失败")
+        self.paths = {}  # watch描述符 -> 目录
+        for directory, _, _ in os.walk(root):
+            self._add(directory)
+
+    def _add(self, directory):
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            if err == errno.ENOSPC:
+                raise OSError(err, "inotify监听数量达到上限（fs.inotify.max_user_watches）")
+            return
+        self.paths[wd] = directory
+
+    def wait(self, timeout):
+        """等待文件事件，返回变化的文件路径列表；队列溢出时返回None"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return []
+        changed = []
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0').decode('utf-8', 'surrogateescape')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                return None
+            directory = self.paths.get(wd)
+            if directory is None or not name:
+                continue
+            path = os.path.join(directory, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    # 新目录：加入监听，并把监听建立之前已写入的文件一并报告
+                    for sub_dir, _, files in os.walk(path):
+                        self._add(sub_dir)
+                        changed.extend(os.path.join(sub_dir, f) for f in files)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                changed.append(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """轮询扫描（无inotify的平台或网络文件系统）：每次扫描都与已处理索引比较mtime/大小"""
+
+    needs_settle = True
+
+    def __init__(self, root, interval=poll_interval):
+        self.interval = interval
+        self.last_scan = time.monotonic()
+
+    def wait(self, timeout):
+        """到达扫描间隔时返回None（由调用方对照索引全量扫描），否则返回空列表"""
+        time.sleep(max(0.0, min(timeout, self.last_scan + self.interval - time.monotonic())))
+        if time.monotonic() - self.last_scan < self.interval:
+            return []
+        self.last_scan = time.monotonic()
+        return None
+
+    def close(self):
+        pass
+
+
+class WatchDaemon:
+    """监听目录，把新到达或内容变化的图片凑成小批识别，并把结果追加到CSV
+
+    已处理文件的(mtime, 大小)保存在索引中：先把结果写入CSV并落盘，再追加写索引日志，
+    重启后对照索引扫描一次，只处理新增或变化的文件。
+    """
+
+    def __init__(self, classifier, image_dir=image_dir, output_path=output_csv, index_path=index_path,
+                 use_inotify=True):
+        self.classifier = classifier
+        self.image_dir = image_dir
+        self.output_path = output_path
+        self.output_header = None  # 已确认与结果文件一致的表头
+        self.index_path = index_path
+        self.journal_path = index_path + '.journal'
+        self.index = self._load_index()
+        self.watcher = None
+        if use_inotify:
+            try:
+                self.watcher = InotifyWatcher(image_dir)
+            except (OSError, AttributeError) as e:
+                print(f"inotify不可用（{e}），改用轮询模式")
+        if self.watcher is None:
+            self.watcher = PollingWatcher(image_dir)
+        self.pending = {}  # 路径 -> 首次发现时间
+
+    # ---- 索引 ----
+
+    def _load_index(self):
+        index = {}
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            pass
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        path, mtime_ns, size = json.loads(line)
+                    except ValueError:
+                        break  # 崩溃时写了一半的最后一行
+                    index[path] = [mtime_ns, size]
+        return index
+
+    def compact_index(self):
+        """把日志合并进索引快照，并清理已删除的文件"""
+        self.index = {path: sig for path, sig in self.index.items() if os.path.exists(path)}
+        atomic_write_json(self.index_path, self.index)
+        open(self.journal_path, 'w').close()
+
+    @staticmethod
+    def signature(path):
+        stat = os.stat(path)
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def scan(self):
+        """全量扫描，返回与索引不一致（新增或变化）的图片路径"""
+        changed = []
+        stack = [self.image_dir]
+        while stack:
+            try:
+                entries = list(os.scandir(stack.pop()))
+            except OSError:
+                continue
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif is_image_name(entry.name):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    if self.index.get(entry.path) != [stat.st_mtime_ns, stat.st_size]:
+                        changed.append(entry.path)
+        return changed
+
+    # ---- 处理 ----
+
+    def _ready(self):
+        """取出已经可以处理的文件（轮询模式下需等文件静置settle_seconds）"""
+        ready = []
+        for path in sorted(self.pending, key=self.pending.get):
+            try:
+                sig = self.signature(path)
+            except OSError:
+                del self.pending[path]  # 已被删除或移走
+                continue
+            if self.index.get(path) == sig:
+                del self.pending[path]
+                continue
+            if self.watcher.needs_settle and time.time() - sig[0] / 1e9 < settle_seconds:
+                continue
+            ready.append((path, sig))
+            if len(ready) == batch_size:
+                break
+        return ready
+
+    def prepare_output(self, fieldnames):
+        """检查已有CSV的表头：与本次的列（top_k、概率列等配置变化后会不同）不一致时把旧文件改名保留，
+        重新开始一个文件，避免新行写到错误的表头下。返回是否需要写表头"""
+        if not os.path.exists(self.output_path) or os.path.getsize(self.output_path) == 0:
+            self.output_header = fieldnames
+            return True
+        if fieldnames is None or fieldnames == self.output_header:
+            return False
+        with open(self.output_path, 'r', newline='', encoding='utf-8-sig') as f:
+            existing = next(csv.reader(f), [])
+        if existing == fieldnames:
+            self.output_header = fieldnames
+            return False
+        base, ext = os.path.splitext(self.output_path)
+        rotated = f"{base}.{datetime.now().strftime('%Y%m%d-%H%M%S')}{ext}"
+        os.replace(self.output_path, rotated)
+        print(f"结果列已变化，旧结果文件已改名为: {rotated}")
+        self.output_header = fieldnames
+        return True
+
+    def process(self, batch):
+        """识别一批文件：结果先写入CSV并fsync，再写索引日志"""
+        rows = []
+        for path, prediction in self.classifier.iter_predictions([p for p, _ in batch], batch_size):
+            if 'error' in prediction:
+                print(f"图片处理失败 {path}: {prediction['error']}")
+            else:
+                rows.append(dict(prediction_row(path, prediction), processed_at=datetime.now().isoformat()))
+        fieldnames = list(rows[0]) if rows else None
+        new_file = self.prepare_output(fieldnames)
+        with open(self.output_path, 'a', newline='', encoding='utf-8-sig' if new_file else 'utf-8') as f:
+            if rows:
+                writer = csv.DictWriter(f, fieldnames=fieldnames)
+                if new_file:
+                    writer.writeheader()
+                writer.writerows(rows)
+            f.flush()
+            os.fsync(f.fileno())
+        # 解码失败的文件同样记入索引，文件内容变化前不再重试
+        with open(self.journal_path, 'a', encoding='utf-8') as journal:
+            for path, sig in batch:
+                self.index[path] = sig
+                journal.write(json.dumps([path] + sig, ensure_ascii=False) + '\n')
+            journal.flush()
+            os.fsync(journal.fileno())
+        for path, _ in batch:
+            self.pending.pop(path, None)
+        return len(rows)
+
+    def run(self):
+        self.compact_index()
+        now = time.monotonic()
+        for path in self.scan():
+            self.pending[path] = now
+        if self.pending:
+            print(f"启动时发现 {len(self.pending)} 张未处理的图片")
+        print(f"正在监听 {self.image_dir}（{'inotify' if isinstance(self.watcher, InotifyWatcher) else '轮询'}模式）")
+
+        try:
+            while True:
+                if self.pending:
+                    # 等到最早的图片满batch_window；有未静置的文件时也至少间隔一小段时间，避免空转
+                    timeout = max(0.05, min(self.pending.values()) + batch_window - time.monotonic())
+                else:
+                    timeout = poll_interval
+                changed = self.watcher.wait(timeout)
+                if changed is None:
+                    changed = self.scan()
+                now = time.monotonic()
+                for path in changed:
+                    if is_image_name(path):
+                        self.pending.setdefault(path, now)
+
+                # 凑满一批或最早的图片等待超过batch_window时处理
+                while self.pending and (len(self.pending) >= batch_size or
+                                        now - min(self.pending.values()) >= batch_window):
+                    batch = self._ready()
+                    if not batch:
+                        break
+                    started = time.perf_counter()
+                    count = self.process(batch)
+                    print(f"{datetime.now():%H:%M:%S} 识别 {count}/{len(batch)} 张新图片，"
+                          f"用时 {time.perf_counter() - started:.2f}s")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.watcher.close()
+            self.compact_index()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="监听目录，增量识别新到达的图片")
+    parser.add_argument('image_dir', nargs='?', default=image_dir, help="监听的图片目录")
+    parser.add_argument('--model', default=model_path, help="模型路径")
+    parser.add_argument('--output', default=output_csv, help="结果追加写入的CSV")
+    parser.add_argument('--index', default=index_path, help="已处理文件索引路径")
+    parser.add_argument('--poll', action='store_true', help="强制使用轮询模式（例如网络文件系统）")
+    args = parser.parse_args()
+
+    os.environ["CUDA_VISIBLE_DEVICES"] = "-1"
+    from animal_classifier import AnimalClassifier
+
+    print("正在加载模型...")
+    classifier = AnimalClassifier(args.model, class_names_path, img_size)
+    WatchDaemon(classifier, args.image_dir, args.output, args.index, use_inotify=not args.poll).run()
@@ -0,0 +1,182 @@
+import os
+import json
+import hashlib
+import threading
+from PIL import Image, ImageOps, ImageFilter, ImageDraw
+
+# 配置参数
+icons_dir = 'zoo_icons'  # 原始图标目录
+cache_dir = 'cache/zoo_icons'  # 预处理图标缓存目录
+icon_size = 230  # 图鉴中图标的显示尺寸（与create_zoo_tab一致）
+corner_radius = 10  # 圆角半径
+
+
+def add_rounded_corners(img, radius):
+    """为图片添加圆角效果（与demo.py中的实现保持一致）"""
+    mask = Image.new('L', img.size, 0)
+    draw = ImageDraw.Draw(mask)
+    draw.rounded_rectangle([(0, 0), img.size], radius, fill=255)
+
+    result = img.copy()
+    result.putalpha(mask)
+
+    if img.mode in ('RGBA', 'LA'):
+        background = Image.new(img.mode[:-1], img.size, (240, 240, 240))
+        background.putalpha(mask)
+        result = Image.alpha_composite(background, result)
+
+    return result
+
+
+def make_locked_variant(img):
+    """生成未解锁动物的灰色轮廓效果"""
+    img = img.convert("L")
+    img = ImageOps.autocontrast(img, cutoff=5)
+    img = img.filter(ImageFilter.FIND_EDGES)
+    img = ImageOps.invert(img)
+    background = Image.new('RGB', img.size, (200, 200, 200))
+    return Image.composite(Image.new('RGB', img.size, (100, 100, 100)), background, img)
+
+
+def file_sha1(path):
+    """计算文件内容的SHA1，用于判断图标内容是否真的发生变化"""
+    h = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ZooIconCache:
+    """动物园图标缓存
+
+    磁盘上保存已解锁/未解锁两种变体（已缩放到显示尺寸并加好圆角），
+    通过源文件的mtime/大小/内容哈希判断是否失效；进程内再缓存PhotoImage对象，
+    重复进入图鉴时不再做任何图像处理。
+    """
+
+    def __init__(self, icons_dir=icons_dir, cache_dir=cache_dir, size=icon_size, radius=corner_radius):
+        self.icons_dir = icons_dir
+        self.cache_dir = cache_dir
+        self.size = size
+        self.radius = radius
+        self.manifest_path = os.path.join(cache_dir, 'manifest.json')
+        self.manifest = self._load_manifest()
+        self.photos = {}  # (animal, is_unlocked) -> (签名, PhotoImage)
+        self.lock = threading.Lock()
+
+    def _load_manifest(self):
+        try:
+            with open(self.manifest_path, 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            # 显示尺寸或圆角变化后，旧缓存全部作废
+            if manifest.get('size') == self.size and manifest.get('radius') == self.radius:
+                return manifest
+        except (OSError, ValueError):
+            pass
+        return {'size': self.size, 'radius': self.radius, 'icons': {}}
+
+    def _save_manifest(self):
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.manifest, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def source_path(self, animal):
+        return os.path.join(self.icons_dir, f"{animal}_zoo.png")
+
+    def variant_path(self, animal, is_unlocked):
+        suffix = 'unlocked' if is_unlocked else 'locked'
+        return os.path.join(self.cache_dir, f"{animal}_{suffix}.png")
+
+    def _signature(self, animal):
+        """返回源图标的(mtime_ns, 大小)，源文件不存在时返回None"""
+        try:
+            st = os.stat(self.source_path(animal))
+        except OSError:
+            return None
+        return [st.st_mtime_ns, st.st_size]
+
+    def _build(self, animal):
+        """生成两种变体并写入磁盘"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with Image.open(self.source_path(animal)) as src:
+            src.load()
+            variants = {True: src.convert("RGB"), False: make_locked_variant(src)}
+        for is_unlocked, img in variants.items():
+            img.thumbnail((self.size, self.size))
+            img = add_rounded_corners(img, self.radius)
+            out_path = self.variant_path(animal, is_unlocked)
+            tmp_path = out_path + '.tmp.png'
+            img.save(tmp_path)
+            os.replace(tmp_path, out_path)
+
+    def ensure(self, animal, save_manifest=True):
+        """确保某个动物的缓存变体是最新的，返回签名；源图标不存在时返回None"""
+        signature = self._signature(animal)
+        if signature is None:
+            return None
+        with self.lock:
+            entry = self.manifest['icons'].get(animal)
+            cached = (entry is not None
+                      and os.path.exists(self.variant_path(animal, True))
+                      and os.path.exists(self.variant_path(animal, False)))
+            if cached and entry['stat'] == signature:
+                return signature
+            # mtime变了但内容没变（例如重新拷贝），只更新签名而不重建
+            digest = file_sha1(self.source_path(animal))
+            if not cached or entry['sha1'] != digest:
+                self._build(animal)
+            self.manifest['icons'][animal] = {'stat': signature, 'sha1': digest}
+            if save_manifest:
+                self._save_manifest()
+        return signature
+
+    def build_all(self, animals=None):
+        """预先生成所有图标的缓存变体，返回处理的图标数量"""
+        if animals is None:
+            animals = sorted(f[:-len('_zoo.png')] for f in os.listdir(self.icons_dir)
+                             if f.endswith('_zoo.png'))
+        count = 0
+        for animal in animals:
+            if self.ensure(animal, save_manifest=False) is not None:
+                count += 1
+        with self.lock:
+            self._save_manifest()
+        return count
+
+    def get_image(self, animal, is_unlocked):
+        """返回已处理好的PIL图片，源图标不存在时返回None"""
+        if self.ensure(animal) is None:
+            return None
+        with Image.open(self.variant_path(animal, is_unlocked)) as img:
+            img.load()
+            return img
+
+    def get_photo(self, animal, is_unlocked):
+        """返回可直接显示的PhotoImage（必须在Tk主线程中调用）"""
+        from PIL import ImageTk
+
+        key = (animal, is_unlocked)
+        signature = self._signature(animal)
+        if signature is None:
+            return None
+        cached = self.photos.get(key)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        img = self.get_image(animal, is_unlocked)
+        if img is None:
+            return None
+        photo = ImageTk.PhotoImage(img)
+        self.photos[key] = (signature, photo)
+        return photo
+
+
+if __name__ == "__main__":
+    # 图标预处理：提前生成所有图鉴图标的缓存变体
+    cache = ZooIconCache()
+    print(f"正在预处理图标: {icons_dir} -> {cache_dir}")
+    count = cache.build_all()
+    print(f"完成！共处理 {count} 个图标")